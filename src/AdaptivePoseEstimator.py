@@ -0,0 +1,129 @@
+import time
+
+import cv2
+import numpy as np
+
+class AdaptivePoseEstimator:
+    def __init__(self, poseEstimator, targetFPS = None, padding = 0.25, minROISize = 0.2, minScale = 0.35,
+                 visibilityThreshold = 0.5):
+        self.poseEstimator = poseEstimator
+        self.targetFPS = targetFPS
+        self.padding = padding
+        self.minROISize = minROISize
+        self.minScale = minScale
+        self.visibilityThreshold = visibilityThreshold
+
+        self.detectionConfidence = poseEstimator.detectionConfidence
+        self.trackingConfidence = poseEstimator.trackingConfidence
+        self.modelComplexity = poseEstimator.modelComplexity
+
+        self.roi = None
+        self.scale = 1.0
+        self.frameTime = None
+        self.regionBuffer = None
+
+        ## What the last processed frame actually used, (x0, y0, x1, y1) in full-frame pixels or None for the full frame
+        self.lastROI = None
+        self.lastScale = 1.0
+        self.redetectCount = 0
+
+    def open(self):
+        self.poseEstimator.open()
+        return self
+
+    def close(self):
+        self.poseEstimator.close()
+
+    def process(self, image):
+        startTime = time.perf_counter()
+        roi = self.roi
+        landmarks = self.processRegion(image, roi)
+
+        ## Tracking is lost once the crop no longer contains the lifter, the same frame is re-detected in full
+        if landmarks is None and roi is not None:
+            self.redetectCount += 1
+            roi = None
+            landmarks = self.processRegion(image, roi)
+
+        self.lastROI, self.lastScale = roi, self.scale
+        self.roi = None if landmarks is None else self.nextROI(landmarks, image.shape[1], image.shape[0], roi)
+        self.adaptScale(time.perf_counter() - startTime)
+
+        return landmarks
+
+    def processRegion(self, image, roi):
+        height, width = image.shape[:2]
+        x0, y0, x1, y1 = roi if roi is not None else (0, 0, width, height)
+        region = image[y0:y1, x0:x1]
+
+        ## The estimator is done with the region before the next frame comes in, so one buffer is reused for as long
+        ## as the crop size holds
+        if self.scale < 1.0:
+            size = (max(1, round((x1 - x0) * self.scale)), max(1, round((y1 - y0) * self.scale)))
+            region = cv2.resize(region, size, dst = self.scratch((size[1], size[0]) + image.shape[2:], image.dtype),
+                                interpolation = cv2.INTER_AREA)
+        elif roi is not None:
+            buffer = self.scratch(region.shape, region.dtype)
+            np.copyto(buffer, region)
+            region = buffer
+
+        landmarks = self.poseEstimator.process(region)
+
+        if landmarks is None or roi is None:
+            return landmarks
+
+        ## Landmarks come back normalized to the crop, they are mapped back onto the full frame
+        landmarks[:, 0] = (landmarks[:, 0] * (x1 - x0) + x0) / width
+        landmarks[:, 1] = (landmarks[:, 1] * (y1 - y0) + y0) / height
+        landmarks[:, 2] *= (x1 - x0) / width
+        return landmarks
+
+    def scratch(self, shape, dtype):
+        if self.regionBuffer is None or self.regionBuffer.shape != shape or self.regionBuffer.dtype != dtype:
+            self.regionBuffer = np.empty(shape, dtype = dtype)
+        return self.regionBuffer
+
+    def nextROI(self, landmarks, width, height, roi):
+        visible = landmarks[:, 3] >= self.visibilityThreshold
+        points = landmarks[visible, :2] if visible.sum() >= 4 else landmarks[:, :2]
+
+        (left, top), (right, bottom) = points.min(axis = 0), points.max(axis = 0)
+        padX = max((right - left) * self.padding, (self.minROISize - (right - left)) / 2)
+        padY = max((bottom - top) * self.padding, (self.minROISize - (bottom - top)) / 2)
+
+        box = (max(0, int((left - padX) * width)), max(0, int((top - padY) * height)),
+               min(width, int(np.ceil((right + padX) * width))), min(height, int(np.ceil((bottom + padY) * height))))
+
+        if box[2] - box[0] < 2 or box[3] - box[1] < 2:
+            return None
+
+        area = (box[2] - box[0]) * (box[3] - box[1])
+
+        if area >= 0.9 * width * height:
+            return None
+
+        ## A crop that still holds the lifter with some slack is kept, moving it every frame would upset the
+        ## estimator's own frame-to-frame tracking
+        if roi is not None and roi[0] <= box[0] and roi[1] <= box[1] and roi[2] >= box[2] and roi[3] >= box[3] \
+                and (roi[2] - roi[0]) * (roi[3] - roi[1]) <= 2 * area:
+            return roi
+
+        return box
+
+    def adaptScale(self, elapsed):
+        if not self.targetFPS:
+            return
+
+        self.frameTime = elapsed if self.frameTime is None else 0.8 * self.frameTime + 0.2 * elapsed
+        budget = 1.0 / self.targetFPS
+
+        if self.frameTime > budget:
+            self.scale = max(self.minScale, self.scale * 0.9)
+        elif self.frameTime < 0.75 * budget:
+            self.scale = min(1.0, self.scale * 1.05)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *args):
+        self.close()
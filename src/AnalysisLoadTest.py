@@ -0,0 +1,159 @@
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from AnalysisServer import AnalysisServer, AnalysisSession, WebSocket, WebSocketClosed
+from ModelRegistry import exercises, readSessions
+
+async def connect(host, port, path):
+    reader, writer = await asyncio.open_connection(host, port)
+    key = base64.b64encode(os.urandom(16)).decode()
+
+    writer.write((f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+    await writer.drain()
+
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1')
+    if ' 101 ' not in head.split('\r\n')[0] or WebSocket.acceptKey(key) not in head:
+        raise ConnectionError(f'websocket handshake failed: {head.splitlines()[0]}')
+
+    return WebSocket(reader, writer, isClient = True)
+
+class LoadTestClient:
+    def __init__(self, name, exerciseKey, landmarks, rate, rowsPerMessage, jpeg = None):
+        self.name = name
+        self.exerciseKey = exerciseKey
+        self.landmarks = landmarks
+        self.rate = rate
+        self.rowsPerMessage = rowsPerMessage
+        self.jpeg = jpeg
+
+        self.sentTimes = {}
+        self.latencies = []
+        self.serverTimes = []
+        self.sentFrames = 0
+        self.repCount = 0
+        self.phaseChanges = 0
+        self.errors = 0
+
+    def nextMessage(self):
+        if self.jpeg is not None:
+            return bytes([AnalysisSession.jpegMessage]) + self.jpeg, 1
+
+        start = self.sentFrames % len(self.landmarks)
+        rows = np.take(self.landmarks, range(start, start + self.rowsPerMessage), axis = 0, mode = 'wrap')
+        return bytes([AnalysisSession.landmarkMessage]) + rows.tobytes(), self.rowsPerMessage
+
+    async def receiveEvents(self, webSocket):
+        while True:
+            event = json.loads(await webSocket.receive())
+
+            if event['type'] == 'ack':
+                sentTime = self.sentTimes.pop(event['frame'], None)
+                if sentTime is not None:
+                    self.latencies.append(time.perf_counter() - sentTime)
+                self.serverTimes.append(event['serverMs'])
+            elif event['type'] == 'rep':
+                self.repCount = event['repCount']
+            elif event['type'] == 'phase':
+                self.phaseChanges += 1
+            elif event['type'] == 'error':
+                self.errors += 1
+
+    async def run(self, host, port, duration):
+        webSocket = await connect(host, port, f'/ws?exercise={self.exerciseKey}')
+        session = json.loads(await webSocket.receive())
+        receiver = asyncio.get_running_loop().create_task(self.receiveEvents(webSocket))
+
+        interval = self.rowsPerMessage / self.rate if self.rate else 0.0
+        startTime = time.perf_counter()
+        nextSendTime = startTime
+
+        try:
+            while time.perf_counter() - startTime < duration:
+                if interval:
+                    await asyncio.sleep(max(0.0, nextSendTime - time.perf_counter()))
+                    nextSendTime += interval
+
+                message, frames = self.nextMessage()
+                self.sentFrames += frames
+                self.sentTimes[self.sentFrames] = time.perf_counter()
+
+                ## send() waits on the socket, so when the server pushes back this client slows down with it
+                await webSocket.send(message)
+
+            ## Give the last acks a moment to arrive before hanging up
+            deadline = time.perf_counter() + 2.0
+            while self.sentTimes and time.perf_counter() < deadline:
+                await asyncio.sleep(0.01)
+        except WebSocketClosed:
+            self.errors += 1
+        finally:
+            await webSocket.close()
+            receiver.cancel()
+            await asyncio.gather(receiver, return_exceptions = True)
+
+        return session['session']
+
+async def loadTest(clients = 8, duration = 10.0, rate = 30.0, rowsPerMessage = 1, jpegClients = 0, host = '127.0.0.1',
+                   port = None):
+    server = None
+
+    ## Without a port the server runs in this same event loop on a free localhost port
+    if port is None:
+        server = await AnalysisServer(host, 0).start()
+        port = server.port
+
+    keys = list(exercises)
+    landmarks = {key: readSessions(exercises[key]['data']).drop('label', axis = 1).to_numpy(dtype = np.float32)
+                 for key in keys}
+
+    jpeg = None
+    if jpegClients:
+        import cv2
+        jpeg = cv2.imencode('.jpg', np.random.default_rng(0).integers(0, 255, (480, 640, 3), dtype = np.uint8))[1].tobytes()
+
+    loadClients = [LoadTestClient(f'client{i}', keys[i % len(keys)], landmarks[keys[i % len(keys)]], rate,
+                                  rowsPerMessage, jpeg if i < jpegClients else None) for i in range(clients)]
+
+    startTime = time.perf_counter()
+    await asyncio.gather(*(client.run(host, port, duration) for client in loadClients))
+    elapsed = time.perf_counter() - startTime
+
+    if server is not None:
+        await server.stop()
+
+    latencies = np.array([latency for client in loadClients for latency in client.latencies]) * 1000
+    serverTimes = np.array([serverTime for client in loadClients for serverTime in client.serverTimes])
+    sentFrames = sum(client.sentFrames for client in loadClients)
+
+    return {
+        'clients': clients,
+        'elapsedSeconds': elapsed,
+        'sentFrames': sentFrames,
+        'framesPerSec': sentFrames / elapsed,
+        'acks': len(latencies),
+        'latencyP50Ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+        'latencyP95Ms': float(np.percentile(latencies, 95)) if len(latencies) else None,
+        'serverP95Ms': float(np.percentile(serverTimes, 95)) if len(serverTimes) else None,
+        'errors': sum(client.errors for client in loadClients),
+        'reps': {client.name: client.repCount for client in loadClients},
+    }
+
+def main(argv):
+    def option(name, default):
+        return argv[argv.index(name) + 1] if name in argv else default
+
+    port = option('--port', None)
+    report = asyncio.run(loadTest(int(option('--clients', 8)), float(option('--seconds', 10)), float(option('--rate', 30)),
+                                  int(option('--rows', 1)), int(option('--jpeg-clients', 0)),
+                                  option('--host', '127.0.0.1'), int(port) if port else None))
+    print(json.dumps(report, indent = 1))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,487 @@
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from ModelRegistry import ModelRegistry, exercises
+from RepCounter import RepCounter
+
+class WebSocketClosed(Exception):
+    pass
+
+class WebSocket:
+    guid = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+    def __init__(self, reader, writer, isClient = False, maxMessageSize = 8 * 1024 * 1024):
+        self.reader = reader
+        self.writer = writer
+        self.isClient = isClient
+        self.maxMessageSize = maxMessageSize
+        self.isClosed = False
+        self.sendLock = asyncio.Lock()
+
+    @classmethod
+    def acceptKey(cls, key):
+        return base64.b64encode(hashlib.sha1(key.encode() + cls.guid).digest()).decode()
+
+    @staticmethod
+    def applyMask(payload, mask):
+        length = len(payload)
+        if not length:
+            return payload
+        keystream = (mask * (length // 4 + 1))[:length]
+        return (int.from_bytes(payload, 'little') ^ int.from_bytes(keystream, 'little')).to_bytes(length, 'little')
+
+    async def readFrame(self):
+        head = await self.reader.readexactly(2)
+        isFinal, opcode = bool(head[0] & 0x80), head[0] & 0x0F
+        isMasked, length = bool(head[1] & 0x80), head[1] & 0x7F
+
+        if length == 126:
+            length = struct.unpack('>H', await self.reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack('>Q', await self.reader.readexactly(8))[0]
+
+        if length > self.maxMessageSize:
+            await self.close(1009)
+            raise WebSocketClosed('message too large')
+
+        mask = await self.reader.readexactly(4) if isMasked else None
+        payload = await self.reader.readexactly(length)
+
+        return isFinal, opcode, self.applyMask(payload, mask) if mask else payload
+
+    async def receive(self):
+        message, messageOpcode = bytearray(), None
+
+        try:
+            while True:
+                isFinal, opcode, payload = await self.readFrame()
+
+                if opcode == 0x8:
+                    await self.close()
+                    raise WebSocketClosed('closed by peer')
+                if opcode == 0x9:
+                    await self.sendFrame(0xA, payload)
+                    continue
+                if opcode == 0xA:
+                    continue
+
+                if opcode in (0x1, 0x2):
+                    message, messageOpcode = bytearray(payload), opcode
+                else:
+                    message += payload
+
+                if len(message) > self.maxMessageSize:
+                    await self.close(1009)
+                    raise WebSocketClosed('message too large')
+
+                if isFinal:
+                    return message.decode() if messageOpcode == 0x1 else bytes(message)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            self.isClosed = True
+            raise WebSocketClosed(str(e))
+
+    async def sendFrame(self, opcode, payload):
+        header = bytearray([0x80 | opcode])
+        maskBit = 0x80 if self.isClient else 0
+
+        if len(payload) < 126:
+            header.append(maskBit | len(payload))
+        elif len(payload) < 65536:
+            header += bytes([maskBit | 126]) + struct.pack('>H', len(payload))
+        else:
+            header += bytes([maskBit | 127]) + struct.pack('>Q', len(payload))
+
+        ## Clients must mask what they send, servers must not
+        if self.isClient:
+            mask = np.random.bytes(4)
+            header += mask
+            payload = self.applyMask(payload, mask)
+
+        async with self.sendLock:
+            self.writer.write(bytes(header) + payload)
+            await self.writer.drain()
+
+    async def send(self, message):
+        if self.isClosed:
+            raise WebSocketClosed('already closed')
+
+        try:
+            if isinstance(message, str):
+                await self.sendFrame(0x1, message.encode())
+            else:
+                await self.sendFrame(0x2, bytes(message))
+        except ConnectionError as e:
+            self.isClosed = True
+            raise WebSocketClosed(str(e))
+
+    async def close(self, code = 1000):
+        if self.isClosed:
+            return
+
+        self.isClosed = True
+
+        try:
+            await self.sendFrame(0x8, struct.pack('>H', code))
+        except ConnectionError:
+            pass
+
+class AnalysisSession:
+    ## Binary messages start with one of these bytes, landmark rows are float32 with 132 values per row
+    landmarkMessage, jpegMessage = 0x01, 0x02
+
+    def __init__(self, sessionId, exerciseKey, model, queueSize):
+        self.sessionId = sessionId
+        self.exerciseKey = exerciseKey
+        self.model = model
+        self.repCounter = RepCounter()
+        self.queue = asyncio.Queue(queueSize)
+        self.lock = asyncio.Lock()
+        self.poseEstimator = None
+        self.frameIndex = 0
+        self.noPoseCount = 0
+        self.lastActive = time.monotonic()
+
+    def detect(self, jpeg):
+        import cv2
+
+        from PoseEstimator import PoseEstimator
+
+        if self.poseEstimator is None:
+            self.poseEstimator = PoseEstimator().open()
+
+        frame = cv2.imdecode(np.frombuffer(jpeg, dtype = np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            return None
+
+        landmarks = self.poseEstimator.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        return None if landmarks is None else landmarks.reshape(1, -1)
+
+    def classify(self, landmarks):
+        events = []
+        self.lastActive = time.monotonic()
+
+        if landmarks is None:
+            events.append({'type': 'noPose', 'frame': self.frameIndex})
+            self.frameIndex += 1
+            self.noPoseCount += 1
+            return events
+
+        ## All rows of one message are classified in a single vectorized call, the rep logic then steps through them
+        classes, probabilities = self.model.predict_with_proba(landmarks)
+
+        for movementPhaseClass, movementPhaseProbability in zip(classes, probabilities):
+            movementPhase = self.repCounter.movementPhase
+            self.repCounter.update(movementPhaseClass, movementPhaseProbability, self.frameIndex)
+
+            if self.repCounter.movementPhase != movementPhase:
+                events.append({'type': 'phase', 'frame': self.frameIndex, 'phase': self.repCounter.movementPhase})
+
+            if self.repCounter.completedRep is not None:
+                repCount, startFrame, endFrame = self.repCounter.completedRep
+                events.append({'type': 'rep', 'repCount': repCount, 'startFrame': startFrame, 'endFrame': endFrame})
+
+            self.frameIndex += 1
+
+        return events
+
+    def close(self):
+        if self.poseEstimator is not None:
+            self.poseEstimator.close()
+            self.poseEstimator = None
+
+    def state(self):
+        return {'session': self.sessionId, 'exercise': self.exerciseKey, 'frames': self.frameIndex,
+                'noPoseFrames': self.noPoseCount, 'movementPhase': self.repCounter.movementPhase,
+                'repCount': self.repCounter.repCount, 'queued': self.queue.qsize()}
+
+def parseObject(body):
+    ## A body that isn't a JSON object is the client's mistake and gets a 400, not a dropped connection
+    request = json.loads(body)
+    if not isinstance(request, dict):
+        raise ValueError(f'expected a JSON object, got {type(request).__name__}')
+    return request
+
+def parseLandmarks(message):
+    if isinstance(message, str):
+        landmarks = parseObject(message).get('landmarks')
+        return None if landmarks is None else np.asarray(landmarks, dtype = np.float32).reshape(-1, 33 * 4)
+    return np.frombuffer(message, dtype = np.float32).reshape(-1, 33 * 4)
+
+class AnalysisServer:
+    def __init__(self, host = '127.0.0.1', port = 8765, modelRegistry = None, models = exercises, maxSessions = 64,
+                 queueSize = 8, poseWorkers = 2, idleTimeout = 300):
+        self.host = host
+        self.port = port
+        self.models = models
+        self.modelRegistry = modelRegistry if modelRegistry is not None else ModelRegistry(len(models), models)
+        self.maxSessions = maxSessions
+        self.queueSize = queueSize
+        self.idleTimeout = idleTimeout
+
+        ## Pose estimation is the only heavy step, it runs on a small shared pool so one busy client can't starve others
+        self.poseExecutor = ThreadPoolExecutor(poseWorkers, thread_name_prefix = 'pose')
+        self.sessions = {}
+        self.sessionIds = itertools.count(1)
+        self.server = None
+        self.expiryTask = None
+        self.startTime = time.monotonic()
+        self.processedCount = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handleConnection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.expiryTask = asyncio.get_running_loop().create_task(self.expireSessions())
+        return self
+
+    async def serveForever(self):
+        if self.server is None:
+            await self.start()
+        print(f"Analysis server listening on http://{self.host}:{self.port}", flush = True)
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def stop(self):
+        if self.expiryTask is not None:
+            self.expiryTask.cancel()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for session in list(self.sessions.values()):
+            self.closeSession(session)
+        self.poseExecutor.shutdown(wait = False)
+
+    async def openSession(self, exerciseKey):
+        if exerciseKey not in self.models:
+            raise KeyError(exerciseKey)
+        if len(self.sessions) >= self.maxSessions:
+            raise OverflowError('too many sessions')
+
+        ## Models come from the shared registry, every session on the same exercise uses the same loaded model
+        model = await asyncio.get_running_loop().run_in_executor(None, self.modelRegistry.get, exerciseKey)
+        session = AnalysisSession(str(next(self.sessionIds)), exerciseKey, model, self.queueSize)
+        self.sessions[session.sessionId] = session
+        return session
+
+    def closeSession(self, session):
+        self.sessions.pop(session.sessionId, None)
+        session.close()
+
+    async def expireSessions(self):
+        while True:
+            await asyncio.sleep(min(30, self.idleTimeout))
+            now = time.monotonic()
+            for session in list(self.sessions.values()):
+                if now - session.lastActive > self.idleTimeout and not session.lock.locked():
+                    self.closeSession(session)
+
+    async def process(self, session, kind, payload):
+        async with session.lock:
+            if kind == AnalysisSession.jpegMessage:
+                landmarks = await asyncio.get_running_loop().run_in_executor(self.poseExecutor, session.detect, payload)
+            else:
+                landmarks = payload
+
+            events = session.classify(landmarks)
+            self.processedCount += 1 if landmarks is None else len(landmarks)
+            return events
+
+    async def handleConnection(self, reader, writer):
+        try:
+            while True:
+                request = await self.readRequest(reader)
+                if request is None:
+                    break
+
+                method, path, query, headers, body = request
+
+                if headers.get('upgrade', '').lower() == 'websocket':
+                    await self.handleWebSocket(reader, writer, query, headers)
+                    break
+
+                status, response = await self.route(method, path, body)
+                self.writeResponse(writer, status, response, headers.get('connection', '').lower() != 'close')
+                await writer.drain()
+
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def readRequest(self, reader):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError:
+            return None
+
+        lines = head.decode('latin-1').split('\r\n')
+        method, target, _ = lines[0].split(' ', 2)
+        headers = {}
+
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length', 0))
+        body = await reader.readexactly(length) if length else b''
+        url = urlsplit(target)
+
+        return method.upper(), url.path, {k: v[-1] for k, v in parse_qs(url.query).items()}, headers, body
+
+    def writeResponse(self, writer, status, response, isKeepAlive = True):
+        reasons = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                   503: 'Service Unavailable'}
+        body = json.dumps(response).encode()
+        writer.write(f"HTTP/1.1 {status} {reasons.get(status, '')}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if isKeepAlive else 'close'}\r\n\r\n"
+                     .encode() + body)
+
+    async def route(self, method, path, body):
+        parts = [part for part in path.split('/') if part]
+
+        if parts == ['health'] and method == 'GET':
+            return 200, self.health()
+        if parts == ['exercises'] and method == 'GET':
+            return 200, {'exercises': list(self.models)}
+
+        if parts == ['sessions'] and method == 'POST':
+            try:
+                request = parseObject(body or b'{}')
+            except ValueError as e:
+                return 400, {'error': f'malformed JSON body: {e}'}
+
+            try:
+                session = await self.openSession(request.get('exercise'))
+            except KeyError:
+                return 400, {'error': f"unknown exercise, expected one of {list(self.models)}"}
+            except OverflowError as e:
+                return 503, {'error': str(e)}
+            return 201, session.state()
+
+        if len(parts) >= 2 and parts[0] == 'sessions':
+            session = self.sessions.get(parts[1])
+            if session is None:
+                return 404, {'error': 'unknown session'}
+
+            if len(parts) == 2 and method == 'GET':
+                return 200, session.state()
+            if len(parts) == 2 and method == 'DELETE':
+                self.closeSession(session)
+                return 200, session.state()
+            if len(parts) == 3 and parts[2] == 'landmarks' and method == 'POST':
+                try:
+                    landmarks = parseLandmarks(body.decode() if body[:1] == b'{' else body)
+                except ValueError as e:
+                    return 400, {'error': str(e)}
+
+                ## The state is read after processing so it already counts the frames this request sent
+                events = await self.process(session, AnalysisSession.landmarkMessage, landmarks)
+                return 200, dict(session.state(), events = events)
+            if len(parts) == 3 and parts[2] == 'frames' and method == 'POST':
+                events = await self.process(session, AnalysisSession.jpegMessage, body)
+                return 200, dict(session.state(), events = events)
+            return 405, {'error': 'method not allowed'}
+
+        return 404, {'error': 'not found'}
+
+    def health(self):
+        return {'uptimeSeconds': time.monotonic() - self.startTime, 'sessions': len(self.sessions),
+                'processedFrames': self.processedCount, 'loadedModels': list(self.modelRegistry.cache)}
+
+    async def handleWebSocket(self, reader, writer, query, headers):
+        writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                      f"Sec-WebSocket-Accept: {WebSocket.acceptKey(headers.get('sec-websocket-key', ''))}\r\n\r\n")
+                     .encode())
+        await writer.drain()
+
+        webSocket = WebSocket(reader, writer)
+
+        session = self.sessions.get(query.get('session'))
+        isOwnSession = session is None
+
+        try:
+            if isOwnSession:
+                session = await self.openSession(query.get('exercise'))
+        except (KeyError, OverflowError) as e:
+            await webSocket.send(json.dumps({'type': 'error', 'error': str(e)}))
+            await webSocket.close(1008)
+            return
+
+        await webSocket.send(json.dumps(dict(session.state(), type = 'session')))
+        worker = asyncio.get_running_loop().create_task(self.sessionWorker(session, webSocket))
+
+        try:
+            while True:
+                message = await webSocket.receive()
+
+                try:
+                    if isinstance(message, bytes) and message[:1] == bytes([AnalysisSession.jpegMessage]):
+                        item = (AnalysisSession.jpegMessage, message[1:], time.perf_counter())
+                    elif isinstance(message, bytes):
+                        item = (AnalysisSession.landmarkMessage, parseLandmarks(message[1:]), time.perf_counter())
+                    else:
+                        item = (AnalysisSession.landmarkMessage, parseLandmarks(message), time.perf_counter())
+                except ValueError as e:
+                    await webSocket.send(json.dumps({'type': 'error', 'error': str(e)}))
+                    continue
+
+                ## A full queue suspends this reader, so a client sending faster than it can be served is slowed
+                ## down by TCP flow control instead of growing memory on the server
+                await session.queue.put(item)
+        except WebSocketClosed:
+            pass
+        finally:
+            ## Nobody is left to receive the results of whatever is still queued
+            worker.cancel()
+            await asyncio.gather(worker, return_exceptions = True)
+            if isOwnSession:
+                self.closeSession(session)
+            await webSocket.close()
+
+    async def sessionWorker(self, session, webSocket):
+        while True:
+            item = await session.queue.get()
+            if item is None:
+                return
+
+            kind, payload, receivedTime = item
+
+            try:
+                events = await self.process(session, kind, payload)
+            except Exception as e:
+                events = [{'type': 'error', 'error': str(e)}]
+
+            try:
+                for event in events:
+                    await webSocket.send(json.dumps(event))
+                await webSocket.send(json.dumps({'type': 'ack', 'frame': session.frameIndex,
+                                                 'serverMs': (time.perf_counter() - receivedTime) * 1000}))
+            except WebSocketClosed:
+                return
+
+def main(argv):
+    def option(name, default):
+        return argv[argv.index(name) + 1] if name in argv else default
+
+    server = AnalysisServer(option('--host', '127.0.0.1'), int(option('--port', 8765)),
+                            poseWorkers = int(option('--pose-workers', 2)))
+
+    try:
+        asyncio.run(server.serveForever())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
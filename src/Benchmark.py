@@ -0,0 +1,331 @@
+import json
+import os
+import pickle
+import platform
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from ExercisePipeline import ExercisePipeline
+from FrameBufferPool import FrameBufferPool
+from ModelRegistry import ModelRegistry, exercises, readSessions
+from MotionGate import MotionGate
+from RepCounter import RepCounter
+
+class ReplayPoseEstimator:
+    def __init__(self, dataPath, noPoseEvery = 0):
+        self.landmarks = readSessions(dataPath).drop('label', axis = 1).to_numpy(dtype = np.float32).reshape(-1, 33, 4)
+        self.noPoseEvery = noPoseEvery
+        self.frameIndex = 0
+
+        self.detectionConfidence = 0.5
+        self.trackingConfidence = 0.5
+        self.modelComplexity = 1
+
+    def open(self):
+        return self
+
+    def process(self, image):
+        frameIndex = self.frameIndex
+        self.frameIndex += 1
+
+        if self.noPoseEvery and frameIndex % self.noPoseEvery == self.noPoseEvery - 1:
+            return None
+
+        return self.landmarks[frameIndex % len(self.landmarks)].copy()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *args):
+        self.close()
+
+class SyntheticCapture:
+    def __init__(self, frameCount, width = 640, height = 480, fps = 30.0, seed = 0):
+        rng = np.random.default_rng(seed)
+        self.frames = [rng.integers(0, 255, (height, width, 3), dtype = np.uint8) for _ in range(8)]
+        self.frameCount = frameCount
+        self.fps = fps
+        self.frameIndex = 0
+
+    def isOpened(self):
+        return self.frameIndex < self.frameCount
+
+    def read(self, image = None):
+        if self.frameIndex >= self.frameCount:
+            return False, None
+
+        ## Like cv2.VideoCapture.read, a matching image is decoded into in place instead of allocating a new one
+        frame = self.frames[self.frameIndex % len(self.frames)]
+        if image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+            np.copyto(image, frame)
+        else:
+            image = frame.copy()
+
+        self.frameIndex += 1
+        return True, image
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.frameCount
+        return 0.0
+
+    def release(self):
+        self.frameIndex = self.frameCount
+
+def timePerCall(function, calls, rounds = 5):
+    ## The median of several rounds keeps one noisy round from moving the result
+    samples = []
+
+    for _ in range(rounds):
+        startTime = time.perf_counter()
+        for _ in range(calls):
+            function()
+        samples.append((time.perf_counter() - startTime) / calls)
+
+    return float(np.median(samples))
+
+class Benchmark:
+    def __init__(self, exercises = exercises, isQuick = False):
+        self.exercises = exercises
+        self.isQuick = isQuick
+        self.modelRegistry = ModelRegistry(exercises = exercises)
+        self.results = {}
+
+    def record(self, name, value, unit, isHigherBetter):
+        self.results[name] = {'value': value, 'unit': unit, 'higherIsBetter': isHigherBetter}
+        print(f"{name:<48}{value:>14.4f} {unit}", flush = True)
+
+    def landmarkRows(self, key):
+        return readSessions(self.exercises[key]['data']).drop('label', axis = 1)
+
+    def benchClassifiers(self):
+        calls = 50 if self.isQuick else 300
+
+        for key, entry in self.exercises.items():
+            rows = self.landmarkRows(key)
+            batch = np.tile(rows.to_numpy(dtype = np.float32), (max(1, 4096 // len(rows)), 1))
+            single = batch[0]
+
+            model = self.modelRegistry.get(key)
+            self.record(f'classifier.{key}.compiled.frameMs',
+                        timePerCall(lambda: model.predict_with_proba(single), calls) * 1000, 'ms', False)
+            self.record(f'classifier.{key}.compiled.rowsPerSec',
+                        len(batch) / timePerCall(lambda: model.predict_with_proba(batch), 3), 'rows/s', True)
+
+            if not os.path.exists(entry['model']):
+                continue
+
+            with open(entry['model'], 'rb') as f:
+                pipeline = pickle.load(f)
+
+            singleFrame = rows.iloc[[0]]
+            self.record(f'classifier.{key}.sklearn.frameMs',
+                        timePerCall(lambda: (pipeline.predict(singleFrame), pipeline.predict_proba(singleFrame)),
+                                    max(10, calls // 10)) * 1000, 'ms', False)
+
+    def benchRepCounter(self):
+        key = next(iter(self.exercises))
+        rows = self.landmarkRows(key).to_numpy(dtype = np.float32)
+        classes, probabilities = self.modelRegistry.get(key).predict_with_proba(rows)
+        updates = list(zip(classes, probabilities)) * (20 if self.isQuick else 200)
+
+        def replay():
+            repCounter = RepCounter()
+            for frameIndex, (movementPhaseClass, movementPhaseProbability) in enumerate(updates):
+                repCounter.update(movementPhaseClass, movementPhaseProbability, frameIndex)
+
+        self.record('repCounter.updatesPerSec', len(updates) / timePerCall(replay, 1, 3), 'updates/s', True)
+
+    def runPipeline(self, frameCount, consume, **pipelineOptions):
+        key = next(iter(self.exercises))
+        pipeline = ExercisePipeline(SyntheticCapture(frameCount), MotionGate(self.modelRegistry.get(key)),
+                                    ReplayPoseEstimator(self.exercises[key]['data'], noPoseEvery = 25),
+                                    **pipelineOptions)
+
+        startTime = time.perf_counter()
+        pipeline.start()
+
+        frames = 0
+
+        try:
+            for result in pipeline.results():
+                consume(result)
+                frames += 1
+        finally:
+            pipeline.stop()
+
+        return frames / (time.perf_counter() - startTime)
+
+    def benchRunner(self):
+        from ExerciseModelRunner import ExerciseModelRunner
+
+        runner = ExerciseModelRunner(next(iter(self.exercises)), None)
+        frameCount = 60 if self.isQuick else 300
+        self.record('runner.fps', self.runPipeline(frameCount, lambda result: None, renderer = runner.render),
+                    'frames/s', True)
+
+    def benchGUI(self):
+        from PIL import Image
+
+        from OverlayRenderer import OverlayRenderer
+
+        overlay = OverlayRenderer()
+        renderFrame = lambda result: overlay.render(result.image, result.landmarks)
+
+        ## Tk only exists with a display, without one the frame still goes through the PIL conversion VideoDisplay does
+        try:
+            import tkinter as tk
+
+            from VideoDisplay import VideoDisplay
+
+            root = tk.Tk()
+            canvas = tk.Canvas(root, width = 650, height = 500)
+            videoDisplay = VideoDisplay(canvas, 650, 500)
+            show = lambda result: (videoDisplay.show(result.image), root.update_idletasks())
+        except Exception:
+            root = None
+            show = lambda result: Image.fromarray(result.image)
+
+        try:
+            self.record('gui.fps', self.runPipeline(60 if self.isQuick else 300, show, renderer = renderFrame,
+                                                    frameSize = (650, 500), isRGBOutput = True), 'frames/s', True)
+        finally:
+            if root is not None:
+                root.destroy()
+
+    def benchBuffers(self):
+        import tracemalloc
+
+        frameCount = 60 if self.isQuick else 300
+
+        ## One unmeasured run first, so lazy imports and first-call caches don't land on whichever run goes first
+        self.runPipeline(10, lambda result: None, frameSize = (650, 500), isRGBOutput = True)
+
+        ## The unpooled run allocates every stage output and the skeleton background fresh, as before the pool existed;
+        ## tracemalloc sees numpy's data buffers, so cv2's output arrays are measured along with everything else
+        for name, isPooled in (('unpooled', False), ('pooled', True)):
+            bufferPool = FrameBufferPool(isPooled)
+            transientBytes, peakBytes = [], [0]
+
+            def renderSkeleton(result):
+                background = result.image if isPooled else bufferPool.like('skeleton', result.image)
+                background[:] = (25, 25, 41)
+                return background
+
+            def consume(result):
+                ## Memory allocated since the last frame above what is still live: the traffic a frame adds for the
+                ## allocator and the cache to absorb
+                current, peak = tracemalloc.get_traced_memory()
+                transientBytes.append(peak - current)
+                peakBytes[0] = max(peakBytes[0], peak)
+                tracemalloc.reset_peak()
+
+            tracemalloc.start()
+            try:
+                before = tracemalloc.take_snapshot()
+                self.runPipeline(frameCount, consume, renderer = renderSkeleton, frameSize = (650, 500),
+                                 isRGBOutput = True, bufferPool = bufferPool)
+                after = tracemalloc.take_snapshot()
+                peakBytes[0] = max(peakBytes[0], tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+
+            retained = after.compare_to(before, 'filename')
+            self.record(f'buffers.{name}.transientKBPerFrame', sum(transientBytes) / len(transientBytes) / 1024, 'KB', False)
+            self.record(f'buffers.{name}.retainedKB', sum(stat.size_diff for stat in retained) / 1024, 'KB', False)
+            self.record(f'buffers.{name}.retainedBlocks', sum(stat.count_diff for stat in retained), 'blocks', False)
+            self.record(f'buffers.{name}.peakMB', peakBytes[0] / 1e6, 'MB', False)
+            self.record(f'buffers.{name}.pooledMB', bufferPool.stats()['pooledBytes'] / 1e6, 'MB', False)
+
+    def benchTrainer(self):
+        from ExerciseModelTrainer import ExerciseModelTrainer
+
+        keys = list(self.exercises)[:1] if self.isQuick else list(self.exercises)
+
+        with tempfile.TemporaryDirectory() as tmpDir:
+            for key in keys:
+                trainer = ExerciseModelTrainer(self.exercises[key]['data'], os.path.join(tmpDir, f'{key}.pkl'))
+                trainer.searchCacheDir = os.path.join(tmpDir, 'search')
+                trainer.constructPipeline()
+                self.record(f'trainer.{key}.seconds', trainer.trainingTime, 's', False)
+
+    def run(self, suites = ('classifier', 'repCounter', 'runner', 'gui', 'buffers', 'trainer')):
+        benches = {'classifier': self.benchClassifiers, 'repCounter': self.benchRepCounter, 'runner': self.benchRunner,
+                   'gui': self.benchGUI, 'buffers': self.benchBuffers, 'trainer': self.benchTrainer}
+
+        for suite in suites:
+            benches[suite]()
+
+        return {'machine': platform.node(), 'python': platform.python_version(), 'results': self.results}
+
+def compare(results, baseline, threshold):
+    regressions = []
+
+    for name, result in results['results'].items():
+        if name not in baseline['results']:
+            continue
+
+        expected = baseline['results'][name]['value']
+
+        ## From a zero baseline any growth is unbounded, so a cost that used to be nothing regresses as soon as it appears
+        if expected:
+            change = (result['value'] - expected) / abs(expected)
+        else:
+            change = float('inf') if result['value'] > 0 else float('-inf') if result['value'] < 0 else 0.0
+
+        ## A regression is a slowdown: less throughput or more time, by more than the threshold
+        if (result['higherIsBetter'] and change < -threshold) or (not result['higherIsBetter'] and change > threshold):
+            regressions.append((name, expected, result['value'], change))
+
+    return regressions
+
+def writeJSON(path, data):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok = True)
+
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(data, f, indent = 1, sort_keys = True)
+    os.replace(f'{path}.tmp', path)
+
+def main(argv):
+    def option(name, default):
+        return argv[argv.index(name) + 1] if name in argv else default
+
+    baselinePath = option('--baseline', 'benchmarks/baseline.json')
+    threshold = float(option('--threshold', 0.25))
+    suites = option('--suites', 'classifier,repCounter,runner,gui,buffers,trainer').split(',')
+
+    results = Benchmark(isQuick = '--quick' in argv).run(suites)
+    writeJSON(option('--output', 'benchmarks/latest.json'), results)
+
+    if '--save-baseline' in argv:
+        writeJSON(baselinePath, results)
+        print(f"Saved baseline to {baselinePath}")
+        return 0
+
+    ## A missing baseline fails the run, otherwise a gate without one would pass everything silently
+    if not os.path.exists(baselinePath):
+        print(f"No baseline at {baselinePath}, run with --save-baseline to create one")
+        return 1
+
+    with open(baselinePath) as f:
+        regressions = compare(results, json.load(f), threshold)
+
+    for name, expected, value, change in regressions:
+        print(f"REGRESSION {name}: {expected:.4f} -> {value:.4f} ({change:+.0%})")
+
+    print(f"{len(regressions)} regressions past {threshold:.0%}")
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,285 @@
+import glob
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+
+from PoseFeatures import PoseFeatures
+
+class CompiledExerciseModel:
+    artifactFormat = 'powerbuilder-gbt'
+    artifactVersion = 1
+
+    def __init__(self, classes, feature, threshold, leftChild, rightChild, value, roots, maxDepth, initRaw,
+                 featureSet = 'raw'):
+        self.classes_ = np.asarray(classes)
+        self.feature = np.asarray(feature, dtype = np.intp)
+        self.threshold = np.asarray(threshold, dtype = np.float64)
+        self.leftChild = np.asarray(leftChild, dtype = np.intp)
+        self.rightChild = np.asarray(rightChild, dtype = np.intp)
+        self.value = np.asarray(value, dtype = np.float64)
+        self.roots = np.asarray(roots, dtype = np.intp)
+        self.maxDepth = maxDepth
+        self.initRaw = initRaw
+        self.nOutputs = initRaw.shape[0]
+        self.featureSet = featureSet
+        self.metadata = {}
+
+    @classmethod
+    def load(cls, path):
+        if not path.endswith('.pkl'):
+            return cls.loadArtifact(path)
+
+        with open(path, 'rb') as f:
+            return cls.fromPipeline(pickle.load(f))
+
+    @classmethod
+    def artifactMetadata(cls, path):
+        with np.load(path, allow_pickle = False) as artifact:
+            return json.loads(artifact['metadata'].tobytes().decode())
+
+    @classmethod
+    def loadArtifact(cls, path):
+        with np.load(path, allow_pickle = False) as artifact:
+            metadata = json.loads(artifact['metadata'].tobytes().decode())
+
+            ## Distilled students can be other model families, the artifact's format says which class reads it
+            modelClass = next((modelClass for modelClass in (CompiledExerciseModel, CompiledLinearModel)
+                               if modelClass.artifactFormat == metadata.get('format')), None)
+
+            if modelClass is None or metadata.get('version') != modelClass.artifactVersion:
+                raise ValueError(f"Unsupported model artifact {path}: {metadata.get('format')} v{metadata.get('version')}")
+
+            model = modelClass.fromArrays(artifact, metadata)
+
+        model.metadata = metadata
+        return model
+
+    @classmethod
+    def fromArrays(cls, artifact, metadata):
+        return cls(metadata['classes'], artifact['feature'], artifact['threshold'], artifact['leftChild'],
+                   artifact['rightChild'], artifact['value'], artifact['roots'], metadata['maxDepth'],
+                   artifact['initRaw'], metadata.get('featureSet', 'raw'))
+
+    def save(self, path, **metadata):
+        metadata = dict(metadata, format = self.artifactFormat, version = self.artifactVersion,
+                        classes = self.classes_.tolist(), maxDepth = int(self.maxDepth),
+                        featureSet = self.featureSet)
+
+        ## Node indices fit comfortably in int32 and split features in int16, which halves the artifact size
+        with open(path, 'wb') as f:
+            np.savez_compressed(f,
+                                metadata = np.frombuffer(json.dumps(metadata).encode(), dtype = np.uint8),
+                                feature = self.feature.astype(np.int16),
+                                threshold = self.threshold,
+                                leftChild = self.leftChild.astype(np.int32),
+                                rightChild = self.rightChild.astype(np.int32),
+                                value = self.value,
+                                roots = self.roots.astype(np.int32),
+                                initRaw = self.initRaw)
+
+    @staticmethod
+    def pipelineSteps(pipeline):
+        steps = [step for _, step in pipeline.steps]
+        featureSet = 'raw'
+
+        if getattr(steps[0], 'func', None) is PoseFeatures.transform:
+            featureSet = 'pose'
+            steps = steps[1:]
+
+        scaler, estimator = steps[0], steps[-1]
+        mean = scaler.mean_ if scaler.with_mean else np.zeros(estimator.n_features_in_)
+        scale = scaler.scale_ if scaler.with_std else np.ones(estimator.n_features_in_)
+
+        return featureSet, mean, scale, estimator
+
+    @classmethod
+    def fromPipeline(cls, pipeline):
+        featureSet, mean, scale, booster = cls.pipelineSteps(pipeline)
+
+        if hasattr(booster, 'coef_'):
+            return CompiledLinearModel.fromPipeline(pipeline)
+
+        features, thresholds, leftChildren, rightChildren, values, roots = [], [], [], [], [], []
+        offset, maxDepth = 0, 0
+
+        ## Trees are stored output-major so a traversal result reshapes straight to (N, outputs, stages)
+        for k in range(booster.estimators_.shape[1]):
+            for stage in range(booster.estimators_.shape[0]):
+                tree = booster.estimators_[stage, k].tree_
+                isLeaf = tree.children_left == -1
+                nodes = np.arange(tree.node_count)
+
+                feature = np.where(isLeaf, 0, tree.feature)
+                ## Fold the StandardScaler into each split: (x - mean) / scale <= t  <=>  x <= t * scale + mean
+                threshold = np.where(isLeaf, np.inf, tree.threshold * scale[feature] + mean[feature])
+
+                features.append(feature)
+                thresholds.append(threshold)
+                leftChildren.append(np.where(isLeaf, nodes, tree.children_left) + offset)
+                rightChildren.append(np.where(isLeaf, nodes, tree.children_right) + offset)
+                values.append(booster.learning_rate * tree.value[:, 0, 0])
+                roots.append(offset)
+
+                offset += tree.node_count
+                maxDepth = max(maxDepth, tree.max_depth)
+
+        initRaw = booster._raw_predict_init(np.zeros((1, booster.n_features_in_), dtype = np.float32))[0]
+
+        return cls(pipeline.classes_,
+                   np.concatenate(features),
+                   np.concatenate(thresholds),
+                   np.concatenate(leftChildren),
+                   np.concatenate(rightChildren),
+                   np.concatenate(values),
+                   roots,
+                   maxDepth,
+                   np.asarray(initRaw, dtype = np.float64),
+                   featureSet)
+
+    def toBatch(self, x):
+        x = np.asarray(x, dtype = np.float32)
+        isSingle = x.ndim == 1 or (x.ndim == 2 and x.shape == (33, 4))
+        x = x.reshape(1 if isSingle else len(x), -1)
+
+        if self.featureSet == 'pose':
+            x = PoseFeatures.transform(x)
+
+        return x, isSingle
+
+    def accumulate(self, x):
+        rows = np.arange(len(x))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(x), len(self.roots)))
+
+        for _ in range(self.maxDepth):
+            isLeft = x[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(isLeft, self.leftChild[nodes], self.rightChild[nodes])
+
+        return self.value[nodes].reshape(len(x), self.nOutputs, -1).sum(axis = 2) + self.initRaw
+
+    def decision_function(self, x):
+        x, isSingle = self.toBatch(x)
+        raw = self.accumulate(x)
+        return raw[0] if isSingle else raw
+
+    def predict_with_proba(self, x):
+        x, isSingle = self.toBatch(x)
+        classes, proba = self.predictFeatures(x)
+
+        if isSingle:
+            return classes[0], proba[0]
+
+        return classes, proba
+
+    def predictFeatures(self, x):
+        ## x is a batch already in this model's input space, callers running several models on one frame compute
+        ## the feature transform once and share it
+        raw = self.accumulate(x)
+
+        if self.nOutputs == 1:
+            positive = 1.0 / (1.0 + np.exp(-raw[:, 0]))
+            proba = np.column_stack((1.0 - positive, positive))
+        else:
+            proba = np.exp(raw - raw.max(axis = 1, keepdims = True))
+            proba /= proba.sum(axis = 1, keepdims = True)
+
+        return self.classes_[proba.argmax(axis = 1)], proba
+
+    def predict(self, x):
+        return self.predict_with_proba(x)[0]
+
+    def predict_proba(self, x):
+        return self.predict_with_proba(x)[1]
+
+class CompiledLinearModel(CompiledExerciseModel):
+    artifactFormat = 'powerbuilder-linear'
+    artifactVersion = 1
+
+    def __init__(self, classes, coef, intercept, featureSet = 'raw'):
+        self.classes_ = np.asarray(classes)
+        self.coef = np.asarray(coef, dtype = np.float64)
+        self.intercept = np.asarray(intercept, dtype = np.float64)
+        self.nOutputs = self.coef.shape[0]
+        self.featureSet = featureSet
+        self.metadata = {}
+
+    @classmethod
+    def fromPipeline(cls, pipeline):
+        featureSet, mean, scale, linear = cls.pipelineSteps(pipeline)
+
+        ## Fold the StandardScaler into the weights: w . (x - mean) / scale + b  ==  (w / scale) . x + b - w . mean / scale
+        coef = linear.coef_ / scale
+        intercept = linear.intercept_ - coef @ mean
+
+        return cls(pipeline.classes_, coef, intercept, featureSet)
+
+    @classmethod
+    def fromArrays(cls, artifact, metadata):
+        return cls(metadata['classes'], artifact['coef'], artifact['intercept'], metadata.get('featureSet', 'raw'))
+
+    def save(self, path, **metadata):
+        metadata = dict(metadata, format = self.artifactFormat, version = self.artifactVersion,
+                        classes = self.classes_.tolist(), featureSet = self.featureSet)
+
+        with open(path, 'wb') as f:
+            np.savez_compressed(f,
+                                metadata = np.frombuffer(json.dumps(metadata).encode(), dtype = np.uint8),
+                                coef = self.coef,
+                                intercept = self.intercept)
+
+    def accumulate(self, x):
+        ## Same raw scores a booster produces, one column for a binary model and one per class otherwise
+        return x @ self.coef.T + self.intercept
+
+def compareWithPipeline(modelPath, dataPath, repeats = 200):
+    import pandas as pd
+
+    with open(modelPath, 'rb') as f:
+        pipeline = pickle.load(f)
+
+    model = CompiledExerciseModel.fromPipeline(pipeline)
+
+    df = pd.read_csv(dataPath)
+    x = df.drop('label', axis = 1)
+    xRaw = x.to_numpy(dtype = np.float32)
+
+    expectedClasses, expectedProba = pipeline.predict(x), pipeline.predict_proba(x)
+    classes, proba = model.predict_with_proba(xRaw)
+
+    start = time.perf_counter()
+    for i in range(repeats):
+        frame = pd.DataFrame([xRaw[i % len(xRaw)].tolist()], columns = x.columns)
+        pipeline.predict(frame)
+        pipeline.predict_proba(frame)
+    pipelineTime = (time.perf_counter() - start) / repeats
+
+    start = time.perf_counter()
+    for i in range(repeats):
+        model.predict_with_proba(xRaw[i % len(xRaw)])
+    compiledTime = (time.perf_counter() - start) / repeats
+
+    return {
+        'rows': len(xRaw),
+        'classMatches': bool((classes == expectedClasses).all()),
+        'maxProbaDiff': float(np.abs(proba - expectedProba).max()),
+        'pipelineFrameMs': pipelineTime * 1000,
+        'compiledFrameMs': compiledTime * 1000,
+    }
+
+def main():
+    for modelPath in sorted(glob.glob('models/*.pkl')):
+        name = os.path.splitext(os.path.basename(modelPath))[0]
+        dataPath = f'data/{name}.csv'
+
+        if not os.path.exists(dataPath):
+            continue
+
+        report = compareWithPipeline(modelPath, dataPath)
+        print(f"{name}: rows={report['rows']} classMatches={report['classMatches']} "
+              f"maxProbaDiff={report['maxProbaDiff']:.2e} "
+              f"sklearn={report['pipelineFrameMs']:.3f}ms/frame compiled={report['compiledFrameMs']:.3f}ms/frame")
+
+if __name__ == '__main__':
+    main()
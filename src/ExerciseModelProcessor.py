@@ -1,18 +1,31 @@
 import cv2
-import mediapipe as mp
 import numpy as np
+import pandas as pd
 import csv
+import os
+
+from ExercisePipeline import ExercisePipeline
+from FrameBufferPool import FrameBufferPool
+from LandmarkCache import LandmarkCache
+from OverlayRenderer import OverlayRenderer
+from PoseEstimator import PoseEstimator
+from StageMetrics import StageMetrics
 
 class ExerciseModelProcessor:
-    def __init__(self, exerciseName, outputCSV, inputVideo):
+    def __init__(self, exerciseName, outputCSV, inputVideo, metrics = None):
         self.exerciseName = exerciseName,
         self.outputCSV = outputCSV
         self.inputVideo = inputVideo
         self.detectionConfidence = 0.5
         self.trackingConfidence = 0.5
+        self.landmarkCache = LandmarkCache()
+        self.pendingRows = []
+        self.metrics = metrics if metrics is not None else StageMetrics()
+
+        ## Frames are handled one at a time, so a single buffer per stage is enough
+        self.bufferPool = FrameBufferPool()
 
-        self.mp_drawing = mp.solutions.drawing_utils
-        self.mp_pose = mp.solutions.pose
+        self.overlay = OverlayRenderer()
 
         self.landmarks = ['label']
 
@@ -22,76 +35,161 @@ class ExerciseModelProcessor:
         self.initCSV()
 
     def initCSV(self):
+        if os.path.exists(self.outputCSV) and os.path.getsize(self.outputCSV) > 0:
+            return
+
         with open(self.outputCSV, mode = 'a', newline = '') as f:
             csv_writer = csv.writer(f, delimiter = ',', quotechar = '"', quoting = csv.QUOTE_MINIMAL)
             csv_writer.writerow(self.landmarks)
 
-    def generateLabel(self, results, label):
+    def generateLabel(self, landmarks, label):
         try:
-            keypoints = self.generateKeywords(results, label)
-
-            with open(self.outputCSV, mode = 'a', newline = '') as f:
-                csv_writer = csv.writer(f, delimiter = ',', quotechar = '"', quoting = csv.QUOTE_MINIMAL)
-                csv_writer.writerow(keypoints)
-
+            with self.metrics.stage('label'):
+                self.pendingRows.append(self.generateKeywords(landmarks, label))
         except Exception as e:
             print(f"Error generating landmarks: {e}")
 
-    def generateKeywords(self, results, label):
-        keypoints = []
-        for landmark in results.pose_landmarks.landmark:
-            keypoints.append(landmark.x)
-            keypoints.append(landmark.y)
-            keypoints.append(landmark.z)
-            keypoints.append(landmark.visibility)
+    def flushLabels(self):
+        if not self.pendingRows:
+            return
 
-        keypoints = np.array(keypoints).flatten().tolist()
+        with self.metrics.stage('flushLabels'), open(self.outputCSV, mode = 'a', newline = '') as f:
+            csv_writer = csv.writer(f, delimiter = ',', quotechar = '"', quoting = csv.QUOTE_MINIMAL)
+            csv_writer.writerows(self.pendingRows)
+
+        self.pendingRows = []
+
+    def generateKeywords(self, landmarks, label):
+        if landmarks is None:
+            raise ValueError('no pose detected in this frame')
+
+        keypoints = np.asarray(landmarks, dtype = np.float64).flatten().tolist()
         keypoints.insert(0, label)
         return keypoints
     
     def processFrame(self, pose, frame):
-        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        image.flags.writeable = False
+        ## Only the estimator needs RGB, the BGR frame itself is drawn on and displayed
+        with self.metrics.stage('cvtColor'):
+            image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst = self.bufferPool.like('rgb', frame))
+
+        with self.metrics.stage('pose'):
+            landmarks = pose.process(image)
 
-        results = pose.process(image)
+        self.bufferPool.release(image)
 
-        image.flags.writeable = True
-        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-        
-        return image, results
+        if landmarks is None:
+            self.metrics.count('noPose')
+
+        return frame, landmarks
 
     def processVideo(self):
         cap = cv2.VideoCapture(self.inputVideo)
+        frame = None
+        frameCount = 0
 
-        with self.mp_pose.Pose(min_detection_confidence = self.detectionConfidence, 
-                               min_tracking_confidence = self.trackingConfidence) as pose:
-            while cap.isOpened():
-                isReadable, frame = cap.read()
+        poseEstimator = self.landmarkCache.estimator(self.inputVideo,
+                                                     PoseEstimator(self.detectionConfidence, self.trackingConfidence))
 
-                if not isReadable:
-                    break
+        try:
+            with poseEstimator as pose:
+                while cap.isOpened():
+                    with self.metrics.stage('capture'):
+                        isReadable, frame = cap.read(frame) if frame is not None else cap.read()
+
+                    if not isReadable:
+                        if hasattr(pose, 'markEndOfStream'):
+                            pose.markEndOfStream(frameCount)
+                        break
+
+                    frameCount += 1
+                    self.metrics.count('frames')
+                    image, landmarks = self.processFrame(pose, frame)
+
+                    if landmarks is not None:
+                        with self.metrics.stage('drawLandmarks'):
+                            self.overlay.drawSkeleton(image, landmarks)
+
+                    key = cv2.waitKey(1)
+
+                    if key == ord('w'):
+                        self.generateLabel(landmarks, 'up')
+                    elif key == ord('s'):
+                        self.generateLabel(landmarks, 'down')
+                    elif key == ord('d'):
+                        self.generateLabel(landmarks, 'right')
+                    elif key == ord('f'):
+                        self.generateLabel(landmarks, 'neutral')
+                    elif key == ord('g'):
+                        self.generateLabel(landmarks, 'left')
+
+                    with self.metrics.stage('display'):
+                        cv2.imshow(f'{self.exerciseName} Feed', image)
+                        key = cv2.waitKey(10)
+
+                    if key == ord('q'):
+                        break
+        finally:
+            self.flushLabels()
+            cap.release()
+            cv2.destroyAllWindows()
+
+    def extractLandmarks(self):
+        poseEstimator = PoseEstimator(self.detectionConfidence, self.trackingConfidence)
+        cached = self.landmarkCache.load(self.inputVideo, poseEstimator)
+
+        if cached is not None:
+            return cached
+
+        writer = self.landmarkCache.writer(self.inputVideo, poseEstimator)
+        pipeline = ExercisePipeline(self.inputVideo, None, poseEstimator, dropOldest = False, metrics = self.metrics)
+        pipeline.start()
 
-                image, results = self.processFrame(pose, frame)
+        try:
+            for result in pipeline.results():
+                writer.append(result.landmarks)
+        except BaseException:
+            writer.discard()
+            raise
+        finally:
+            pipeline.stop()
 
-                self.mp_drawing.draw_landmarks(image, results.pose_landmarks, self.mp_pose.POSE_CONNECTIONS)
+        writer.commit()
+        return self.landmarkCache.load(self.inputVideo, poseEstimator)
 
-                key = cv2.waitKey(1)
+    def readLabelRanges(self, labelFile, videoFPS):
+        ranges = []
 
-                if key == ord('w'):
-                    self.generateLabel(results, 'up')
-                elif key == ord('s'):
-                    self.generateLabel(results, 'down')
-                elif key == ord('d'):
-                    self.generateLabel(results, 'right')
-                elif key == ord('f'):
-                    self.generateLabel(results, 'neutral')
-                elif key == ord('g'):
-                    self.generateLabel(results, 'left')
+        ## Each row is label,start,end with frame numbers, or seconds when suffixed with 's' (e.g. down,1.5s,3s)
+        with open(labelFile, newline = '') as f:
+            for row in csv.DictReader(f):
+                start, end = row['start'].strip(), row['end'].strip()
 
-                cv2.imshow(f'{self.exerciseName} Feed', image)
+                if start.endswith('s') or end.endswith('s'):
+                    startFrame = int(round(float(start.rstrip('s')) * videoFPS))
+                    endFrame = int(round(float(end.rstrip('s')) * videoFPS))
+                else:
+                    startFrame, endFrame = int(start), int(end)
 
-                if cv2.waitKey(10) == ord('q'):
-                    break
+                ranges.append((row['label'].strip(), startFrame, endFrame))
 
+        return ranges
+
+    def processVideoBulk(self, labelFile):
+        cap = cv2.VideoCapture(self.inputVideo)
+        videoFPS = cap.get(cv2.CAP_PROP_FPS) or 30.0
         cap.release()
-        cv2.destroyAllWindows()
\ No newline at end of file
+
+        landmarks, detected = self.extractLandmarks()
+        frameLabels = np.full(len(detected), '', dtype = object)
+
+        for label, startFrame, endFrame in self.readLabelRanges(labelFile, videoFPS):
+            frameLabels[max(0, startFrame):min(len(detected), endFrame)] = label
+
+        isLabelled = (frameLabels != '') & np.asarray(detected)
+
+        dataset = pd.DataFrame(landmarks.reshape(len(detected), -1)[isLabelled].astype(np.float64),
+                               columns = self.landmarks[1:])
+        dataset.insert(0, 'label', frameLabels[isLabelled])
+        dataset.to_csv(self.outputCSV, mode = 'a', header = False, index = False)
+
+        return len(dataset)
@@ -1,20 +1,30 @@
 import cv2
-import mediapipe as mp
-import pickle
-import pandas as pd
-import numpy as np
+
+from AdaptivePoseEstimator import AdaptivePoseEstimator
+from CompiledExerciseModel import CompiledExerciseModel
+from ExercisePipeline import ExercisePipeline
+from ExerciseRecognizer import ExerciseRouter
+from LandmarkCache import LandmarkCache
+from MotionGate import MotionGate
+from OverlayRenderer import OverlayRenderer
+from PoseEstimator import PoseEstimator
+from SessionJournal import JournalWriter, journalPath
+from StageMetrics import StageMetrics
 
 class ExerciseModelRunner:
-    def __init__(self, exerciseName, modelPath):
+    def __init__(self, exerciseName, modelPath, targetFPS = None, metrics = None, journalDir = None):
         self.exerciseName = exerciseName
         self.modelPath = modelPath
         self.inputVideo = 0
+        self.targetFPS = targetFPS
+        self.metrics = metrics if metrics is not None else StageMetrics()
+        self.journalDir = journalDir
 
         self.detectionConfidence = 0.5
         self.trackingConfidence = 0.5
+        self.landmarkCache = LandmarkCache()
 
-        self.mp_pose = mp.solutions.pose
-        self.mp_drawing = mp.solutions.drawing_utils
+        self.overlay = OverlayRenderer()
 
         self.landmarks = ['label']
 
@@ -22,69 +32,57 @@ class ExerciseModelRunner:
             self.landmarks += [f'x{i}', f'y{i}', f'z{i}', f'v{i}']
 
     def run(self):
-        cap = cv2.VideoCapture(self.inputVideo)
-        
-        repCount = 0
-        movementPhase = ''
-
-        with open(self.modelPath, 'rb') as f:
-            self.modelOne = pickle.load(f)
-
-        with self.mp_pose.Pose(min_detection_confidence = self.detectionConfidence, 
-                               min_tracking_confidence = self.trackingConfidence) as pose:
-
-            while cap.isOpened():
-                isReadable, frame = cap.read()
-
-                if not isReadable:
+        ## Without a model path the exercise is recognized from the landmarks and routed to its own model
+        if self.modelPath is None:
+            self.modelOne = ExerciseRouter.load(isGated = True)
+        else:
+            self.modelOne = MotionGate(CompiledExerciseModel.load(self.modelPath))
+
+        poseEstimator = self.landmarkCache.estimator(self.inputVideo,
+                                                     PoseEstimator(self.detectionConfidence, self.trackingConfidence))
+
+        ## Cropping and rescaling only apply to live input, cached recordings must replay exactly what was recorded
+        if isinstance(self.inputVideo, int):
+            poseEstimator = AdaptivePoseEstimator(poseEstimator, self.targetFPS)
+
+        journal = None
+        if self.journalDir:
+            journal = JournalWriter(journalPath(self.journalDir, self.exerciseName), self.exerciseName)
+
+        pipeline = ExercisePipeline(self.inputVideo, self.modelOne, poseEstimator, renderer = self.render,
+                                    metrics = self.metrics, journal = journal)
+        pipeline.start()
+
+        try:
+            for result in pipeline.results():
+                with self.metrics.stage('display'):
+                    cv2.imshow(f'{self.exerciseName} Feed', result.image)
+                    key = cv2.waitKey(1)
+
+                if key == ord('q'):
                     break
+        finally:
+            pipeline.stop()
+            cv2.destroyAllWindows()
 
-                image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                image.flags.writeable = False
-
-                results = pose.process(image)
+        print(f"Classifier calls saved by motion gating: {self.modelOne.reusedCount}/{self.modelOne.callCount} "
+              f"({self.modelOne.savedFraction():.1%})")
 
-                image.flags.writeable = True
-                image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    def render(self, result):
+        image = result.image
 
-                self.mp_drawing.draw_landmarks(image, results.pose_landmarks, self.mp_pose.POSE_CONNECTIONS)
+        if result.landmarks is None:
+            return image
 
-                try: 
-                    row = np.array([[res.x, res.y, res.z, res.visibility] for res in results.pose_landmarks.landmark]).flatten().tolist()
-                    df = pd.DataFrame([row], columns= self.landmarks[1:])
+        with self.metrics.stage('drawLandmarks'):
+            self.overlay.drawSkeleton(image, result.landmarks)
 
-                    movementPhaseClass = self.modelOne.predict(df)[0]
-                    movementPhaseProbability = self.modelOne.predict_proba(df)[0]
+        if result.roi is not None:
+            cv2.rectangle(image, result.roi[:2], result.roi[2:], (0, 255, 255), 1)
+            cv2.putText(image, f"x{result.scale:.2f}", (result.roi[0] + 4, result.roi[3] - 6),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 255), 1, cv2.LINE_AA)
 
-                    if movementPhaseClass == 'down' and movementPhaseProbability[movementPhaseProbability.argmax()] >= .7:
-                        movementPhase = 'Down'
-                    elif movementPhase == 'Down' and movementPhaseClass == 'up' and movementPhaseProbability[movementPhaseProbability.argmax()] >= .7:
-                        movementPhase = 'Up'
-                        repCount += 1
-                    
-                    topLeft, btmRight, color, thickness = (0, 0), (220, 60), (0, 0, 0), 2
-                    movementPhasePosition, repsPos = (15, 20), (15, 40)
-
-                    textProperties = {
-                        "fontFace": cv2.FONT_HERSHEY_COMPLEX,
-                        "fontScale": 0.5,
-                        "color": (255, 255, 255),
-                        "thickness": 1,
-                        "lineType": cv2.LINE_AA
-                    }
-
-                    cv2.rectangle(image, topLeft, btmRight, (0, 0, 255), thickness)
-                    cv2.rectangle(image, topLeft, btmRight, color, -1)
-                    cv2.putText(image, f"Movement Phase: {movementPhase}", movementPhasePosition, **textProperties)
-                    cv2.putText(image, f"Rep count: {repCount}", repsPos, **textProperties)
-
-                except Exception as e:
-                    print(e)
-
-                cv2.imshow(f'{self.exerciseName} Feed', image)
-
-                if cv2.waitKey(10) == ord('q'):
-                    break
+        if result.movementPhaseClass is None:
+            return image
 
-        cap.release()
-        cv2.destroyAllWindows()
+        return self.overlay.drawHUD(image, result.movementPhase, result.repCount)
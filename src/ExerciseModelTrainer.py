@@ -1,33 +1,344 @@
+import copy
+import hashlib
+import json
+import os
 import pandas as pd
 import pickle
-from sklearn.model_selection import train_test_split, GridSearchCV
+import tempfile
+import time
+import numpy as np
+from sklearn.base import clone
+from sklearn.model_selection import train_test_split, GridSearchCV, KFold
 from sklearn.pipeline import make_pipeline
-from sklearn.preprocessing import StandardScaler
+from sklearn.preprocessing import FunctionTransformer, StandardScaler
 from sklearn.ensemble import GradientBoostingClassifier
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn.metrics import precision_score
 
+from CompiledExerciseModel import CompiledExerciseModel
+from ModelManifest import createManifest, parameterGrid
+from ModelRegistry import ModelRegistry, dataRoot, sessionFiles, studentDir, studentPath
+from ModelSearch import ModelSearch
+from PoseFeatures import PoseFeatures
+
 class ExerciseModelTrainer:
-    def __init__(self, dataPath, modelPath):
+    def __init__(self, dataPath, modelPath, featureSet = 'raw', isIncremental = False, chunkSize = 50000,
+                 dedupTolerance = 1e-4, testFraction = 0.25):
         self.dataPath = dataPath
         self.modelPath = modelPath
-        self.df = pd.read_csv(dataPath)
-        self.x = self.df.drop('label', axis = 1)
-        self.y = self.df['label']
-        self.xTrain, self.xTest, self.yTrain, self.yTest = train_test_split(self.x, self.y, test_size = 0.25, random_state = 10)
-        self.parameterGrid = {
-            'gradientboostingclassifier__n_estimators': [50, 100, 200],
-            'gradientboostingclassifier__learning_rate': [0.01, 0.1, 0.2],
-            'gradientboostingclassifier__max_depth': [3, 5, 7],
-        }
-
-    def constructPipeline(self):
-        self.trainingPipeline = make_pipeline(StandardScaler(), GradientBoostingClassifier())
-        gridSearch = GridSearchCV(estimator=self.trainingPipeline, param_grid=self.parameterGrid, 
-                                  cv=5, n_jobs=-1, scoring='precision_macro')
-        self.model = gridSearch.fit(self.xTrain, self.yTrain).best_estimator_
+        self.featureSet = featureSet
+        self.isIncremental = isIncremental
+        self.chunkSize = chunkSize
+        self.dedupTolerance = dedupTolerance
+        self.testFraction = testFraction
+
+        self.sessions = sessionFiles(dataPath)
+        if not self.sessions:
+            raise FileNotFoundError(f'No session files match {dataPath}')
+
+        self.testSessions = splitSessions(self.sessions, testFraction, dataRoot(dataPath))
+        self.columns = pd.read_csv(self.sessions[0], nrows = 0).columns.drop('label')
+        self.isTestRow = None
+
+        ## The incremental learner streams the sessions on every pass, otherwise the deduplicated rows are loaded once
+        if isIncremental:
+            self.xTrain = self.yTrain = self.xTest = self.yTest = None
+        elif len(self.sessions) == 1:
+            self.xTrain, self.xTest, self.yTrain, self.yTest = train_test_split(*self.readRows(), test_size = testFraction,
+                                                                                random_state = 10)
+        else:
+            self.xTrain, self.yTrain = self.readRows(isTest = False)
+            self.xTest, self.yTest = self.readRows(isTest = True)
+
+        ## A single file keeps the shuffled row split it always had, streamed as a mask that holds out the same rows
+        ## train_test_split would
+        if isIncremental and len(self.sessions) == 1:
+            rowCount = sum(len(y) for _, y in self.sessionChunks())
+            self.isTestRow = np.zeros(rowCount, dtype = bool)
+            self.isTestRow[train_test_split(np.arange(rowCount), test_size = testFraction, random_state = 10)[1]] = True
+
+        self.parameterGrid = parameterGrid
+        self.trainingTime = None
+        self.bestParams = None
+        self.cvScore = None
+        self.searchCacheDir = 'cache/search'
+
+    def sessionChunks(self, isTest = None):
+        ## isTest None streams every row, otherwise only the training or the held out side of the split
+        isSplitByRow = len(self.sessions) == 1
+
+        for path in self.sessions:
+            if isTest is not None and not isSplitByRow and (path in self.testSessions) != isTest:
+                continue
+
+            previous, rowIndex = None, 0
+
+            for chunk in pd.read_csv(path, chunksize = self.chunkSize, dtype = dict.fromkeys(self.columns, np.float32)):
+                x = chunk.drop('label', axis = 1).to_numpy(dtype = np.float32)
+                y = chunk['label'].to_numpy()
+
+                isKept = self.distinctFrames(x, y, previous)
+                previous = (x[-1], y[-1])
+                x, y = x[isKept], y[isKept]
+
+                if isTest is not None and isSplitByRow:
+                    isTestRow = self.isTestRow[rowIndex:rowIndex + len(x)]
+                    rowIndex += len(x)
+                    x, y = x[isTestRow == isTest], y[isTestRow == isTest]
+
+                if len(x):
+                    yield x, y
+
+    def distinctFrames(self, x, y, previous):
+        ## A frame is dropped when no coordinate moved more than dedupTolerance since the frame before it and the label
+        ## is unchanged, which removes held poses and repeated video frames without thinning real movement
+        before = np.concatenate([x[:1] if previous is None else previous[0][None], x[:-1]])
+        labelBefore = np.concatenate([[None] if previous is None else [previous[1]], y[:-1]])
+        return (np.abs(x - before).max(axis = 1) > self.dedupTolerance) | (y != labelBefore)
+
+    def readRows(self, isTest = None):
+        chunks = list(self.sessionChunks(isTest))
+        if not chunks:
+            return pd.DataFrame(columns = self.columns, dtype = np.float32), pd.Series(dtype = object, name = 'label')
+
+        x = pd.DataFrame(np.concatenate([x for x, _ in chunks]), columns = self.columns)
+        y = pd.Series(np.concatenate([y for _, y in chunks]), name = 'label')
+        return x, y
+
+    def featureTransformer(self):
+        if self.featureSet == 'pose':
+            return FunctionTransformer(PoseFeatures.transform)
+        return None
+
+    def constructPipeline(self, useGridSearch = False, executor = None):
+        startTime = time.perf_counter()
+        featureTransformer = self.featureTransformer()
+
+        if self.isIncremental:
+            self.model = self.incrementalModel()
+        elif useGridSearch:
+            featureSteps = [] if featureTransformer is None else [featureTransformer]
+            self.trainingPipeline = make_pipeline(*featureSteps, StandardScaler(), GradientBoostingClassifier())
+            gridSearch = GridSearchCV(estimator=self.trainingPipeline, param_grid=self.parameterGrid, 
+                                      cv=5, n_jobs=-1, scoring='precision_macro')
+            self.model = gridSearch.fit(self.xTrain, self.yTrain).best_estimator_
+            self.bestParams, self.cvScore = gridSearch.best_params_, gridSearch.best_score_
+        else:
+            modelSearch = ModelSearch(self.parameterGrid, cacheDir = self.searchCacheDir, featureTransformer = featureTransformer,
+                                      executor = executor)
+            self.model = modelSearch.fit(self.xTrain, self.yTrain).bestEstimator
+            self.bestParams, self.cvScore = modelSearch.bestParams, modelSearch.bestScore
+
+        self.trainingTime = time.perf_counter() - startTime
+
         with open(self.modelPath, 'wb') as f:
             pickle.dump(self.model, f)
 
-    def evaluateModel(self):
-        yPreds = self.model.predict(self.xTest)
-        return precision_score(self.yTest, yPreds, average='macro', labels=['up', 'down'])
\ No newline at end of file
+    def incrementalModel(self, epochs = 5):
+        transformer = self.featureTransformer()
+        features = (lambda x: x) if transformer is None else transformer.transform
+        if transformer is not None:
+            transformer.fit(np.zeros((1, len(self.columns)), dtype = np.float32))
+
+        scaler = StandardScaler()
+        classifier = SGDClassifier(loss = 'log_loss', alpha = 1e-4, average = True, random_state = 10)
+        rng = np.random.default_rng(10)
+
+        ## Only one chunk is ever in memory: a first pass learns the scaling and the label set, then each epoch streams
+        ## the training sessions through partial_fit again, shuffled within the chunk since sessions are in time order
+        labels = set()
+        for x, y in self.sessionChunks(isTest = False):
+            scaler.partial_fit(features(x))
+            labels.update(y.tolist())
+        classes = np.array(sorted(labels))
+
+        for _ in range(epochs):
+            for x, y in self.sessionChunks(isTest = False):
+                order = rng.permutation(len(x))
+                classifier.partial_fit(scaler.transform(features(x[order])), y[order], classes = classes)
+
+        self.bestParams = {'loss': classifier.loss, 'alpha': classifier.alpha, 'epochs': epochs, 'chunkSize': self.chunkSize}
+        self.cvScore = None
+
+        return make_pipeline(*([] if transformer is None else [transformer]), scaler, classifier)
+
+    def loadModel(self):
+        with open(self.modelPath, 'rb') as f:
+            self.model = pickle.load(f)
+        return self.model
+
+    def evaluateModel(self, model = None):
+        model = self.model if model is None else model
+
+        if self.xTest is not None:
+            yPreds = model.predict(self.xTest)
+            return precision_score(self.yTest, yPreds, average='macro', labels=['up', 'down'])
+
+        ## Streamed test sessions only need per label hit and prediction counts for the same macro precision
+        labels = np.array(['up', 'down'])
+        hits, predicted = np.zeros(len(labels)), np.zeros(len(labels))
+
+        for x, y in self.sessionChunks(isTest = True):
+            isPredicted = model.predict(x)[:, None] == labels
+            hits += (isPredicted & (y[:, None] == labels)).sum(axis = 0)
+            predicted += isPredicted.sum(axis = 0)
+
+        return float(np.mean(np.divide(hits, predicted, out = np.zeros_like(hits), where = predicted > 0)))
+
+    def manifest(self):
+        return createManifest(self.dataPath, self.featureSet, self.bestParams,
+                              {'precision': float(self.evaluateModel()),
+                               'cvPrecision': None if self.cvScore is None else float(self.cvScore),
+                               'trainingSeconds': self.trainingTime}, self.parameterGrid, self.isIncremental)
+
+    def featureSteps(self, featureSet):
+        return [FunctionTransformer(PoseFeatures.transform)] if featureSet == 'pose' else []
+
+    def requireRows(self, action):
+        if self.xTrain is None:
+            raise ValueError(f'{action} needs the training rows in memory, which an incremental trainer never loads; '
+                             f'construct the trainer with isIncremental = False')
+
+    def studentCandidates(self, teacher, x, featureSet, copies, jitter):
+        ## Students learn the teacher's answers rather than the hand labels, on the training rows plus jittered copies
+        ## of them so they also see how the teacher behaves around each labelled pose
+        rows = x.to_numpy(dtype = np.float64)
+        noise = np.random.default_rng(10).normal(0.0, jitter, (copies,) + rows.shape) * rows.std(axis = 0)
+        xDistil = pd.DataFrame(np.concatenate([rows, *(rows + noise)]), columns = self.columns)
+        yDistil = teacher.predict(xDistil)
+
+        candidates = {'teacher': teacher}
+        ## A teacher from the incremental learner is already linear and has no stages to prune
+        stageCount = getattr(teacher.steps[-1][1], 'estimators_', np.empty(0)).shape[0]
+
+        for stages in sorted({stageCount // 4, stageCount // 10}, reverse = True):
+            if 5 <= stages < stageCount:
+                candidates[f'pruned{stages}'] = prunedPipeline(teacher, stages)
+
+        for depth, stages in ((3, 20), (2, 30), (1, 50)):
+            booster = GradientBoostingClassifier(n_estimators = stages, max_depth = depth, learning_rate = 0.2,
+                                                 random_state = 10)
+            candidates[f'boosted{depth}x{stages}'] = make_pipeline(*self.featureSteps(featureSet), StandardScaler(),
+                                                                   booster).fit(xDistil, yDistil)
+
+        ## A linear model needs the joint angles to separate the phases, so it is also tried on pose features
+        for linearFeatureSet in dict.fromkeys((featureSet, 'pose')):
+            candidates[f'logistic-{linearFeatureSet}'] = make_pipeline(*self.featureSteps(linearFeatureSet), StandardScaler(),
+                                                                       LogisticRegression(max_iter = 1000)).fit(xDistil, yDistil)
+
+        return candidates
+
+    def crossValidatedPrecision(self, teacher, featureSet, copies, jitter, folds = 5):
+        ## The held out rows are too few to tell the students apart, so every candidate is also rebuilt on each fold of
+        ## all the rows, from a teacher refitted on that fold, and scored on what the fold left out. Folds are contiguous
+        ## stretches of the sessions so near-identical neighbouring frames don't sit on both sides
+        x, y = self.readRows()
+        predictions = {}
+
+        for trainIndex, testIndex in KFold(folds).split(x):
+            foldTeacher = clone(teacher).fit(x.iloc[trainIndex], y.iloc[trainIndex])
+            for name, pipeline in self.studentCandidates(foldTeacher, x.iloc[trainIndex], featureSet, copies, jitter).items():
+                predictions.setdefault(name, np.empty(len(x), dtype = object))[testIndex] = pipeline.predict(x.iloc[testIndex])
+
+        return {name: float(precision_score(y, yPred, average = 'macro', labels = ['up', 'down']))
+                for name, yPred in predictions.items()}, len(x)
+
+    def distilStudents(self, directory = studentDir, copies = 4, jitter = 0.02, repeats = 500):
+        self.requireRows('distilStudents')
+        teacher = self.model if getattr(self, 'model', None) is not None else self.loadModel()
+        featureSet = CompiledExerciseModel.fromPipeline(teacher).featureSet
+
+        candidates = self.studentCandidates(teacher, self.xTrain, featureSet, copies, jitter)
+        cvPrecision, cvRows = self.crossValidatedPrecision(teacher, featureSet, copies, jitter)
+
+        os.makedirs(directory, exist_ok = True)
+        testRows = self.xTest.to_numpy(dtype = np.float32)
+        teacherPredictions = teacher.predict(self.xTest)
+        teacherPrecision = float(self.evaluateModel(teacher))
+        students = []
+
+        for name, pipeline in candidates.items():
+            model = CompiledExerciseModel.fromPipeline(pipeline)
+            artifact = studentPath(self.modelPath, name, directory)
+            model.save(artifact, student = name, teacher = self.modelPath)
+
+            startTime = time.perf_counter()
+            for i in range(repeats):
+                model.predict_with_proba(testRows[i % len(testRows)])
+            frameTime = (time.perf_counter() - startTime) / repeats
+
+            precision = float(self.evaluateModel(pipeline))
+            students.append({
+                'student': name,
+                'featureSet': model.featureSet,
+                'precision': precision,
+                'precisionDrop': teacherPrecision - precision,
+                'cvPrecision': cvPrecision[name],
+                'cvPrecisionDrop': cvPrecision['teacher'] - cvPrecision[name],
+                'agreement': float((pipeline.predict(self.xTest) == teacherPredictions).mean()),
+                'frameMs': frameTime * 1000,
+                'bytes': os.path.getsize(artifact),
+                'artifact': artifact,
+            })
+
+        report = {'teacher': self.modelPath, 'source': ModelRegistry().sourceHash(self.modelPath),
+                  'teacherPrecision': teacherPrecision, 'teacherCVPrecision': cvPrecision['teacher'], 'cvRows': cvRows,
+                  'students': students}
+
+        reportPath = studentPath(self.modelPath, directory = directory)
+        with open(reportPath + '.tmp', 'w') as f:
+            json.dump(report, f, indent = 1)
+        os.replace(reportPath + '.tmp', reportPath)
+
+        return report
+
+def splitSessions(sessions, testFraction, root = '.'):
+    ## Whole sessions go to one side by a hash of their path under the data root, so one lifter's frames never straddle
+    ## the split, adding sessions later doesn't reshuffle the ones already assigned, and same-named files in different
+    ## folders (lifterA/day1.csv, lifterB/day1.csv) are split independently
+    names = [os.path.relpath(path, root).replace(os.sep, '/') for path in sessions]
+    isTest = [int(hashlib.sha256(name.encode()).hexdigest()[:8], 16) / 0xffffffff < testFraction for name in names]
+
+    if len(sessions) > 1 and not any(isTest):
+        isTest[-1] = True
+    if len(sessions) > 1 and all(isTest):
+        isTest[0] = False
+
+    return [path for path, test in zip(sessions, isTest) if test]
+
+def prunedPipeline(pipeline, stages):
+    ## Each boosting stage corrects the ones before it, so the first stages alone are a coarser copy of the same model
+    pruned = copy.deepcopy(pipeline)
+    booster = pruned.steps[-1][1]
+    booster.estimators_ = booster.estimators_[:stages]
+    booster.train_score_ = booster.train_score_[:stages]
+    booster.n_estimators = booster.n_estimators_ = stages
+    return pruned
+
+def compareFeatureSets(dataPath, featureSets = ('raw', 'pose'), repeats = 500, **trainerOptions):
+    report = []
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for featureSet in featureSets:
+            trainer = ExerciseModelTrainer(dataPath, os.path.join(tmpDir, f'{featureSet}.pkl'), featureSet, **trainerOptions)
+            trainer.requireRows('compareFeatureSets')
+            trainer.constructPipeline()
+
+            model = CompiledExerciseModel.fromPipeline(trainer.model)
+            rows = trainer.xTest.to_numpy(dtype = np.float32)
+
+            startTime = time.perf_counter()
+            for i in range(repeats):
+                model.predict_with_proba(rows[i % len(rows)])
+            frameTime = (time.perf_counter() - startTime) / repeats
+
+            report.append({
+                'featureSet': featureSet,
+                'inputs': trainer.model.steps[-1][1].n_features_in_,
+                'nodes': len(model.feature),
+                'precision': trainer.evaluateModel(),
+                'frameMs': frameTime * 1000,
+                'trainingSeconds': trainer.trainingTime,
+            })
+
+    return report
@@ -0,0 +1,362 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from FrameBufferPool import FrameBufferPool
+from PoseEstimator import PoseEstimator
+from RepCounter import RepCounter
+from StageMetrics import StageMetrics
+
+class FrameQueue:
+    def __init__(self, maxSize, dropOldest = True, onDrop = None):
+        self.maxSize = maxSize
+        self.dropOldest = dropOldest
+        self.onDrop = onDrop
+        self.items = deque()
+        self.condition = threading.Condition()
+        self.isClosed = False
+        self.droppedCount = 0
+
+    def put(self, item):
+        with self.condition:
+            while len(self.items) >= self.maxSize and not self.isClosed:
+                if self.dropOldest:
+                    dropped = self.items.popleft()
+                    self.droppedCount += 1
+                    if self.onDrop is not None:
+                        self.onDrop(dropped)
+                else:
+                    self.condition.wait()
+
+            if self.isClosed:
+                return False
+
+            self.items.append(item)
+            self.condition.notify_all()
+            return True
+
+    def get(self, timeout = None):
+        with self.condition:
+            if not self.items and not self.isClosed:
+                self.condition.wait_for(lambda: self.items or self.isClosed, timeout)
+
+            if not self.items:
+                return None
+
+            item = self.items.popleft()
+            self.condition.notify_all()
+            return item
+
+    def close(self):
+        with self.condition:
+            self.isClosed = True
+            self.condition.notify_all()
+
+    def isFinished(self):
+        with self.condition:
+            return self.isClosed and not self.items
+
+    def __len__(self):
+        with self.condition:
+            return len(self.items)
+
+class PipelineFrame:
+    def __init__(self, index, timestamp, frame):
+        self.index = index
+        self.timestamp = timestamp
+        self.frame = frame
+        self.buffers = []
+        self.image = None
+        self.landmarks = None
+        self.roi = None
+        self.scale = 1.0
+        self.movementPhaseClass = None
+        self.movementPhaseProbability = None
+        self.movementPhase = ''
+        self.repCount = 0
+        self.exerciseKey = None
+
+class ExercisePipeline:
+    def __init__(self, source, model = None, poseEstimator = None, renderer = None, frameSize = None,
+                 isRGBOutput = False, queueSize = 2, dropOldest = None, metrics = None, bufferPool = None,
+                 journal = None):
+        self.source = source
+        self.model = model
+        self.poseEstimator = poseEstimator if poseEstimator is not None else PoseEstimator()
+        self.renderer = renderer
+        self.frameSize = frameSize
+        self.isRGBOutput = isRGBOutput
+        self.repCounter = RepCounter()
+        self.exerciseKey = None
+        self.metrics = metrics if metrics is not None else StageMetrics()
+        self.journal = journal
+
+        ## Each frame owns the pooled buffers it was decoded and converted into, they go back to the pool when the
+        ## frame is dropped or the consumer moves on to the next result
+        self.bufferPool = bufferPool if bufferPool is not None else FrameBufferPool()
+        self.consumerFrame = None
+
+        ## Live cameras drop their oldest frame so capture never backs up, recorded files keep every frame
+        if dropOldest is None:
+            dropOldest = isinstance(source, int)
+
+        onDrop = self.dropFrame
+        self.captureQueue = FrameQueue(queueSize, dropOldest, onDrop)
+        self.poseQueue = FrameQueue(queueSize, dropOldest, onDrop)
+        self.classifyQueue = FrameQueue(queueSize, dropOldest, onDrop)
+        self.resultQueue = FrameQueue(queueSize, dropOldest, onDrop)
+
+        self.cap = None
+        self.isOwnCapture = False
+        self.threads = []
+        self.stopEvent = threading.Event()
+        self.resultCount = 0
+        self.startTime = None
+
+    def start(self):
+        if hasattr(self.source, 'read'):
+            self.cap = self.source
+        else:
+            self.cap = cv2.VideoCapture(self.source)
+            self.isOwnCapture = True
+
+        self.stopEvent.clear()
+        self.startTime = time.perf_counter()
+        self.threads = [
+            threading.Thread(target = self.captureStage, daemon = True),
+            threading.Thread(target = self.poseStage, daemon = True),
+            threading.Thread(target = self.classifyStage, daemon = True),
+            threading.Thread(target = self.renderStage, daemon = True),
+        ]
+
+        for thread in self.threads:
+            thread.start()
+
+        return self
+
+    def stop(self):
+        self.stopEvent.set()
+
+        for frameQueue in (self.captureQueue, self.poseQueue, self.classifyQueue, self.resultQueue):
+            frameQueue.close()
+
+        for thread in self.threads:
+            thread.join()
+
+        self.threads = []
+
+        ## Frames still queued at shutdown and the consumer's last result hand their buffers back
+        for frameQueue in (self.captureQueue, self.poseQueue, self.classifyQueue, self.resultQueue):
+            while len(frameQueue):
+                self.release(frameQueue.get(timeout = 0))
+
+        self.release(self.consumerFrame)
+        self.consumerFrame = None
+
+        if self.isOwnCapture and self.cap is not None:
+            self.cap.release()
+
+        self.cap = None
+
+    def setModel(self, model):
+        self.model = model
+
+    def takeBuffer(self, pipelineFrame, name, shape, dtype):
+        buffer = self.bufferPool.take(name, shape, dtype)
+        pipelineFrame.buffers.append(buffer)
+        return buffer
+
+    def releaseBuffer(self, pipelineFrame, buffer):
+        for i, owned in enumerate(pipelineFrame.buffers):
+            if owned is buffer:
+                self.bufferPool.release(pipelineFrame.buffers.pop(i))
+                return
+
+    def release(self, pipelineFrame):
+        if pipelineFrame is None:
+            return
+
+        for buffer in pipelineFrame.buffers:
+            self.bufferPool.release(buffer)
+        pipelineFrame.buffers = []
+
+    def dropFrame(self, pipelineFrame):
+        self.metrics.count('dropped')
+        self.release(pipelineFrame)
+
+    def forward(self, frameQueue, pipelineFrame):
+        if not frameQueue.put(pipelineFrame):
+            self.release(pipelineFrame)
+
+    def captureStage(self):
+        index = 0
+        buffer = None
+
+        while not self.stopEvent.is_set() and self.cap.isOpened():
+            with self.metrics.stage('capture'):
+                isReadable, frame = self.cap.read(buffer) if buffer is not None else self.cap.read()
+
+            if not isReadable:
+                ## A landmark cache only keeps a pass that reached the end of the recording
+                markEndOfStream = getattr(self.poseEstimator, 'markEndOfStream', None)
+                if markEndOfStream is not None:
+                    markEndOfStream(index)
+                break
+
+            self.metrics.count('frames')
+            pipelineFrame = PipelineFrame(index, time.perf_counter(), frame)
+
+            if frame is buffer:
+                pipelineFrame.buffers.append(buffer)
+            else:
+                self.bufferPool.release(buffer)
+
+            self.forward(self.captureQueue, pipelineFrame)
+            index += 1
+
+            ## Once the source's frame size is known the next frames are decoded straight into pooled buffers
+            buffer = self.bufferPool.like('capture', frame)
+
+        self.bufferPool.release(buffer)
+        self.captureQueue.close()
+
+    def poseStage(self):
+        try:
+            while True:
+                pipelineFrame = self.captureQueue.get()
+
+                if pipelineFrame is None:
+                    break
+
+                frame = pipelineFrame.frame
+
+                if self.frameSize is not None:
+                    resized = self.takeBuffer(pipelineFrame, 'resize',
+                                              (self.frameSize[1], self.frameSize[0]) + frame.shape[2:], frame.dtype)
+                    with self.metrics.stage('resize'):
+                        frame = cv2.resize(frame, self.frameSize, dst = resized)
+                    self.releaseBuffer(pipelineFrame, pipelineFrame.frame)
+                    pipelineFrame.frame = frame
+
+                with self.metrics.stage('cvtColor'):
+                    image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB,
+                                         dst = self.takeBuffer(pipelineFrame, 'rgb', frame.shape, frame.dtype))
+                with self.metrics.stage('pose'):
+                    pipelineFrame.landmarks = self.poseEstimator.process(image)
+
+                if pipelineFrame.landmarks is None:
+                    self.metrics.count('noPose')
+
+                if self.journal is not None:
+                    with self.metrics.stage('journal'):
+                        self.journal.append(pipelineFrame.index, pipelineFrame.timestamp, pipelineFrame.landmarks)
+
+                pipelineFrame.roi = getattr(self.poseEstimator, 'lastROI', None)
+                pipelineFrame.scale = getattr(self.poseEstimator, 'lastScale', 1.0)
+                ## Only the image passed on is kept, the other copy's buffer can take the next frame straight away
+                if self.isRGBOutput:
+                    self.releaseBuffer(pipelineFrame, frame)
+                    pipelineFrame.frame, pipelineFrame.image = None, image
+                else:
+                    self.releaseBuffer(pipelineFrame, image)
+                    pipelineFrame.image = frame
+
+                self.forward(self.poseQueue, pipelineFrame)
+        finally:
+            self.poseEstimator.close()
+            if self.journal is not None:
+                self.journal.close()
+            self.poseQueue.close()
+
+    def classifyStage(self):
+        while True:
+            pipelineFrame = self.poseQueue.get()
+
+            if pipelineFrame is None:
+                break
+
+            model = self.model
+
+            if pipelineFrame.landmarks is not None and model is not None:
+                try:
+                    with self.metrics.stage('classify'):
+                        pipelineFrame.movementPhaseClass, pipelineFrame.movementPhaseProbability = \
+                            model.predict_with_proba(pipelineFrame.landmarks)
+
+                    ## A model that recognizes the exercise may have switched lifts, reps never carry across a switch
+                    exerciseKey = getattr(model, 'exerciseKey', None)
+                    if exerciseKey != self.exerciseKey:
+                        if self.exerciseKey is not None:
+                            self.repCounter.reset()
+                        self.exerciseKey = exerciseKey
+
+                    with self.metrics.stage('repCounter'):
+                        self.repCounter.update(pipelineFrame.movementPhaseClass,
+                                               pipelineFrame.movementPhaseProbability, pipelineFrame.index)
+
+                except Exception as e:
+                    print(e)
+
+            pipelineFrame.movementPhase = self.repCounter.movementPhase
+            pipelineFrame.repCount = self.repCounter.repCount
+            pipelineFrame.exerciseKey = self.exerciseKey
+
+            self.forward(self.classifyQueue, pipelineFrame)
+
+        self.classifyQueue.close()
+
+    def renderStage(self):
+        while True:
+            pipelineFrame = self.classifyQueue.get()
+
+            if pipelineFrame is None:
+                break
+
+            if self.renderer is not None:
+                try:
+                    with self.metrics.stage('render'):
+                        pipelineFrame.image = self.renderer(pipelineFrame)
+                except Exception as e:
+                    print(e)
+
+            self.forward(self.resultQueue, pipelineFrame)
+
+        self.resultQueue.close()
+
+    def handOver(self, pipelineFrame):
+        ## The consumer owns a result until it takes the next one, only then does the previous result's image go back
+        if pipelineFrame is not None:
+            self.release(self.consumerFrame)
+            self.consumerFrame = pipelineFrame
+            self.resultCount += 1
+            self.metrics.observe('endToEnd', time.perf_counter() - pipelineFrame.timestamp)
+
+        return pipelineFrame
+
+    def poll(self):
+        return self.handOver(self.resultQueue.get(timeout = 0))
+
+    def results(self):
+        while True:
+            pipelineFrame = self.handOver(self.resultQueue.get())
+
+            if pipelineFrame is None:
+                return
+
+            yield pipelineFrame
+
+    def isFinished(self):
+        return self.resultQueue.isFinished()
+
+    def droppedCount(self):
+        return sum(frameQueue.droppedCount for frameQueue in
+                   (self.captureQueue, self.poseQueue, self.classifyQueue, self.resultQueue))
+
+    def throughput(self):
+        if self.startTime is None:
+            return 0.0
+
+        elapsed = time.perf_counter() - self.startTime
+        return self.resultCount / elapsed if elapsed > 0 else 0.0
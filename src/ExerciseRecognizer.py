@@ -0,0 +1,213 @@
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+
+from CompiledExerciseModel import CompiledExerciseModel
+from ModelRegistry import ModelRegistry, exercises, readSessions
+from MotionGate import MotionGate
+from PoseFeatures import PoseFeatures
+
+recognizerArtifact = 'models/exercise_recognizer.npz'
+
+def sessionRows(exercises = exercises):
+    return {key: readSessions(entry['data']).drop('label', axis = 1).to_numpy(dtype = np.float32)
+            for key, entry in exercises.items()}
+
+def trainRecognizer(sessions, regularization = 1.0):
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import FunctionTransformer, StandardScaler
+
+    ## Every frame of a session is labelled with its exercise, the pose features make the view and lift stand out
+    ## without the lifter's position or distance from the camera. They separate the lifts well enough that a linear
+    ## model matches boosted trees, and it costs one matrix product per frame on top of the transform
+    x = np.concatenate(list(sessions.values()))
+    y = np.concatenate([np.full(len(rows), key) for key, rows in sessions.items()])
+
+    pipeline = make_pipeline(FunctionTransformer(PoseFeatures.transform), StandardScaler(),
+                             LogisticRegression(C = regularization, max_iter = 2000))
+    return CompiledExerciseModel.fromPipeline(pipeline.fit(x, y))
+
+class ExerciseRouter:
+    def __init__(self, recognizer, modelRegistry = None, smoothing = 0.2, switchMargin = 0.2, switchFrames = 8,
+                 isGated = False):
+        self.recognizer = recognizer
+        self.modelRegistry = modelRegistry if modelRegistry is not None else ModelRegistry()
+        self.models = {key: self.modelRegistry.get(key) for key in recognizer.classes_.tolist()}
+
+        ## Each exercise keeps its own gate, so switching lifts and back still finds the cached frame of that model;
+        ## wrapping the router itself in a MotionGate would gate nothing since it isn't a tree
+        self.gates = {key: MotionGate(model) for key, model in self.models.items()} if isGated else None
+        self.keys = recognizer.classes_.tolist()
+        self.smoothing = smoothing
+        self.switchMargin = switchMargin
+        self.switchFrames = switchFrames
+        self.reset()
+
+    @classmethod
+    def load(cls, modelRegistry = None, path = recognizerArtifact, **options):
+        ## The recognizer ships as an artifact like the phase models, training it here would need sklearn at runtime
+        if not os.path.exists(path):
+            raise FileNotFoundError(f'{path} is missing, build it with: python src/ExerciseRecognizer.py --save')
+        return cls(CompiledExerciseModel.loadArtifact(path), modelRegistry, **options)
+
+    def reset(self):
+        self.scores = None
+        self.exerciseIndex = None
+        self.pendingFrames = 0
+        self.switchCount = 0
+
+    @property
+    def exerciseKey(self):
+        return None if self.exerciseIndex is None else self.keys[self.exerciseIndex]
+
+    @property
+    def classes_(self):
+        return self.models[self.exerciseKey or self.keys[0]].classes_
+
+    def observe(self, probability):
+        ## Smoothed scores with a margin and a few frames of agreement keep one odd frame from swapping the model
+        self.scores = probability if self.scores is None else \
+            (1 - self.smoothing) * self.scores + self.smoothing * probability
+        best = int(self.scores.argmax())
+
+        if self.exerciseIndex is None:
+            self.exerciseIndex = best
+        elif best != self.exerciseIndex and self.scores[best] - self.scores[self.exerciseIndex] >= self.switchMargin:
+            self.pendingFrames += 1
+            if self.pendingFrames >= self.switchFrames:
+                self.exerciseIndex, self.pendingFrames = best, 0
+                self.switchCount += 1
+        else:
+            self.pendingFrames = 0
+
+        return self.exerciseIndex
+
+    def route(self, x):
+        raw = np.asarray(x, dtype = np.float32).reshape(-1, 33 * 4)
+
+        ## The pose features are computed once and shared by the recognizer and any phase model trained on them
+        features = {'raw': raw, 'pose': PoseFeatures.transform(raw)}
+        routes = np.array([self.observe(probability) for probability in
+                           self.recognizer.predictFeatures(features['pose'])[1]])
+
+        return features, routes
+
+    def predict_with_proba(self, x):
+        isSingle = np.asarray(x).size == 33 * 4
+        features, routes = self.route(x)
+
+        if isSingle:
+            key = self.keys[routes[0]]
+            model = self.models[key]
+
+            if self.gates is not None:
+                return self.gates[key].predictRow(features[model.featureSet])
+
+            classes, proba = model.predictFeatures(features[model.featureSet])
+            return classes[0], proba[0]
+
+        return self.predictRoutes(features, routes)
+
+    def savedFraction(self):
+        ## Share of single frames across every gated model that reused the previous result
+        gates = [] if self.gates is None else self.gates.values()
+        callCount = sum(gate.callCount for gate in gates)
+        return sum(gate.reusedCount for gate in gates) / callCount if callCount else 0.0
+
+    def predictRouted(self, x):
+        ## A batch prediction plus the exercise every row was routed to, so a replay can reset reps where the lift changed
+        features, routes = self.route(x)
+        return self.predictRoutes(features, routes) + (np.array(self.keys, dtype = object)[routes],)
+
+    def predictRoutes(self, features, routes):
+        ## Only the winning phase model runs, once per distinct exercise in the batch
+        classes, proba = np.empty(len(routes), dtype = object), np.empty((len(routes), len(self.classes_)))
+
+        for index in np.unique(routes):
+            rows = np.flatnonzero(routes == index)
+            model = self.models[self.keys[index]]
+            classes[rows], proba[rows] = model.predictFeatures(features[model.featureSet][rows])
+
+        return classes, proba
+
+def evaluateRecognition(exercises = exercises, testFraction = 0.25, fps = 30.0, repeats = 300):
+    sessions = sessionRows(exercises)
+
+    ## Each session is split in time, the recognizer never sees the tail it is tested on
+    trainRows, testRows = {}, {}
+    for key, rows in sessions.items():
+        split = int(len(rows) * (1 - testFraction))
+        trainRows[key], testRows[key] = rows[:split], rows[split:]
+
+    recognizer = trainRecognizer(trainRows)
+    router = ExerciseRouter(recognizer)
+    report = {'sessions': {}, 'switches': []}
+
+    for key, rows in testRows.items():
+        frameAccuracy = float((recognizer.predict(rows) == key).mean())
+
+        router.reset()
+        routed = [router.keys[router.route(row)[1][0]] for row in rows]
+        isCorrect = np.array(routed) == key
+        firstCorrect = int(np.argmax(isCorrect)) if isCorrect.any() else None
+
+        report['sessions'][key] = {'frames': len(rows), 'frameAccuracy': frameAccuracy,
+                                   'routedAccuracy': float(isCorrect.mean()), 'lockFrames': firstCorrect,
+                                   'switches': router.switchCount}
+
+    ## Switching lifts mid-stream: how many frames after the change until the new exercise's model is in charge
+    for first, second in itertools.permutations(testRows, 2):
+        router.reset()
+        for row in testRows[first]:
+            router.route(row)
+
+        latency = None
+        for frame, row in enumerate(testRows[second]):
+            if router.keys[router.route(row)[1][0]] == second:
+                latency = frame
+                break
+
+        report['switches'].append({'from': first, 'to': second, 'latencyFrames': latency,
+                                   'latencyMs': None if latency is None else latency / fps * 1000})
+
+    ## Per-frame cost of routing against running every phase model on every frame
+    row = next(iter(testRows.values()))[0]
+    router.reset()
+    startTime = time.perf_counter()
+    for _ in range(repeats):
+        router.predict_with_proba(row)
+    report['routedFrameMs'] = (time.perf_counter() - startTime) / repeats * 1000
+
+    startTime = time.perf_counter()
+    for _ in range(repeats):
+        for model in router.models.values():
+            model.predict_with_proba(row)
+    report['allModelsFrameMs'] = (time.perf_counter() - startTime) / repeats * 1000
+
+    return report
+
+def main(argv):
+    report = evaluateRecognition()
+
+    print(f"{'session':<16}{'frames':>8}{'frame acc':>11}{'routed acc':>12}{'lock frames':>13}{'switches':>10}")
+    for key, session in report['sessions'].items():
+        print(f"{key:<16}{session['frames']:>8}{session['frameAccuracy']:>11.3f}{session['routedAccuracy']:>12.3f}"
+              f"{str(session['lockFrames']):>13}{session['switches']:>10}")
+
+    latencies = [switch['latencyFrames'] for switch in report['switches'] if switch['latencyFrames'] is not None]
+    print(f"Switch latency over {len(report['switches'])} lift changes: "
+          f"mean {np.mean(latencies) if latencies else float('nan'):.1f} frames, "
+          f"max {max(latencies) if latencies else float('nan')} frames, "
+          f"{len(report['switches']) - len(latencies)} never switched")
+    print(f"Routed frame {report['routedFrameMs']:.3f}ms vs every phase model {report['allModelsFrameMs']:.3f}ms")
+
+    if '--save' in argv:
+        trainRecognizer(sessionRows()).save(recognizerArtifact, exercise = 'recognizer')
+        print(f"Saved the recognizer trained on every session to {recognizerArtifact}")
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
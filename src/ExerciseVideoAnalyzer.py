@@ -0,0 +1,262 @@
+import csv
+import json
+import multiprocessing
+import os
+import time
+
+import cv2
+import numpy as np
+
+from CompiledExerciseModel import CompiledExerciseModel
+from ExercisePipeline import ExercisePipeline
+from LandmarkCache import LandmarkCache
+from PoseEstimator import PoseEstimator
+from RepCounter import RepCounter
+
+class ExerciseVideoAnalyzer:
+    def __init__(self, exerciseName, modelPath, inputVideo, batchSize = 64, workers = 1, warmupFrames = 30,
+                 minSegmentFrames = 300, poseEstimatorFactory = PoseEstimator):
+        self.exerciseName = exerciseName
+        self.modelPath = modelPath
+        self.inputVideo = inputVideo
+        self.batchSize = batchSize
+        self.workers = workers
+        self.warmupFrames = warmupFrames
+        self.minSegmentFrames = minSegmentFrames
+        self.poseEstimatorFactory = poseEstimatorFactory
+        self.landmarkCache = LandmarkCache()
+
+        self.detectionConfidence = 0.5
+        self.trackingConfidence = 0.5
+
+        self.frameColumns = ['frame', 'timestamp', 'detected', 'phaseClass', 'probability', 'movementPhase', 'repCount']
+
+    def analyze(self, outputPrefix):
+        cap = cv2.VideoCapture(self.inputVideo)
+        videoFPS = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        totalFrames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        outputDir = os.path.dirname(outputPrefix)
+        if outputDir:
+            os.makedirs(outputDir, exist_ok = True)
+
+        repCounter = RepCounter()
+        reps = []
+        poseEstimator = self.poseEstimatorFactory(self.detectionConfidence, self.trackingConfidence)
+        cached = self.landmarkCache.load(self.inputVideo, poseEstimator)
+
+        ## Spawning a worker and loading its pose model costs seconds, so each worker needs a long enough segment to
+        ## pay that back and short clips stay sequential
+        workers = min(self.workers, totalFrames // max(self.minSegmentFrames, 1))
+        isParallel = cached is None and workers > 1
+
+        startTime = time.perf_counter()
+
+        with open(f'{outputPrefix}_frames.csv', mode = 'w', newline = '') as f:
+            csv_writer = csv.writer(f, delimiter = ',', quotechar = '"', quoting = csv.QUOTE_MINIMAL)
+            csv_writer.writerow(self.frameColumns)
+
+            if cached is not None:
+                cap.release()
+                frameCount = self.analyzeCached(cached, repCounter, videoFPS, csv_writer, reps)
+            elif isParallel:
+                cap.release()
+                frameCount = self.analyzeSegments(totalFrames, workers, repCounter, videoFPS, csv_writer, reps,
+                                                  self.cacheWriter(poseEstimator))
+            else:
+                frameCount = self.analyzeSequential(cap, poseEstimator, repCounter, videoFPS, csv_writer, reps,
+                                                    self.cacheWriter(poseEstimator))
+
+        elapsed = time.perf_counter() - startTime
+
+        summary = {
+            'exercise': self.exerciseName,
+            'video': str(self.inputVideo),
+            'frames': frameCount,
+            'videoFPS': videoFPS,
+            'workers': workers if isParallel else 1,
+            'landmarkCache': 'hit' if cached is not None else 'miss',
+            'elapsedSeconds': elapsed,
+            'throughputFPS': frameCount / elapsed if elapsed > 0 else 0.0,
+            'repCount': repCounter.repCount,
+            'reps': reps,
+        }
+
+        with open(f'{outputPrefix}_reps.json', 'w') as f:
+            json.dump(summary, f, indent = 2)
+
+        return summary
+
+    def cacheWriter(self, poseEstimator):
+        if not isinstance(self.inputVideo, str) or not os.path.exists(self.inputVideo):
+            return None
+        return self.landmarkCache.writer(self.inputVideo, poseEstimator)
+
+    def analyzeCached(self, cached, repCounter, videoFPS, csv_writer, reps):
+        model = CompiledExerciseModel.load(self.modelPath)
+        landmarks, detected = cached
+        chunkSize = max(self.batchSize, 4096)
+
+        for start in range(0, len(detected), chunkSize):
+            chunkDetected = np.array(detected[start:start + chunkSize])
+            chunkLandmarks = landmarks[start:start + chunkSize][chunkDetected]
+            classes, probabilities = classifyLandmarks(model, chunkLandmarks)
+
+            self.recordFrames(repCounter, start, chunkDetected, classes, probabilities, videoFPS, csv_writer, reps)
+
+        return len(detected)
+
+    def analyzeSequential(self, cap, poseEstimator, repCounter, videoFPS, csv_writer, reps, writer):
+        model = CompiledExerciseModel.load(self.modelPath)
+        pipeline = ExercisePipeline(cap, None, poseEstimator, dropOldest = False)
+        frameCount = 0
+        pending = []
+        detectedCount = 0
+
+        pipeline.start()
+
+        try:
+            for result in pipeline.results():
+                pending.append((result.index, result.landmarks))
+                frameCount += 1
+
+                if writer is not None:
+                    writer.append(result.landmarks)
+
+                if result.landmarks is not None:
+                    detectedCount += 1
+
+                if detectedCount >= self.batchSize:
+                    self.classifyBatch(model, repCounter, pending, videoFPS, csv_writer, reps)
+                    pending, detectedCount = [], 0
+
+            self.classifyBatch(model, repCounter, pending, videoFPS, csv_writer, reps)
+        except BaseException:
+            if writer is not None:
+                writer.discard()
+            raise
+        finally:
+            pipeline.stop()
+            cap.release()
+
+        if writer is not None:
+            writer.commit()
+
+        return frameCount
+
+    def analyzeSegments(self, totalFrames, workers, repCounter, videoFPS, csv_writer, reps, writer):
+        bounds = np.linspace(0, totalFrames, workers + 1).astype(int)
+        segments = [(self.modelPath, self.inputVideo, int(bounds[i]), int(bounds[i + 1]) if i < workers - 1 else None,
+                     self.warmupFrames, self.detectionConfidence, self.trackingConfidence, self.poseEstimatorFactory)
+                    for i in range(workers)]
+
+        frameCount = 0
+
+        ## Workers only produce per-frame landmarks and phases; the rep state machine runs here over the stitched
+        ## stream so its state carries across segment boundaries exactly as in a sequential run
+        with multiprocessing.get_context('spawn').Pool(self.workers) as pool:
+            try:
+                for startFrame, detected, landmarks, classes, probabilities in pool.imap(analyzeSegment, segments):
+                    ## CAP_PROP_FRAME_COUNT can overestimate, so the video may end before the last segments start;
+                    ## those read nothing and the stream is clamped to the frames actually read
+                    if startFrame > frameCount and len(detected) == 0:
+                        continue
+
+                    if startFrame != frameCount:
+                        raise RuntimeError(f'Segment starting at frame {startFrame} does not follow frame {frameCount}')
+
+                    self.recordFrames(repCounter, startFrame, detected, classes, probabilities, videoFPS, csv_writer, reps)
+                    frameCount += len(detected)
+
+                    if writer is not None:
+                        rows = iter(landmarks)
+                        for isDetected in detected.tolist():
+                            writer.append(next(rows) if isDetected else None)
+            except BaseException:
+                if writer is not None:
+                    writer.discard()
+                raise
+
+        if writer is not None:
+            writer.commit()
+
+        return frameCount
+
+    def classifyBatch(self, model, repCounter, pending, videoFPS, csv_writer, reps):
+        if not pending:
+            return
+
+        detected = np.array([landmarks is not None for _, landmarks in pending])
+        classes, probabilities = classifyLandmarks(model, [landmarks for _, landmarks in pending if landmarks is not None])
+
+        self.recordFrames(repCounter, pending[0][0], detected, classes, probabilities, videoFPS, csv_writer, reps)
+
+    def recordFrames(self, repCounter, startFrame, detected, classes, probabilities, videoFPS, csv_writer, reps):
+        rows = []
+        detectedIndex = 0
+
+        for frameIndex, isDetected in enumerate(detected.tolist(), start = startFrame):
+            phaseClass, probability = '', ''
+
+            if isDetected:
+                phaseClass = classes[detectedIndex]
+                phaseProbability = probabilities[detectedIndex]
+                probability = float(phaseProbability.max())
+                detectedIndex += 1
+
+                repCounter.update(phaseClass, phaseProbability, frameIndex)
+
+                if repCounter.completedRep is not None:
+                    rep, repStartFrame, repEndFrame = repCounter.completedRep
+                    reps.append({
+                        'rep': rep,
+                        'startFrame': repStartFrame,
+                        'startTime': repStartFrame / videoFPS,
+                        'endFrame': repEndFrame,
+                        'endTime': repEndFrame / videoFPS,
+                    })
+
+            rows.append([frameIndex, frameIndex / videoFPS, int(isDetected), phaseClass, probability,
+                         repCounter.movementPhase, repCounter.repCount])
+
+        csv_writer.writerows(rows)
+
+def classifyLandmarks(model, landmarks):
+    if len(landmarks) == 0:
+        return np.empty(0, dtype = object), np.empty((0, len(model.classes_)))
+
+    return model.predict_with_proba(np.reshape(landmarks, (len(landmarks), -1)))
+
+def analyzeSegment(segment):
+    modelPath, inputVideo, startFrame, endFrame, warmupFrames, detectionConfidence, trackingConfidence, poseEstimatorFactory = segment
+
+    model = CompiledExerciseModel.load(modelPath)
+    cap = cv2.VideoCapture(inputVideo)
+
+    ## Start a little early so the tracker has settled by the first frame of the segment
+    frameIndex = max(0, startFrame - warmupFrames)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frameIndex)
+
+    detected = []
+    landmarks = []
+
+    with poseEstimatorFactory(detectionConfidence, trackingConfidence) as pose:
+        while endFrame is None or frameIndex < endFrame:
+            isReadable, frame = cap.read()
+
+            if not isReadable:
+                break
+
+            frameLandmarks = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+            if frameIndex >= startFrame:
+                detected.append(frameLandmarks is not None)
+                if frameLandmarks is not None:
+                    landmarks.append(frameLandmarks)
+
+            frameIndex += 1
+
+    cap.release()
+
+    classes, probabilities = classifyLandmarks(model, landmarks)
+    return startFrame, np.array(detected, dtype = bool), landmarks, classes, probabilities
@@ -0,0 +1,68 @@
+import threading
+
+import numpy as np
+
+class FrameBufferPool:
+    def __init__(self, isEnabled = True):
+        self.isEnabled = isEnabled
+        self.free = {}
+        self.buffers = {}
+        self.inUse = set()
+        self.lock = threading.Lock()
+
+        self.takeCount = 0
+        self.allocationCount = 0
+        self.allocatedBytes = 0
+
+    def take(self, name, shape, dtype = np.uint8):
+        ## A buffer belongs to whoever took it until it is released, so it is never handed out again while a stage or
+        ## the consumer still reads it and the pool only grows to the number of frames actually in flight
+        key = (name, tuple(shape), np.dtype(dtype).str)
+
+        with self.lock:
+            self.takeCount += 1
+
+            if not self.isEnabled:
+                return self.allocate(shape, dtype)
+
+            free = self.free.setdefault(key, [])
+            buffer = free.pop() if free else self.allocate(shape, dtype)
+
+            self.buffers[id(buffer)] = (key, buffer)
+            self.inUse.add(id(buffer))
+            return buffer
+
+    def release(self, buffer):
+        if buffer is None or not self.isEnabled:
+            return
+
+        with self.lock:
+            entry = self.buffers.get(id(buffer))
+
+            ## Arrays the pool never handed out, or a second release of the same buffer, are ignored
+            if entry is None or entry[1] is not buffer or id(buffer) not in self.inUse:
+                return
+
+            self.inUse.discard(id(buffer))
+            self.free[entry[0]].append(buffer)
+
+    def allocate(self, shape, dtype):
+        buffer = np.empty(shape, dtype = dtype)
+        self.allocationCount += 1
+        self.allocatedBytes += buffer.nbytes
+        return buffer
+
+    def like(self, name, array):
+        return self.take(name, array.shape, array.dtype)
+
+    def stats(self):
+        with self.lock:
+            return {'takes': self.takeCount, 'allocations': self.allocationCount,
+                    'allocatedBytes': self.allocatedBytes, 'inUse': len(self.inUse),
+                    'pooledBytes': sum(buffer.nbytes for _, buffer in self.buffers.values())}
+
+    def clear(self):
+        with self.lock:
+            self.free = {}
+            self.buffers = {}
+            self.inUse = set()
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+
+import mediapipe as mp
+import numpy as np
+
+class LandmarkCache:
+    def __init__(self, cacheDir = 'cache/landmarks'):
+        self.cacheDir = cacheDir
+        self.indexPath = os.path.join(cacheDir, 'index.json')
+
+    def videoHash(self, videoPath):
+        stat = os.stat(videoPath)
+        fileKey = os.path.abspath(videoPath)
+        index = self.readIndex()
+
+        ## Hashing a long recording is cheap next to pose inference but still worth skipping when it hasn't changed
+        entry = index.get(fileKey)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            return entry['hash']
+
+        digest = hashlib.sha256()
+        with open(videoPath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+
+        index[fileKey] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': digest.hexdigest()}
+        self.writeIndex(index)
+
+        return index[fileKey]['hash']
+
+    def readIndex(self):
+        try:
+            with open(self.indexPath) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def writeIndex(self, index):
+        os.makedirs(self.cacheDir, exist_ok = True)
+        tmpPath = f'{self.indexPath}.tmp'
+        with open(tmpPath, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmpPath, self.indexPath)
+
+    def key(self, videoPath, poseEstimator):
+        return (f'{self.videoHash(videoPath)[:32]}_d{poseEstimator.detectionConfidence}'
+                f'_t{poseEstimator.trackingConfidence}_m{poseEstimator.modelComplexity}_mp{mp.__version__}')
+
+    def paths(self, key):
+        base = os.path.join(self.cacheDir, key)
+        return f'{base}.landmarks.f32', f'{base}.detected.u8', f'{base}.json'
+
+    def load(self, videoPath, poseEstimator):
+        if not isinstance(videoPath, str) or not os.path.exists(videoPath):
+            return None
+
+        landmarksPath, detectedPath, metaPath = self.paths(self.key(videoPath, poseEstimator))
+
+        try:
+            with open(metaPath) as f:
+                frameCount = json.load(f)['frames']
+        except (OSError, ValueError, KeyError):
+            return None
+
+        if frameCount == 0:
+            return np.zeros((0, 33, 4), dtype = np.float32), np.zeros(0, dtype = bool)
+
+        landmarks = np.memmap(landmarksPath, dtype = np.float32, mode = 'r', shape = (frameCount, 33, 4))
+        detected = np.memmap(detectedPath, dtype = np.uint8, mode = 'r', shape = (frameCount,)).view(bool)
+        return landmarks, detected
+
+    def writer(self, videoPath, poseEstimator):
+        return LandmarkCacheWriter(*self.paths(self.key(videoPath, poseEstimator)))
+
+    def estimator(self, videoPath, poseEstimator):
+        if not isinstance(videoPath, str) or not os.path.exists(videoPath):
+            return poseEstimator
+
+        cached = self.load(videoPath, poseEstimator)
+        if cached is not None:
+            return CachedPoseEstimator(poseEstimator, *cached)
+
+        return CachedPoseEstimator(poseEstimator, writer = self.writer(videoPath, poseEstimator))
+
+class LandmarkCacheWriter:
+    def __init__(self, landmarksPath, detectedPath, metaPath):
+        self.landmarksPath = landmarksPath
+        self.detectedPath = detectedPath
+        self.metaPath = metaPath
+        self.frameCount = 0
+        self.emptyRow = np.zeros((33, 4), dtype = np.float32)
+
+        os.makedirs(os.path.dirname(metaPath), exist_ok = True)
+        self.landmarksFile = open(f'{landmarksPath}.tmp', 'wb')
+        self.detectedFile = open(f'{detectedPath}.tmp', 'wb')
+
+    def append(self, landmarks):
+        if landmarks is None:
+            self.landmarksFile.write(self.emptyRow.tobytes())
+            self.detectedFile.write(b'\x00')
+        else:
+            self.landmarksFile.write(np.ascontiguousarray(landmarks, dtype = np.float32).tobytes())
+            self.detectedFile.write(b'\x01')
+
+        self.frameCount += 1
+
+    def commit(self):
+        self.landmarksFile.close()
+        self.detectedFile.close()
+
+        os.replace(f'{self.landmarksPath}.tmp', self.landmarksPath)
+        os.replace(f'{self.detectedPath}.tmp', self.detectedPath)
+
+        ## The metadata file is written last so a half-written entry is never picked up by load
+        with open(f'{self.metaPath}.tmp', 'w') as f:
+            json.dump({'frames': self.frameCount}, f)
+        os.replace(f'{self.metaPath}.tmp', self.metaPath)
+
+    def discard(self):
+        self.landmarksFile.close()
+        self.detectedFile.close()
+
+        for path in (self.landmarksPath, self.detectedPath):
+            if os.path.exists(f'{path}.tmp'):
+                os.remove(f'{path}.tmp')
+
+class CachedPoseEstimator:
+    def __init__(self, poseEstimator, landmarks = None, detected = None, writer = None):
+        self.poseEstimator = poseEstimator
+        self.landmarks = landmarks
+        self.detected = detected
+        self.writer = writer
+        self.capturedFrames = None
+        self.frameIndex = 0
+
+        self.detectionConfidence = poseEstimator.detectionConfidence
+        self.trackingConfidence = poseEstimator.trackingConfidence
+        self.modelComplexity = poseEstimator.modelComplexity
+
+    def isCached(self):
+        return self.landmarks is not None
+
+    def open(self):
+        return self
+
+    def markEndOfStream(self, frameCount):
+        ## Called by the reader once the capture ran dry, container frame counts are only estimates for many codecs
+        self.capturedFrames = frameCount
+
+    def process(self, image):
+        frameIndex = self.frameIndex
+        self.frameIndex += 1
+
+        if self.landmarks is not None:
+            if frameIndex < len(self.detected) and self.detected[frameIndex]:
+                return np.array(self.landmarks[frameIndex])
+            return None
+
+        landmarks = self.poseEstimator.process(image)
+
+        if self.writer is not None:
+            self.writer.append(landmarks)
+
+        return landmarks
+
+    def close(self):
+        ## Only a pass that read the recording to its end and saw every frame is kept, an early quit or dropped frames
+        ## leave the cache untouched
+        if self.writer is not None:
+            if self.capturedFrames is not None and self.writer.frameCount == self.capturedFrames:
+                self.writer.commit()
+            else:
+                self.writer.discard()
+            self.writer = None
+
+        self.poseEstimator.close()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,7 +1,17 @@
+import sys
+import time
+
+startTime = time.perf_counter()
+
 from PowerBuilderGUI import PowerBuilderGUI
+from StageMetrics import StageMetrics
+from StartupTimer import StartupTimer
 
 def main():
-    PowerBuilderGUI()
+    startupTimer = StartupTimer(startTime, isReporting='--startup-report' in sys.argv)
+    startupTimer.record('import gui', startTime, time.perf_counter() - startTime)
+    journalDir = sys.argv[sys.argv.index('--journal') + 1] if '--journal' in sys.argv else None
+    PowerBuilderGUI(startupTimer, StageMetrics.fromArgs(sys.argv).start(), journalDir)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import sys
+import time
+from functools import lru_cache
+from importlib import metadata
+
+from CompiledExerciseModel import CompiledExerciseModel
+from ModelRegistry import ModelRegistry, exercises, sessionFiles
+
+parameterGrid = {
+    'gradientboostingclassifier__n_estimators': [50, 100, 200],
+    'gradientboostingclassifier__learning_rate': [0.01, 0.1, 0.2],
+    'gradientboostingclassifier__max_depth': [3, 5, 7],
+}
+
+## A model trained under other versions of these can score differently, so a version change makes it stale; only
+## major.minor is kept, patch releases don't change how models train. The interpreter is left out: it doesn't change
+## what these libraries compute, and keying on it would mark every model stale on any other Python
+libraries = ('scikit-learn', 'numpy', 'pandas')
+
+def majorMinor(version):
+    return '.'.join(version.split('.')[:2])
+
+## Looking packages up costs milliseconds and they can't change under a running process
+@lru_cache(maxsize = None)
+def libraryVersions():
+    versions = {}
+
+    for name in libraries:
+        try:
+            versions[name] = majorMinor(metadata.version(name))
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+
+    return versions
+
+def fileFingerprint(path, previous = None):
+    stat = os.stat(path)
+
+    ## An unchanged size and mtime means the recorded hash still holds, which keeps up to date checks in milliseconds
+    if previous and previous.get('size') == stat.st_size and previous.get('mtime') == stat.st_mtime_ns:
+        return {'size': previous['size'], 'mtime': previous['mtime'], 'sha256': previous['sha256']}
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+
+def dataFingerprint(path, previous = None):
+    files = sessionFiles(path)
+
+    if files == [path]:
+        return fileFingerprint(path, previous)
+
+    ## A session directory or glob hashes each file once and then only the list of hashes, so adding one session
+    ## costs one file's hash
+    previousFiles = (previous or {}).get('files', {})
+    fingerprints = {file: fileFingerprint(file, previousFiles.get(file)) for file in files}
+    digest = hashlib.sha256(json.dumps([(file, fingerprint['sha256']) for file, fingerprint in fingerprints.items()]).encode())
+
+    return {'files': fingerprints, 'sha256': digest.hexdigest()}
+
+def createManifest(dataPath, featureSet, bestParams, scores, grid = parameterGrid, isIncremental = False):
+    return {
+        'data': dict(dataFingerprint(dataPath), path = dataPath),
+        'featureSet': featureSet,
+        'isIncremental': isIncremental,
+        'parameterGrid': json.loads(json.dumps(grid)),
+        'bestParams': json.loads(json.dumps(bestParams)),
+        'libraries': dict(libraryVersions()),
+        'scores': scores,
+        'trainedAt': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+def readManifest(artifactPath):
+    try:
+        return CompiledExerciseModel.artifactMetadata(artifactPath).get('manifest')
+    except (OSError, ValueError, KeyError):
+        return None
+
+def staleReasons(key, featureSet = None, exercises = exercises, grid = parameterGrid, modelRegistry = None):
+    entry = exercises[key]
+
+    if not os.path.exists(entry['artifact']):
+        return ['no artifact']
+
+    manifest = readManifest(entry['artifact'])
+    if manifest is None:
+        return ['no manifest']
+
+    reasons = []
+
+    ## A model trained on other data than the registry's, or by the incremental learner, is checked against what it
+    ## was actually trained on
+    dataPath = manifest.get('data', {}).get('path', entry['data'])
+    files = sessionFiles(dataPath)
+
+    if not files or not all(map(os.path.exists, files)):
+        reasons.append('training data missing')
+    elif dataFingerprint(dataPath, manifest.get('data'))['sha256'] != manifest.get('data', {}).get('sha256'):
+        reasons.append('training data changed')
+
+    if featureSet is not None and manifest.get('featureSet') != featureSet:
+        reasons.append(f"feature set {manifest.get('featureSet')} -> {featureSet}")
+    if not manifest.get('isIncremental') and manifest.get('parameterGrid') != json.loads(json.dumps(grid)):
+        reasons.append('hyperparameter grid changed')
+    if manifest.get('libraries') != libraryVersions():
+        reasons.append('library versions changed')
+
+    modelRegistry = modelRegistry if modelRegistry is not None else ModelRegistry(exercises = exercises)
+    if not modelRegistry.isArtifactCurrent(key):
+        reasons.append('artifact does not match the pickled model')
+
+    return reasons
+
+def build(keys = None, force = False, featureSet = None, workers = None, isDryRun = False, exercises = exercises):
+    startTime = time.perf_counter()
+    keys = list(exercises if keys is None else keys)
+
+    stale = {key: ['forced'] if force else staleReasons(key, featureSet, exercises) for key in keys}
+    stale = {key: reasons for key, reasons in stale.items() if reasons}
+
+    for key in keys:
+        print(f"{key}: {'stale (' + ', '.join(stale[key]) + ')' if key in stale else 'up to date'}", flush = True)
+
+    report = {'stale': stale, 'checkSeconds': time.perf_counter() - startTime, 'training': None}
+
+    if not stale or isDryRun:
+        return report
+
+    ## Only the stale models are trained, each keeps its previous data, training mode and feature set unless a feature
+    ## set was asked for
+    from TrainingScheduler import TrainingScheduler
+
+    manifests = {key: readManifest(exercises[key]['artifact']) or {} for key in stale}
+    featureSets = {key: featureSet or manifests[key].get('featureSet') or 'raw' for key in stale}
+    trainerOptions = {key: {'dataPath': manifests[key].get('data', {}).get('path', exercises[key]['data']),
+                            'isIncremental': manifests[key].get('isIncremental', False)} for key in stale}
+
+    report['training'] = TrainingScheduler(workers, exercises = exercises).trainAll(list(stale), featureSets, trainerOptions)
+    return report
+
+def backfill(keys = None, exercises = exercises):
+    from ExerciseModelTrainer import ExerciseModelTrainer
+
+    backfilled = []
+
+    ## Artifacts exported before manifests existed get one describing the pickle they came from, without retraining
+    for key in (exercises if keys is None else keys):
+        entry = exercises[key]
+        if readManifest(entry['artifact']) is not None:
+            continue
+
+        trainer = ExerciseModelTrainer(entry['data'], entry['model'])
+        pipeline = trainer.loadModel()
+        trainer.featureSet = CompiledExerciseModel.fromPipeline(pipeline).featureSet
+        trainer.bestParams = {name: pipeline.get_params()[name] for name in parameterGrid}
+
+        ModelRegistry(exercises = exercises).exportArtifact(key, manifest = trainer.manifest())
+        backfilled.append(key)
+
+    return backfilled
+
+def main(argv):
+    def option(name, default):
+        return argv[argv.index(name) + 1] if name in argv else default
+
+    if '--backfill' in argv:
+        print(f"Backfilled manifests for: {', '.join(backfill()) or 'none'}")
+        return
+
+    workers = option('--workers', None)
+    report = build(force = '--force' in argv, featureSet = option('--features', None),
+                   workers = int(workers) if workers else None, isDryRun = '--dry-run' in argv)
+
+    if report['training'] is None:
+        print(f"Checked {len(exercises)} models in {report['checkSeconds'] * 1000:.1f}ms, {len(report['stale'])} stale")
+    else:
+        print(f"Rebuilt {len(report['training']['models'])} stale models in {report['training']['elapsedSeconds']:.1f}s")
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
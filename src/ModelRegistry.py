@@ -0,0 +1,183 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from CompiledExerciseModel import CompiledExerciseModel
+
+## FV: Front View
+## SV: Side View
+
+exercises = {
+    'deadlift_FV' : {'video': 'private/videos/deadlift_FV_updown.mp4',
+                      'data': 'data/deadlift_FV_updown.csv',
+                      'model': 'models/deadlift_FV_updown.pkl',
+                      'artifact': 'models/deadlift_FV_updown.npz'},
+
+    'squat_FV' : {'video': 'private/videos/squat_FV.mp4',
+            'data': 'data/squat_FV.csv',
+            'model': 'models/squat_FV.pkl',
+            'artifact': 'models/squat_FV.npz'},
+
+    'squat_SV' : {'video': 'private/videos/squat_SV.mp4',
+            'data': 'data/squat_SV.csv',
+            'model': 'models/squat_SV.pkl',
+            'artifact': 'models/squat_SV.npz'},
+
+    'benchpress_FV' : {'video': 'private/videos/benchpress_FV.mp4',
+                'data': 'data/benchpress_FV.csv',
+                'model': 'models/benchpress_FV.pkl',
+                'artifact': 'models/benchpress_FV.npz'}
+        }
+
+studentDir = 'models/students'
+
+def sessionFiles(dataPath):
+    ## Training data is one CSV, a directory of session CSVs or a glob of them
+    if os.path.isdir(dataPath):
+        return sorted(glob.glob(os.path.join(dataPath, '*.csv')))
+    return sorted(glob.glob(dataPath)) if glob.has_magic(dataPath) else [dataPath]
+
+def dataRoot(dataPath):
+    ## The directory sessionFiles searches from: the directory itself, the part of a glob before its first wildcard,
+    ## or the folder of a single file
+    if os.path.isdir(dataPath):
+        return dataPath
+    if not glob.has_magic(dataPath):
+        return os.path.dirname(dataPath) or '.'
+
+    parts = []
+    for part in dataPath.replace(os.sep, '/').split('/'):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return '/'.join(parts) or '.'
+
+def readSessions(dataPath):
+    import pandas as pd
+
+    ## Every session of a data path as one frame, in file order
+    return pd.concat([pd.read_csv(path) for path in sessionFiles(dataPath)], ignore_index = True)
+
+def studentPath(modelPath, student = None, directory = studentDir):
+    ## A model's students and their trade-off report sit next to each other, named after the teacher's pickle
+    name = os.path.splitext(os.path.basename(modelPath))[0]
+    return os.path.join(directory, f'{name}.json' if student is None else f'{name}.{student}.npz')
+
+class ModelRegistry:
+    def __init__(self, capacity = 4, exercises = exercises, precisionTolerance = None, minStudentRows = 200,
+                 studentDirectory = studentDir):
+        self.capacity = capacity
+        self.exercises = exercises
+        self.precisionTolerance = precisionTolerance
+        self.minStudentRows = minStudentRows
+        self.studentDirectory = studentDirectory
+        self.cache = OrderedDict()
+        self.lock = threading.RLock()
+
+    def sourceHash(self, path):
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def isArtifactCurrent(self, key):
+        entry = self.exercises[key]
+
+        if not os.path.exists(entry['artifact']):
+            return False
+
+        if not os.path.exists(entry['model']):
+            return True
+
+        try:
+            metadata = CompiledExerciseModel.artifactMetadata(entry['artifact'])
+        except (OSError, ValueError, KeyError):
+            return False
+
+        return metadata.get('source') == self.sourceHash(entry['model'])
+
+    def exportArtifact(self, key, **metadata):
+        entry = self.exercises[key]
+        model = CompiledExerciseModel.load(entry['model'])
+        source = self.sourceHash(entry['model'])
+
+        ## Re-exporting the same pickle keeps the manifest it was trained with, a different pickle drops it
+        if 'manifest' not in metadata and os.path.exists(entry['artifact']):
+            try:
+                previous = CompiledExerciseModel.artifactMetadata(entry['artifact'])
+            except (OSError, ValueError, KeyError):
+                previous = {}
+            if previous.get('source') == source and 'manifest' in previous:
+                metadata['manifest'] = previous['manifest']
+
+        model.save(entry['artifact'], **dict(metadata, exercise = key, source = source))
+        return model
+
+    def exportAll(self):
+        for key in self.exercises:
+            self.exportArtifact(key)
+
+    def selectStudent(self, key, precisionTolerance = None):
+        precisionTolerance = self.precisionTolerance if precisionTolerance is None else precisionTolerance
+        entry = self.exercises[key]
+        reportPath = studentPath(entry['model'], directory = self.studentDirectory)
+
+        if precisionTolerance is None or not os.path.exists(reportPath):
+            return None
+
+        with open(reportPath) as f:
+            report = json.load(f)
+
+        ## Students distilled from an older teacher are ignored until they are distilled again
+        if os.path.exists(entry['model']) and report.get('source') != self.sourceHash(entry['model']):
+            return None
+
+        ## Only cross-validated precision is trusted, and only over enough rows: with no errors in n rows a drop of up
+        ## to about 3 / n still goes unseen, so on a few dozen frames every student ties with the teacher
+        if 'teacherCVPrecision' not in report or report.get('cvRows', 0) < self.minStudentRows:
+            return None
+
+        candidates = [student for student in report['students'] if os.path.exists(student['artifact'])
+                      and student['cvPrecision'] >= report['teacherCVPrecision'] - precisionTolerance]
+        return min(candidates, key = lambda student: student['frameMs'], default = None)
+
+    def resolve(self, key):
+        with self.lock:
+            student = self.selectStudent(key)
+            if student is not None:
+                return student['artifact']
+
+            if not self.isArtifactCurrent(key):
+                self.exportArtifact(key)
+            return self.exercises[key]['artifact']
+
+    def get(self, key):
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+            model = CompiledExerciseModel.loadArtifact(self.resolve(key))
+
+            self.cache[key] = model
+            if len(self.cache) > self.capacity:
+                self.cache.popitem(last = False)
+
+            return model
+
+    def preload(self, keys = None):
+        keys = list(self.exercises if keys is None else keys)[:self.capacity]
+        thread = threading.Thread(target = lambda: [self.get(key) for key in keys], daemon = True)
+        thread.start()
+        return thread
+
+def main():
+    ModelRegistry().exportAll()
+
+    for key, entry in exercises.items():
+        print(f"{key}: {entry['model']} ({os.path.getsize(entry['model'])} bytes) -> "
+              f"{entry['artifact']} ({os.path.getsize(entry['artifact'])} bytes)")
+
+if __name__ == '__main__':
+    main()
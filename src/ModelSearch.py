@@ -0,0 +1,175 @@
+import hashlib
+import json
+import math
+import os
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.ensemble import GradientBoostingClassifier
+from sklearn.metrics import log_loss, precision_score
+from sklearn.model_selection import ParameterGrid, StratifiedKFold
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+## Bumped whenever what is stored per fold changes, so caches written in an older layout are never misread
+scoreFormat = 2
+
+class ModelSearch:
+    def __init__(self, parameterGrid, cv = 5, minFolds = 2, halvingFactor = 3, nJobs = -1, randomState = 10,
+                 cacheDir = 'cache/search', featureTransformer = None, executor = None):
+        self.parameterGrid = parameterGrid
+        self.cv = cv
+        self.minFolds = minFolds
+        self.halvingFactor = halvingFactor
+        self.nJobs = nJobs
+        self.randomState = randomState
+        self.cacheDir = cacheDir
+        self.featureTransformer = featureTransformer
+        self.executor = executor
+
+        self.prefix = 'gradientboostingclassifier__'
+        self.estimatorsKey = f'{self.prefix}n_estimators'
+
+    def datasetHash(self, x, y):
+        digest = hashlib.sha256()
+        digest.update(np.ascontiguousarray(x, dtype = np.float64).tobytes())
+        digest.update('\n'.join(map(str, y)).encode())
+        return digest.hexdigest()
+
+    def cachePath(self, x, y):
+        return os.path.join(self.cacheDir,
+                            f'{self.datasetHash(x, y)[:32]}_cv{self.cv}_rs{self.randomState}_f{scoreFormat}.json')
+
+    def readScores(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def writeScores(self, path, scores):
+        os.makedirs(self.cacheDir, exist_ok = True)
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(scores, f, indent = 1, sort_keys = True)
+        os.replace(f'{path}.tmp', path)
+
+    def candidateKey(self, candidate):
+        return json.dumps(candidate, sort_keys = True)
+
+    def familyKey(self, candidate):
+        return self.candidateKey({k: v for k, v in candidate.items() if k != self.estimatorsKey})
+
+    def meanScore(self, candidate, nFolds, metric = 'precision'):
+        foldScores = self.scores.get(self.candidateKey(candidate), {})
+        return np.mean([foldScores[str(fold)][metric] for fold in range(nFolds)])
+
+    def rank(self, candidate, nFolds):
+        ## Small datasets put many candidates at a perfect precision, the tie goes to the one whose probabilities are
+        ## most confident on the held out folds since RepCounter only counts a phase above its probability threshold
+        return self.meanScore(candidate, nFolds), -self.meanScore(candidate, nFolds, 'logLoss')
+
+    def foldData(self, fold):
+        ## Each fold is split and scaled once, every candidate scored on it shares the same arrays
+        if fold not in self.folds:
+            trainIndex, testIndex = self.splits[fold]
+            scaler = StandardScaler().fit(self.x[trainIndex])
+            self.folds[fold] = (scaler.transform(self.x[trainIndex]), self.y[trainIndex],
+                                scaler.transform(self.x[testIndex]), self.y[testIndex])
+        return self.folds[fold]
+
+    def scoreCandidates(self, candidates, nFolds):
+        tasks = {}
+
+        for candidate in candidates:
+            foldScores = self.scores.get(self.candidateKey(candidate), {})
+            for fold in range(nFolds):
+                if str(fold) not in foldScores:
+                    task = tasks.setdefault((self.familyKey(candidate), fold), (candidate, set()))
+                    task[1].add(candidate.get(self.estimatorsKey, 100))
+
+        if not tasks:
+            return 0
+
+        arguments = [(self.estimatorParams(candidate), sorted(nEstimators), self.randomState, *self.foldData(fold))
+                     for (_, fold), (candidate, nEstimators) in tasks.items()]
+
+        ## A shared executor lets several searches draw on one worker budget instead of each taking every core
+        if self.executor is not None:
+            futures = [self.executor.submit(scoreFamily, *taskArguments) for taskArguments in arguments]
+            results = [future.result() for future in futures]
+        else:
+            results = Parallel(n_jobs = self.nJobs)(delayed(scoreFamily)(*taskArguments) for taskArguments in arguments)
+
+        for ((_, fold), (candidate, _)), stageScores in zip(tasks.items(), results):
+            for nEstimators, score in stageScores.items():
+                stageCandidate = dict(candidate)
+                if self.estimatorsKey in candidate:
+                    stageCandidate[self.estimatorsKey] = nEstimators
+                self.scores.setdefault(self.candidateKey(stageCandidate), {})[str(fold)] = score
+
+        return len(tasks)
+
+    def estimatorParams(self, candidate):
+        return {k[len(self.prefix):]: v for k, v in candidate.items() if k != self.estimatorsKey}
+
+    def fit(self, x, y):
+        ## The feature stage is stateless, so it runs once over the whole dataset instead of once per fold
+        features = x if self.featureTransformer is None else self.featureTransformer.transform(x)
+        self.x = np.asarray(features, dtype = np.float64)
+        self.y = np.asarray(y)
+        self.splits = list(StratifiedKFold(n_splits = self.cv).split(self.x, self.y))
+        self.folds = {}
+
+        path = self.cachePath(self.x, self.y)
+        self.scores = self.readScores(path)
+        self.fitCount = 0
+
+        candidates = list(ParameterGrid(self.parameterGrid))
+        survivors = candidates
+        nFolds = min(self.minFolds, self.cv)
+
+        ## Successive halving over folds: everything is scored on a few folds, only the best third moves on to more
+        while True:
+            self.fitCount += self.scoreCandidates(survivors, nFolds)
+            self.writeScores(path, self.scores)
+
+            if nFolds == self.cv:
+                break
+
+            ranked = sorted(survivors, key = lambda candidate: self.rank(candidate, nFolds), reverse = True)
+            survivors = ranked[:max(1, math.ceil(len(survivors) / self.halvingFactor))]
+            nFolds = min(self.cv, nFolds * 2)
+
+        self.bestParams = max(survivors, key = lambda candidate: self.rank(candidate, self.cv))
+        self.bestScore = self.meanScore(self.bestParams, self.cv)
+
+        featureSteps = [] if self.featureTransformer is None else [self.featureTransformer]
+        self.bestEstimator = make_pipeline(*featureSteps, StandardScaler(),
+                                           GradientBoostingClassifier(random_state = self.randomState))
+        self.bestEstimator.set_params(**self.bestParams)
+
+        if self.executor is not None:
+            self.bestEstimator = self.executor.submit(fitEstimator, self.bestEstimator, x, y).result()
+        else:
+            self.bestEstimator.fit(x, y)
+
+        return self
+
+def fitEstimator(estimator, x, y):
+    return estimator.fit(x, y)
+
+def scoreFamily(estimatorParams, nEstimators, randomState, xTrain, yTrain, xTest, yTest):
+    ## One boosted fit at the largest n_estimators scores every smaller n_estimators through its staged predictions
+    model = GradientBoostingClassifier(n_estimators = nEstimators[-1], random_state = randomState, **estimatorParams)
+    model.fit(xTrain, yTrain)
+
+    wanted = set(nEstimators)
+    scores = {}
+
+    for stage, probabilities in enumerate(model.staged_predict_proba(xTest), start = 1):
+        if stage in wanted:
+            yPred = model.classes_[probabilities.argmax(axis = 1)]
+            scores[stage] = {'precision': precision_score(yTest, yPred, average = 'macro', zero_division = 0),
+                             'logLoss': log_loss(yTest, probabilities, labels = model.classes_)}
+
+    return scores
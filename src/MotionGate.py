@@ -0,0 +1,165 @@
+import sys
+
+import numpy as np
+
+from CompiledExerciseModel import CompiledExerciseModel, CompiledLinearModel
+
+class MotionGate:
+    def __init__(self, model):
+        self.model = model
+        self.splits = self.splitTable(model)
+        self.reset()
+
+    @staticmethod
+    def splitTable(model):
+        ## Every threshold each input feature is compared against, sorted into one row per feature between a -inf and
+        ## a +inf column. Models that aren't compiled trees get no table and every frame goes to the model: a linear
+        ## student has no thresholds and its one matrix product costs less than the gate's own check, and an
+        ## ExerciseRouter built with isGated gates each of its per-exercise models itself
+        if not isinstance(model, CompiledExerciseModel) or isinstance(model, CompiledLinearModel):
+            return None
+
+        isSplit = np.isfinite(model.threshold)
+        features, thresholds = model.feature[isSplit], model.threshold[isSplit]
+        featureCount = int(features.max()) + 1 if len(features) else 0
+        counts = np.bincount(features, minlength = featureCount)
+
+        table = np.full((featureCount, counts.max(initial = 0) + 2), np.inf)
+        table[:, 0] = -np.inf
+        order = np.lexsort((thresholds, features))
+        columns = np.arange(len(order)) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+        table[features[order], columns] = thresholds[order]
+        return table
+
+    def reset(self):
+        self.lastResult = None
+        self.lower = None
+        self.upper = None
+        self.callCount = 0
+        self.reusedCount = 0
+
+    @property
+    def classes_(self):
+        return self.model.classes_
+
+    @property
+    def exerciseKey(self):
+        return getattr(self.model, 'exerciseKey', None)
+
+    def isReusable(self, features):
+        ## Every split compares one feature with one threshold, so a frame whose features all stay between the same
+        ## neighbouring thresholds as the cached frame takes the same branch at every node and gets the identical result
+        return self.lastResult is not None and bool(np.all((self.lower < features) & (features <= self.upper)))
+
+    def predict_with_proba(self, x):
+        landmarks = np.asarray(x, dtype = np.float32)
+
+        if landmarks.size != 33 * 4 or self.splits is None:
+            return self.model.predict_with_proba(landmarks)
+
+        return self.predictRow(self.model.toBatch(landmarks)[0])
+
+    def predictRow(self, batch):
+        ## batch is one frame already in the model's input space, for callers that share the feature transform
+        if self.splits is None:
+            classes, proba = self.model.predictFeatures(batch)
+            return classes[0], proba[0]
+
+        self.callCount += 1
+        features = batch[0, :len(self.splits)]
+
+        if self.isReusable(features):
+            self.reusedCount += 1
+            return self.lastResult
+
+        classes, proba = self.model.predictFeatures(batch)
+        self.lastResult = (classes[0], proba[0])
+
+        rows = np.arange(len(self.splits))
+        count = (self.splits < features[:, None]).sum(axis = 1)
+        self.lower, self.upper = self.splits[rows, count - 1], self.splits[rows, count]
+
+        return self.lastResult
+
+    def savedFraction(self):
+        return self.reusedCount / self.callCount if self.callCount else 0.0
+
+def replay(model, landmarks, gate = None):
+    from RepCounter import RepCounter
+
+    repCounter = RepCounter()
+    classifier = model if gate is None else gate
+    phases = []
+
+    for frameIndex, row in enumerate(landmarks):
+        movementPhaseClass, movementPhaseProbability = classifier.predict_with_proba(row)
+        phases.append(repCounter.update(movementPhaseClass, movementPhaseProbability, frameIndex)[0])
+
+    return phases, repCounter.repCount
+
+def compareGating(model, landmarks):
+    gate = MotionGate(model)
+    phases, repCount = replay(model, landmarks)
+    gatedPhases, gatedRepCount = replay(model, landmarks, gate)
+
+    return {
+        'frames': len(landmarks),
+        'repCount': repCount,
+        'gatedRepCount': gatedRepCount,
+        'phaseMismatches': sum(phase != gatedPhase for phase, gatedPhase in zip(phases, gatedPhases)),
+        'savedFraction': gate.savedFraction(),
+    }
+
+def videoLandmarks(video):
+    import cv2
+
+    from LandmarkCache import LandmarkCache
+    from PoseEstimator import PoseEstimator
+
+    cap = cv2.VideoCapture(video)
+    rows = []
+
+    frameCount = 0
+
+    with LandmarkCache().estimator(video, PoseEstimator()) as pose:
+        while True:
+            isReadable, frame = cap.read()
+
+            if not isReadable:
+                if hasattr(pose, 'markEndOfStream'):
+                    pose.markEndOfStream(frameCount)
+                break
+
+            frameCount += 1
+
+            landmarks = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            if landmarks is not None:
+                rows.append(landmarks.reshape(-1))
+
+    cap.release()
+    return np.array(rows, dtype = np.float32).reshape(-1, 33 * 4)
+
+def main(videos = ()):
+    import pandas as pd
+
+    from ModelRegistry import ModelRegistry, exercises, sessionFiles
+
+    modelRegistry = ModelRegistry()
+    sessions = [(key, path) for key, exercise in exercises.items() for path in sessionFiles(exercise['data'])]
+    sessions += [(key, video) for key, video in videos]
+
+    print(f"{'exercise':<16}{'session':<32}{'frames':>8}{'reps':>6}{'gated':>7}{'mismatches':>12}{'saved':>8}")
+
+    for key, session in sessions:
+        if session.endswith('.csv'):
+            landmarks = pd.read_csv(session).drop('label', axis = 1).to_numpy(dtype = np.float32)
+        else:
+            landmarks = videoLandmarks(session)
+
+        row = compareGating(modelRegistry.get(key), landmarks)
+        print(f"{key:<16}{session[-31:]:<32}{row['frames']:>8}{row['repCount']:>6}{row['gatedRepCount']:>7}"
+              f"{row['phaseMismatches']:>12}{row['savedFraction']:>8.1%}")
+
+if __name__ == '__main__':
+    ## Extra recorded sessions are passed as exercise=video pairs
+    main([tuple(arg.split('=', 1)) for arg in sys.argv[1:]])
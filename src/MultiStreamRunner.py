@@ -0,0 +1,176 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from ExercisePipeline import FrameQueue
+from ModelRegistry import ModelRegistry
+from PoseEstimator import PoseEstimator
+from RepCounter import RepCounter
+
+class StreamState:
+    def __init__(self, name, source, exerciseKey, model):
+        self.name = name
+        self.source = source
+        self.exerciseKey = exerciseKey
+        self.model = model
+        self.repCounter = RepCounter()
+        self.latencies = deque(maxlen = 2048)
+        self.frameCount = 0
+        self.noPoseCount = 0
+        self.classifiedCount = 0
+        self.isFinished = False
+        self.error = None
+
+class MultiStreamRunner:
+    def __init__(self, streams, maxBatch = 32, maxWaitMs = 5, isRealtime = False, modelRegistry = None, onResult = None,
+                 poseEstimatorFactory = None):
+        self.modelRegistry = modelRegistry if modelRegistry is not None else ModelRegistry()
+        self.streams = [StreamState(name, source, exerciseKey, self.modelRegistry.get(exerciseKey))
+                        for name, source, exerciseKey in streams]
+        self.maxBatch = maxBatch
+        self.maxWait = maxWaitMs / 1000
+        self.isRealtime = isRealtime
+        self.onResult = onResult
+
+        self.detectionConfidence = 0.5
+        self.trackingConfidence = 0.5
+        self.poseEstimatorFactory = poseEstimatorFactory if poseEstimatorFactory is not None else \
+            lambda stream: PoseEstimator(self.detectionConfidence, self.trackingConfidence)
+
+        self.rowQueue = FrameQueue(maxBatch * 4, dropOldest = False)
+        self.stopEvent = threading.Event()
+        self.batchSizes = []
+
+    def captureStream(self, stream):
+        ## Sources with a read method are used as they are, like ExercisePipeline does
+        cap = stream.source if hasattr(stream.source, 'read') else cv2.VideoCapture(stream.source)
+
+        ## However the capture ends the stream is marked finished, so run() never waits on a thread that has died
+        try:
+            frameInterval = 1.0 / (cap.get(cv2.CAP_PROP_FPS) or 30.0)
+            nextFrameTime = time.perf_counter()
+
+            with self.poseEstimatorFactory(stream) as pose:
+                while not self.stopEvent.is_set() and cap.isOpened():
+                    ## Recorded files can be paced at their native frame rate to stand in for live cameras
+                    if self.isRealtime:
+                        time.sleep(max(0.0, nextFrameTime - time.perf_counter()))
+                        nextFrameTime += frameInterval
+
+                    isReadable, frame = cap.read()
+
+                    if not isReadable:
+                        break
+
+                    captureTime = time.perf_counter()
+                    landmarks = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                    stream.frameCount += 1
+
+                    if landmarks is None:
+                        stream.noPoseCount += 1
+                        continue
+
+                    self.rowQueue.put((stream, stream.frameCount - 1, captureTime, landmarks.reshape(-1)))
+        except Exception as e:
+            stream.error = e
+        finally:
+            cap.release()
+            stream.isFinished = True
+
+    def nextBatch(self):
+        first = self.rowQueue.get(timeout = 0.1)
+
+        if first is None:
+            return []
+
+        batch = [first]
+        deadline = time.perf_counter() + self.maxWait
+
+        while len(batch) < self.maxBatch:
+            item = self.rowQueue.get(timeout = max(0.0, deadline - time.perf_counter()))
+            if item is None:
+                break
+            batch.append(item)
+
+        return batch
+
+    def classifyBatch(self, batch):
+        groups = {}
+        for item in batch:
+            groups.setdefault(id(item[0].model), []).append(item)
+
+        ## One vectorized call per distinct model, no matter how many streams share it
+        for items in groups.values():
+            classes, probabilities = items[0][0].model.predict_with_proba(np.stack([item[3] for item in items]))
+            classifiedTime = time.perf_counter()
+
+            for (stream, frameIndex, captureTime, _), movementPhaseClass, movementPhaseProbability in \
+                    zip(items, classes, probabilities):
+                stream.repCounter.update(movementPhaseClass, movementPhaseProbability, frameIndex)
+                stream.latencies.append(classifiedTime - captureTime)
+                stream.classifiedCount += 1
+
+                if self.onResult is not None:
+                    self.onResult(stream.name, frameIndex, stream.repCounter.movementPhase, stream.repCounter.repCount)
+
+        self.batchSizes.append(len(batch))
+
+    def run(self, duration = None):
+        threads = [threading.Thread(target = self.captureStream, args = (stream,), daemon = True)
+                   for stream in self.streams]
+
+        startTime = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        while True:
+            batch = self.nextBatch()
+
+            if batch:
+                self.classifyBatch(batch)
+            elif all(stream.isFinished for stream in self.streams) and len(self.rowQueue) == 0:
+                break
+
+            ## One failed source stops the whole run, its error is raised once every thread has let go
+            if duration is not None and time.perf_counter() - startTime >= duration or \
+                    any(stream.error is not None for stream in self.streams):
+                self.stopEvent.set()
+
+        elapsed = time.perf_counter() - startTime
+        self.rowQueue.close()
+
+        for thread in threads:
+            thread.join()
+
+        for stream in self.streams:
+            if stream.error is not None:
+                raise RuntimeError(f'Stream {stream.name} failed: {stream.error}') from stream.error
+
+        return self.report(elapsed)
+
+    def report(self, elapsed):
+        streams = {}
+
+        for stream in self.streams:
+            latencies = np.array(stream.latencies) * 1000
+            streams[stream.name] = {
+                'exercise': stream.exerciseKey,
+                'frames': stream.frameCount,
+                'noPoseFrames': stream.noPoseCount,
+                'repCount': stream.repCounter.repCount,
+                'latencyMeanMs': float(latencies.mean()) if len(latencies) else None,
+                'latencyP95Ms': float(np.percentile(latencies, 95)) if len(latencies) else None,
+            }
+
+        totalFrames = sum(stream.frameCount for stream in self.streams)
+
+        return {
+            'elapsedSeconds': elapsed,
+            'totalFrames': totalFrames,
+            'throughputFPS': totalFrames / elapsed if elapsed > 0 else 0.0,
+            'meanBatchSize': float(np.mean(self.batchSizes)) if self.batchSizes else 0.0,
+            'streams': streams,
+        }
@@ -0,0 +1,158 @@
+import sys
+import time
+
+import cv2
+import numpy as np
+
+## Same segments as mediapipe's POSE_CONNECTIONS, kept here so drawing doesn't need mediapipe loaded
+poseConnections = np.array([(0, 1), (1, 2), (2, 3), (3, 7), (0, 4), (4, 5), (5, 6), (6, 8), (9, 10), (11, 12),
+                            (11, 13), (13, 15), (15, 17), (15, 19), (15, 21), (17, 19), (12, 14), (14, 16), (16, 18),
+                            (16, 20), (16, 22), (18, 20), (11, 23), (12, 24), (23, 24), (23, 25), (24, 26), (25, 27),
+                            (26, 28), (27, 29), (28, 30), (29, 31), (30, 32), (27, 31), (28, 32)], dtype = np.intp)
+
+class OverlayRenderer:
+    ## Matches mediapipe's draw_landmarks defaults: red joints with a white rim and light grey segments
+    def __init__(self, landmarkColor = (0, 0, 255), connectionColor = (224, 224, 224), thickness = 2,
+                 circleRadius = 2, backgroundColor = None, visibilityThreshold = 0.5):
+        self.landmarkColor = landmarkColor
+        self.connectionColor = connectionColor
+        self.thickness = thickness
+        self.circleRadius = circleRadius
+        self.backgroundColor = backgroundColor
+        self.visibilityThreshold = visibilityThreshold
+
+        self.jointOffsets, self.jointColors = self.jointStamp()
+        self.background = None
+        self.hudState = None
+        self.hudPatch = None
+        self.hudMask = None
+
+    def jointStamp(self):
+        ## A joint is the same few pixels wherever it lands, so it is drawn once here and stamped at every joint
+        borderRadius = max(self.circleRadius + 1, int(self.circleRadius * 1.2))
+        center = borderRadius + self.thickness + 1
+        canvas = np.zeros((2 * center + 1, 2 * center + 1, 3), dtype = np.uint8)
+        mask = np.zeros(canvas.shape[:2], dtype = np.uint8)
+
+        for radius, color in ((borderRadius, (224, 224, 224)), (self.circleRadius, self.landmarkColor)):
+            cv2.circle(canvas, (center, center), radius, color, self.thickness)
+            cv2.circle(mask, (center, center), radius, 255, self.thickness)
+
+        ys, xs = np.nonzero(mask)
+        return np.stack([ys - center, xs - center], axis = 1), canvas[ys, xs]
+
+    def jointPixels(self, landmarks, width, height):
+        landmarks = np.asarray(landmarks, dtype = np.float64).reshape(-1, 4)
+        x, y, visibility = landmarks[:, 0], landmarks[:, 1], landmarks[:, 3]
+
+        ## Joints off the frame or below the visibility threshold are skipped, as mediapipe does
+        isDrawn = (visibility >= self.visibilityThreshold) & (x >= 0) & (x <= 1) & (y >= 0) & (y <= 1)
+        pixels = np.stack([np.minimum(np.floor(x * width), width - 1),
+                           np.minimum(np.floor(y * height), height - 1)], axis = 1).astype(np.int32)
+        return pixels, isDrawn
+
+    def drawSkeleton(self, image, landmarks):
+        height, width = image.shape[:2]
+        pixels, isDrawn = self.jointPixels(landmarks, width, height)
+
+        isSegmentDrawn = isDrawn[poseConnections].all(axis = 1)
+        segments = pixels[poseConnections[isSegmentDrawn]]
+
+        ## Every segment goes out in one polylines call, an open two point polyline draws exactly what cv2.line does
+        if len(segments):
+            cv2.polylines(image, list(segments.reshape(-1, 2, 1, 2)), False, self.connectionColor, self.thickness)
+
+        joints = pixels[isDrawn]
+        if not len(joints):
+            return image
+
+        ys = joints[:, None, 1] + self.jointOffsets[None, :, 0]
+        xs = joints[:, None, 0] + self.jointOffsets[None, :, 1]
+        isInside = (ys >= 0) & (ys < height) & (xs >= 0) & (xs < width)
+
+        ## Later joints overwrite earlier ones where they overlap, the same order mediapipe draws them in
+        image[ys[isInside], xs[isInside]] = np.broadcast_to(self.jointColors, ys.shape + (3,))[isInside]
+        return image
+
+    def drawBackground(self, image):
+        if self.background is None or self.background.shape != image.shape:
+            self.background = np.empty_like(image)
+            self.background[:] = self.backgroundColor
+
+        np.copyto(image, self.background)
+        return image
+
+    def drawHUD(self, image, movementPhase, repCount):
+        ## The box and its text are only re-rendered when the phase or rep count changes, frames just get it pasted on
+        if self.hudState != (movementPhase, repCount):
+            self.hudPatch, self.hudMask = self.renderHUD(movementPhase, repCount)
+            self.hudState = (movementPhase, repCount)
+
+        height, width = min(image.shape[0], self.hudPatch.shape[0]), min(image.shape[1], self.hudPatch.shape[1])
+        np.copyto(image[:height, :width], self.hudPatch[:height, :width], where = self.hudMask[:height, :width])
+        return image
+
+    def renderHUD(self, movementPhase, repCount):
+        topLeft, btmRight, color, thickness = (0, 0), (220, 60), (0, 0, 0), 2
+        movementPhasePosition, repsPos = (15, 20), (15, 40)
+
+        textProperties = {
+            "fontFace": cv2.FONT_HERSHEY_COMPLEX,
+            "fontScale": 0.5,
+            "color": (255, 255, 255),
+            "thickness": 1,
+            "lineType": cv2.LINE_AA
+        }
+
+        patch = np.zeros((btmRight[1] + thickness + 1, btmRight[0] + thickness + 1, 3), dtype = np.uint8)
+        mask = np.zeros(patch.shape[:2], dtype = np.uint8)
+
+        cv2.rectangle(patch, topLeft, btmRight, (0, 0, 255), thickness)
+        cv2.rectangle(patch, topLeft, btmRight, color, -1)
+        cv2.putText(patch, f"Movement Phase: {movementPhase}", movementPhasePosition, **textProperties)
+        cv2.putText(patch, f"Rep count: {repCount}", repsPos, **textProperties)
+
+        cv2.rectangle(mask, topLeft, btmRight, 255, thickness)
+        cv2.rectangle(mask, topLeft, btmRight, 255, -1)
+
+        return patch, (mask > 0)[:, :, None]
+
+    def render(self, image, landmarks, isSkeletonView = False):
+        if isSkeletonView:
+            self.drawBackground(image)
+        if landmarks is not None:
+            self.drawSkeleton(image, landmarks)
+        return image
+
+def compareWithMediapipe(dataPath, frames = 200, width = 640, height = 480):
+    import mediapipe as mp
+
+    from ModelRegistry import readSessions
+    from PoseEstimator import PoseEstimator
+
+    mp_drawing, mp_pose = mp.solutions.drawing_utils, mp.solutions.pose
+    rows = readSessions(dataPath).drop('label', axis = 1).to_numpy(dtype = np.float32).reshape(-1, 33, 4)[:frames]
+    background = np.random.default_rng(0).integers(0, 255, (height, width, 3), dtype = np.uint8)
+    renderer = OverlayRenderer()
+
+    mismatched, mediapipeTime, overlayTime = 0, 0.0, 0.0
+
+    for landmarks in rows:
+        expected, image = background.copy(), background.copy()
+
+        startTime = time.perf_counter()
+        mp_drawing.draw_landmarks(expected, PoseEstimator.toLandmarkList(landmarks), mp_pose.POSE_CONNECTIONS)
+        mediapipeTime += time.perf_counter() - startTime
+
+        startTime = time.perf_counter()
+        renderer.drawSkeleton(image, landmarks)
+        overlayTime += time.perf_counter() - startTime
+
+        mismatched += int((expected != image).any(axis = 2).sum())
+
+    print(f"{len(rows)} frames, {mismatched} mismatched pixels, mediapipe {mediapipeTime / len(rows) * 1000:.3f}ms/frame, "
+          f"overlay {overlayTime / len(rows) * 1000:.3f}ms/frame")
+    return mismatched
+
+if __name__ == '__main__':
+    sys.exit(1 if compareWithMediapipe(sys.argv[1] if len(sys.argv) > 1 else 'data/squat_FV.csv') else 0)
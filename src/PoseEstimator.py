@@ -0,0 +1,53 @@
+import mediapipe as mp
+import numpy as np
+from mediapipe.framework.formats import landmark_pb2
+
+class PoseEstimator:
+    def __init__(self, detectionConfidence = 0.5, trackingConfidence = 0.5, modelComplexity = 1):
+        self.detectionConfidence = detectionConfidence
+        self.trackingConfidence = trackingConfidence
+        self.modelComplexity = modelComplexity
+
+        self.mp_pose = mp.solutions.pose
+        self.pose = None
+
+    def open(self):
+        if self.pose is None:
+            self.pose = self.mp_pose.Pose(min_detection_confidence = self.detectionConfidence,
+                                          min_tracking_confidence = self.trackingConfidence,
+                                          model_complexity = self.modelComplexity)
+        return self
+
+    def close(self):
+        if self.pose is not None:
+            self.pose.close()
+            self.pose = None
+
+    def process(self, image):
+        self.open()
+
+        image.flags.writeable = False
+        results = self.pose.process(image)
+        image.flags.writeable = True
+
+        if results.pose_landmarks is None:
+            return None
+
+        return self.toArray(results.pose_landmarks)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def toArray(poseLandmarks):
+        return np.array([[res.x, res.y, res.z, res.visibility] for res in poseLandmarks.landmark], dtype = np.float32)
+
+    @staticmethod
+    def toLandmarkList(landmarks):
+        landmarkList = landmark_pb2.NormalizedLandmarkList()
+        for x, y, z, visibility in landmarks.tolist():
+            landmarkList.landmark.add(x = x, y = y, z = z, visibility = visibility)
+        return landmarkList
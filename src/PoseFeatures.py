@@ -0,0 +1,73 @@
+import numpy as np
+
+class PoseFeatures:
+    ## MediaPipe Pose landmark indices
+    shoulders, elbows, wrists = (11, 12), (13, 14), (15, 16)
+    hips, knees, ankles = (23, 24), (25, 26), (27, 28)
+
+    featureNames = [
+        'leftKneeAngle', 'rightKneeAngle', 'leftHipAngle', 'rightHipAngle',
+        'leftElbowAngle', 'rightElbowAngle', 'leftShoulderAngle', 'rightShoulderAngle',
+        'torsoLean',
+        'hipHeight', 'kneeHeight', 'shoulderHeight', 'wristHeight', 'hipKneeDrop', 'wristShoulderDrop',
+        'stanceRatio', 'gripRatio', 'kneeAnkleRatio', 'shoulderTorsoRatio', 'hipTorsoRatio',
+    ]
+
+    ## (a, b, c) triplets, the angle is measured at b
+    angleJoints = np.array([
+        (23, 25, 27), (24, 26, 28), (11, 23, 25), (12, 24, 26),
+        (11, 13, 15), (12, 14, 16), (13, 11, 23), (14, 12, 24),
+    ])
+
+    ## Joint pairs averaged into midpoints: shoulder, hip, knee, ankle, wrist
+    midpointPairs = np.array([shoulders, hips, knees, ankles, wrists])
+
+    ## (top, bottom) midpoint indices whose vertical drop is divided by torso length
+    heightPairs = np.array([(1, 3), (2, 3), (0, 3), (4, 3), (1, 2), (4, 0)])
+
+    ## Horizontal widths in ratio order: the stance, grip and knee/ankle numerators, the shoulder and hip widths
+    ## divided by torso length, then the stance, grip and knee/ankle denominators
+    widthPairs = np.array([ankles, wrists, knees, shoulders, hips, hips, shoulders, ankles])
+
+    ## Midpoints the features read: shoulder and hip for the torso, then the top and bottom of every height
+    middlePairs = midpointPairs[np.concatenate(([0, 1], heightPairs[:, 0], heightPairs[:, 1]))]
+
+    ## Joint order of the single gather transform starts with: angle ends (a then c), angle vertices twice so both
+    ## vectors come from one subtraction, midpoint pairs, then width pairs
+    gatherJoints = np.concatenate((angleJoints[:, 0], angleJoints[:, 2], angleJoints[:, 1], angleJoints[:, 1],
+                                   middlePairs[:, 0], middlePairs[:, 1], widthPairs[:, 0], widthPairs[:, 1]))
+
+    ## Offsets into a flat 132 value frame, row 0 picks the x and row 1 the y coordinate of each joint
+    gatherIndex = 4 * gatherJoints + np.array([[0], [1]])
+
+    @staticmethod
+    def transform(landmarks):
+        rows = np.asarray(landmarks, dtype = np.float32).reshape(-1, 33 * 4)
+        features = np.empty((len(rows), len(PoseFeatures.featureNames)), dtype = np.float32)
+
+        ## Live inference transforms one frame at a time, so everything comes out of one gather and the families work
+        ## on views of it with a fixed handful of array ops, writing straight into the output
+        points = rows[:, PoseFeatures.gatherIndex]
+
+        ## Angle at b between ba and bc, both vectors and both coordinates in one subtraction
+        vectors = points[:, :, 0:16] - points[:, :, 16:32]
+        squares = vectors * vectors
+        lengths = np.sqrt(squares[:, 0] + squares[:, 1])
+        products = vectors[:, :, :8] * vectors[:, :, 8:]
+        cosine = (products[:, 0] + products[:, 1]) / (lengths[:, :8] * lengths[:, 8:] + 1e-6)
+        np.minimum(np.maximum(cosine, -1.0, out = cosine), 1.0, out = cosine)
+        np.degrees(np.arccos(cosine, out = cosine), out = features[:, :8])
+
+        middle = (points[:, :, 32:46] + points[:, :, 46:60]) * 0.5
+        torsoVector = middle[:, :, 0] - middle[:, :, 1]
+        torso = np.sqrt(torsoVector[:, 0] * torsoVector[:, 0] + torsoVector[:, 1] * torsoVector[:, 1])[:, None] + 1e-6
+        np.degrees(np.arctan2(torsoVector[:, 0], -torsoVector[:, 1]), out = features[:, 8])
+
+        ## Heights and widths are divided by torso length so the lifter's distance from the camera drops out
+        np.divide(middle[:, 1, 8:14] - middle[:, 1, 2:8], torso, out = features[:, 9:15])
+
+        widths = np.abs(points[:, 0, 60:68] - points[:, 0, 68:76])
+        np.divide(widths[:, 0:3], widths[:, 5:8] + 1e-6, out = features[:, 15:18])
+        np.divide(widths[:, 3:5], torso, out = features[:, 18:20])
+
+        return features
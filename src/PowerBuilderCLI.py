@@ -1,33 +1,40 @@
+import os
 import sys
 
 from ExerciseModelProcessor import ExerciseModelProcessor
-from ExerciseModelTrainer import ExerciseModelTrainer
+from ExerciseModelTrainer import ExerciseModelTrainer, compareFeatureSets
 from ExerciseModelRunner import ExerciseModelRunner
+from ExerciseVideoAnalyzer import ExerciseVideoAnalyzer
+from ModelManifest import build
+from ModelRegistry import ModelRegistry, exercises
+from MultiStreamRunner import MultiStreamRunner
+from StageMetrics import StageMetrics
+from TrainingScheduler import TrainingScheduler
 
-## FV: Front View
-## SV: Side View
+models = exercises
+metrics = StageMetrics.fromArgs(sys.argv)
 
-models = {
-    'deadlift_FV' : {'video': 'private/videos/deadlift_FV_updown.mp4',
-                      'data': 'data/deadlift_FV_updown.csv',
-                      'model': 'models/deadlift_FV_updown.pkl'},
+def main():
+    metrics.start()
+    action = input("Enter the action to perform (process/train/trainall/build/compare/distil/run/analyze/multi/quit): ").strip().lower()
 
-    'squat_FV' : {'video': 'private/videos/squat_FV.mp4',
-            'data': 'data/squat_FV.csv',
-            'model': 'models/squat_FV.pkl'},
+    if action == 'multi':
+        mainMultiStream()
+        return
 
-    'squat_SV' : {'video': 'private/videos/squat_SV.mp4',
-            'data': 'data/squat_SV.csv',
-            'model': 'models/squat_SV.pkl'},
+    if action == 'trainall':
+        mainTrainAll()
+        return
 
-    'benchpress_FV' : {'video': 'private/videos/benchpress_FV.mp4',
-                'data': 'data/benchpress_FV.csv',
-                'model': 'models/benchpress_FV.pkl'}
-        }
+    if action == 'build':
+        build()
+        return
 
-def main():
-    action = input("Enter the action to perform (process/train/run/quit): ").strip().lower()
-    model_choice = input("Enter the model to use (deadlift_FV, squat_FV, squat_SV, benchpress_FV): ").strip()
+    model_choice = input("Enter the model to use (deadlift_FV, squat_FV, squat_SV, benchpress_FV, or auto to run): ").strip()
+
+    if action == 'run' and model_choice == 'auto':
+        mainRunner(model_choice)
+        return
 
     if model_choice not in models:
         print(f"Invalid model choice: {model_choice}")
@@ -37,8 +44,14 @@ def main():
         mainProcessor(model_choice)
     elif action == 'train':
         mainTrainer(model_choice)
+    elif action == 'compare':
+        mainCompare(model_choice)
+    elif action == 'distil':
+        mainDistil(model_choice)
     elif action == 'run':
         mainRunner(model_choice)
+    elif action == 'analyze':
+        mainAnalyzer(model_choice)
     elif action == 'quit':
         sys.exit()
     else:
@@ -46,18 +59,110 @@ def main():
 
 def mainProcessor(modelKey):
     modelValue = models[modelKey]
-    processor = ExerciseModelProcessor(modelKey, modelValue['data'], modelValue['video'])
-    processor.processVideo()
+    labelFile = input("Enter a label file of label,start,end ranges for bulk labelling (blank for interactive): ").strip()
+
+    processor = ExerciseModelProcessor(modelKey, modelValue['data'], modelValue['video'], metrics)
+
+    if labelFile:
+        rowCount = processor.processVideoBulk(labelFile)
+        print(f"Wrote {rowCount} labelled frames to {modelValue['data']}")
+    else:
+        processor.processVideo()
 
 def mainTrainer(modelKey):
     modelValue = models[modelKey]
-    trainer = ExerciseModelTrainer(modelValue['data'], modelValue['model'])
+    featureSet = input("Enter the feature set to train on (raw/pose, default raw): ").strip().lower() or 'raw'
+    dataPath = input(f"Enter the training data as a CSV, a directory or a glob of session CSVs "
+                     f"(default {modelValue['data']}): ").strip() or modelValue['data']
+    isIncremental = input("Stream it through the incremental learner to keep memory bounded? (y/n): ").strip().lower() == 'y'
+
+    trainer = ExerciseModelTrainer(dataPath, modelValue['model'], featureSet, isIncremental)
     trainer.constructPipeline()
+    ModelRegistry().exportArtifact(modelKey, manifest = trainer.manifest())
+    print(f"Trained {modelKey} in {trainer.trainingTime:.1f}s, precision: {trainer.evaluateModel():.3f}")
 
-def mainRunner(modelKey):
+    if input("Distil lightweight students from it too? (y/n): ").strip().lower() == 'y':
+        printStudents(trainer.distilStudents())
+
+def mainTrainAll():
+    workers = input(f"Enter the number of worker processes to share across all models (default {os.cpu_count()}): ").strip()
+    featureSet = input("Enter the feature set to train on (raw/pose, default raw): ").strip().lower() or 'raw'
+
+    report = TrainingScheduler(int(workers) if workers else None).trainAll(featureSet = featureSet)
+
+    for result in report['models']:
+        print(f"{result['model']}: {result['seconds']:.1f}s, {result['fits']} fits, precision {result['precision']:.3f}")
+    print(f"Trained {len(report['models'])} models in {report['elapsedSeconds']:.1f}s on {report['workers']} workers "
+          f"({report['parallelism']:.1f}x parallel)")
+
+def mainCompare(modelKey):
     modelValue = models[modelKey]
-    runner = ExerciseModelRunner(modelKey, modelValue['model'])
+
+    print(f"{'features':<10}{'inputs':>8}{'nodes':>8}{'precision':>11}{'ms/frame':>10}{'train s':>9}")
+    for row in compareFeatureSets(modelValue['data']):
+        print(f"{row['featureSet']:<10}{row['inputs']:>8}{row['nodes']:>8}{row['precision']:>11.3f}"
+              f"{row['frameMs']:>10.3f}{row['trainingSeconds']:>9.1f}")
+
+def mainDistil(modelKey):
+    modelValue = models[modelKey]
+    printStudents(ExerciseModelTrainer(modelValue['data'], modelValue['model']).distilStudents())
+
+def printStudents(report):
+    print(f"{'student':<16}{'features':>9}{'precision':>11}{'drop':>8}{'cv prec':>9}{'cv drop':>9}{'agrees':>8}"
+          f"{'ms/frame':>10}{'KB':>8}")
+    for row in sorted(report['students'], key = lambda row: row['frameMs']):
+        print(f"{row['student']:<16}{row['featureSet']:>9}{row['precision']:>11.3f}{row['precisionDrop']:>8.3f}"
+              f"{row['cvPrecision']:>9.3f}{row['cvPrecisionDrop']:>9.3f}{row['agreement']:>8.3f}{row['frameMs']:>10.3f}"
+              f"{row['bytes'] / 1024:>8.1f}")
+    print(f"Cross-validated over {report['cvRows']} rows")
+
+def mainRunner(modelKey):
+    targetFPS = input("Enter a target pose FPS to hold on slow hardware (blank for full resolution): ").strip()
+    journalDir = input("Enter a directory to journal the session's landmarks to (blank for none): ").strip()
+    tolerance = '' if modelKey == 'auto' else \
+        input("Enter a precision drop to allow for the fastest distilled model (e.g. 0.02, blank for the full model): ").strip()
+
+    modelPath = None if modelKey == 'auto' else \
+        ModelRegistry(precisionTolerance = float(tolerance) if tolerance else None).resolve(modelKey)
+    runner = ExerciseModelRunner(modelKey, modelPath, float(targetFPS) if targetFPS else None, metrics, journalDir or None)
     runner.run()
 
+    if journalDir:
+        print(f"Journaled the session to {journalDir}, re-score it with: python src/SessionJournal.py {journalDir}")
+
+def mainAnalyzer(modelKey):
+    modelValue = models[modelKey]
+    video = input(f"Enter the video to analyze (default {modelValue['video']}): ").strip() or modelValue['video']
+    outputPrefix = input(f"Enter the output prefix (default analysis/{modelKey}): ").strip() or f'analysis/{modelKey}'
+    workers = input(f"Enter the number of worker processes (default {os.cpu_count()}): ").strip()
+    workers = int(workers) if workers else os.cpu_count()
+
+    analyzer = ExerciseVideoAnalyzer(modelKey, ModelRegistry().resolve(modelKey), video, workers=workers)
+    summary = analyzer.analyze(outputPrefix)
+
+    print(f"Analyzed {summary['frames']} frames with {summary['workers']} worker(s) in {summary['elapsedSeconds']:.1f}s "
+          f"({summary['throughputFPS']:.1f} frames/sec), reps: {summary['repCount']}")
+    print(f"Wrote {outputPrefix}_frames.csv and {outputPrefix}_reps.json")
+
+def mainMultiStream():
+    sources = input("Enter the streams as model=video pairs separated by commas (e.g. squat_FV=a.mp4,deadlift_FV=1): ").strip()
+    streams = []
+
+    for i, pair in enumerate(filter(None, sources.split(','))):
+        modelKey, source = pair.strip().split('=', 1)
+        if modelKey not in models:
+            print(f"Invalid model choice: {modelKey}")
+            return
+        streams.append((f'{i}:{modelKey}', int(source) if source.isdigit() else source, modelKey))
+
+    report = MultiStreamRunner(streams).run()
+
+    print(f"{report['totalFrames']} frames from {len(streams)} streams in {report['elapsedSeconds']:.1f}s "
+          f"({report['throughputFPS']:.1f} frames/sec, mean batch {report['meanBatchSize']:.1f})")
+    for name, stream in report['streams'].items():
+        latency = 'n/a' if stream['latencyMeanMs'] is None else f"{stream['latencyMeanMs']:.1f}ms mean / {stream['latencyP95Ms']:.1f}ms p95"
+        print(f"  {name}: {stream['frames']} frames, {stream['noPoseFrames']} without pose, "
+              f"{stream['repCount']} reps, latency {latency}")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
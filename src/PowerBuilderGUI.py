@@ -1,24 +1,100 @@
-import cv2
-import mediapipe as mp
-import pickle
-import numpy as np
-import pandas as pd
+import importlib
+import os
+import struct
+import threading
 import tkinter as tk
-from PIL import Image, ImageTk
+import zlib
+from types import SimpleNamespace
+
+from StageMetrics import StageMetrics
+from StartupTimer import StartupTimer
+
+## Generated images are cached next to the sources, wherever the GUI is started from
+cacheDir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache')
+
+def loadBackend(startupTimer):
+    with startupTimer.phase('import cv2/numpy'):
+        import cv2
+    ## mediapipe is imported on its own so the startup report shows its cost apart from the pipeline's
+    with startupTimer.phase('import mediapipe'):
+        importlib.import_module('mediapipe')
+    with startupTimer.phase('import pipeline'):
+        from AdaptivePoseEstimator import AdaptivePoseEstimator
+        from ExercisePipeline import ExercisePipeline
+        from ExerciseRecognizer import ExerciseRouter
+        from ModelRegistry import ModelRegistry
+        from MotionGate import MotionGate
+        from OverlayRenderer import OverlayRenderer
+        from PoseEstimator import PoseEstimator
+        from SessionJournal import JournalWriter, journalPath
+        from VideoDisplay import VideoDisplay
+
+    return SimpleNamespace(cv2=cv2, AdaptivePoseEstimator=AdaptivePoseEstimator, ExercisePipeline=ExercisePipeline,
+                           ExerciseRouter=ExerciseRouter, ModelRegistry=ModelRegistry, MotionGate=MotionGate,
+                           OverlayRenderer=OverlayRenderer, PoseEstimator=PoseEstimator, JournalWriter=JournalWriter,
+                           journalPath=journalPath, VideoDisplay=VideoDisplay)
 
 class PowerBuilderGUI():
-    def __init__(self):
+    def __init__(self, startupTimer=None, metrics=None, journalDir=None):
+        self.startupTimer = startupTimer if startupTimer is not None else StartupTimer()
+        self.metrics = metrics if metrics is not None else StageMetrics()
+        self.journalDir = journalDir
+        self.modelKey = None
         self.isUpdating = False
         self.model = None
         self.isSkeletonView = False
-        self.videoCapture = cv2.VideoCapture(0)
+        self.videoCapture = None
+        self.backend = None
+        self.backendError = None
+        self.backendReady = threading.Event()
+        self.pendingLoad = None
+
+        with self.startupTimer.phase('main window'):
+            self.initMainWindow()
+            self.initPoseDetection()
+            self.initLandmarks()
+
+        ## Heavy modules and the models load behind the already visible window
+        threading.Thread(target=self.initBackend, name='backend', daemon=True).start()
+        self.mainWindow.after(0, self.startupTimer.mark, 'window shown')
+        self.mainWindow.after(0, self.reportStartup)
 
-        self.initMainWindow()
-        self.initPoseDetection()
-        self.initLandmarks()
         self.update()
         self.mainWindow.mainloop()
 
+    def initBackend(self):
+        ## The event is set however loading ends, the Tk thread polls it and shows an error instead of waiting forever
+        try:
+            backend = loadBackend(self.startupTimer)
+
+            self.overlay = backend.OverlayRenderer()
+            self.skeletonOverlay = backend.OverlayRenderer(landmarkColor=(25, 169, 169),
+                                                           connectionColor=(26, 169, 169), backgroundColor=(25, 25, 41))
+
+            with self.startupTimer.phase('load models'):
+                self.modelRegistry = backend.ModelRegistry()
+                for key in self.modelRegistry.exercises:
+                    self.modelRegistry.get(key)
+
+            self.backend = backend
+        except Exception as e:
+            self.backendError = e
+        finally:
+            self.backendReady.set()
+
+    def reportStartup(self):
+        if not self.backendReady.is_set():
+            self.mainWindow.after(50, self.reportStartup)
+            return
+
+        if self.backendError is not None:
+            print(f"Backend failed to load: {self.backendError}")
+            return
+
+        self.startupTimer.mark('backend ready')
+        if self.startupTimer.isReporting:
+            print(self.startupTimer.report())
+
     def initMainWindow(self):
         self.mainWindow = tk.Tk()
         self.mainWindow.title("PowerBuilder AI")
@@ -66,12 +142,11 @@ class PowerBuilderGUI():
         self.initQuitFrame()
 
     def initPoseDetection(self):
-        self.mp_pose = mp.solutions.pose
-        self.mp_drawing = mp.solutions.drawing_utils
         self.repCount = 0
         self.movementPhase = ''
-        self.updateDelay = 15
-        self.pose = None
+        self.exerciseKey = None
+        self.pipeline = None
+        self.videoDisplay = None
 
     def initLandmarks(self):
         self.landmarks = ['label']
@@ -124,12 +199,14 @@ class PowerBuilderGUI():
         self.exerciseSelectionFrame.grid_rowconfigure(0, weight=1)
         self.exerciseSelectionFrame.grid_rowconfigure(1, weight=1)
         self.exerciseSelectionFrame.grid_rowconfigure(2, weight=1)
+        self.exerciseSelectionFrame.grid_rowconfigure(3, weight=1)
         self.exerciseSelectionFrame.grid_columnconfigure(0, weight=1)
 
         self.isSquatFrontView = tk.BooleanVar()
         self.isSquatSideView = tk.BooleanVar()
         self.isBenchFrontView = tk.BooleanVar()
         self.isDeadliftFrontView = tk.BooleanVar()
+        self.isAutoDetect = tk.BooleanVar()
 
         squatFrame = tk.Canvas(self.exerciseSelectionFrame, width=200, height=150, bg='#141221',
                                highlightbackground='#19A9A9', highlightthickness=2)
@@ -172,6 +249,18 @@ class PowerBuilderGUI():
                                                  command=self.deadliftFrontViewSelected)
         deadliftFrontViewButton.grid(row=0, column=1, sticky='w')
 
+        autoFrame = tk.Canvas(self.exerciseSelectionFrame, width=200, height=150, bg='#141221',
+                              highlightbackground='#19A9A9', highlightthickness=2)
+        autoFrame.grid(row=3, column=0, padx=10, pady=5, sticky='news')
+
+        autoLabel = tk.Label(autoFrame, height=2, width=10, text="Any Lift", fg="#19A9A9", bg="#141221", padx=3,
+                             pady=5, anchor='w', font=("Fira Code", 12))
+        autoLabel.grid(row=0, column=0, padx=5, pady=5)
+
+        autoDetectButton = tk.Checkbutton(autoFrame, width=7, text='Auto', variable=self.isAutoDetect, bg='#141221',
+                                          anchor='nw', command=self.autoDetectSelected, font=("Fira Code", 12))
+        autoDetectButton.grid(row=0, column=1, sticky='w')
+
     def squatFrontViewSelected(self):
         if self.isSquatFrontView.get():
             self.deselectCheckboxes()
@@ -204,6 +293,14 @@ class PowerBuilderGUI():
         else:
             self.deselectCheckboxes()
 
+    def autoDetectSelected(self):
+        if self.isAutoDetect.get():
+            self.deselectCheckboxes()
+            self.isAutoDetect.set(True)
+            self.loadModel()
+        else:
+            self.deselectCheckboxes()
+
     def initToggleViewFrame(self):
         self.toggleViewFrame = tk.Frame(self.controlsFrame, width=200, height=10, bg='white')
         self.toggleViewFrame.grid(row=3, column=0, padx=10, pady=0, sticky='news')
@@ -259,133 +356,162 @@ class PowerBuilderGUI():
         self.repCounterBox.grid(row=0, column=1, padx=5, pady=5)
 
     def startModel(self):
-        if self.model is None:
+        if self.model is None or self.pipeline is not None:
             return
+        backend = self.backend
+        if self.videoCapture is None:
+            with self.startupTimer.phase('open camera'):
+                self.videoCapture = backend.cv2.VideoCapture(0)
+        fps = self.videoCapture.get(backend.cv2.CAP_PROP_FPS)
+        if self.videoDisplay is None:
+            self.videoDisplay = backend.VideoDisplay(self.videoFrame, 650, 500, fps)
         self.isUpdating = True
+        poseEstimator = backend.AdaptivePoseEstimator(backend.PoseEstimator(0.5, 0.5), fps or 30.0)
+        journal = None
+        if self.journalDir:
+            journal = backend.JournalWriter(backend.journalPath(self.journalDir, self.modelKey), self.modelKey)
+        self.pipeline = backend.ExercisePipeline(self.videoCapture, self.model, poseEstimator,
+                                         renderer=self.renderFrame, frameSize=(650, 500), isRGBOutput=True,
+                                         metrics=self.metrics, journal=journal)
+        self.pipeline.start()
         self.update()
 
+    def stopModel(self):
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline = None
+
     def resetCounter(self):
         self.repCount = 0
         self.repCounterBox.configure(text=str(self.repCount))
         self.movementPhaseBox.configure(text="N/A")
         self.isUpdating = False
+        self.stopModel()
         self.deselectCheckboxes()
         self.videoFrameDefault()
 
     def loadModel(self):
-        models = {
-            "squat_FV": "models/squat_FV.pkl",
-            "squat_SV": "models/squat_SV.pkl",
-            "benchpress_FV": "models/benchpress_FV.pkl",
-            "deadlift_FV": "models/deadlift_FV_updown.pkl"
-        }
-
         self.model = None
+        if self.pendingLoad is not None:
+            self.mainWindow.after_cancel(self.pendingLoad)
+            self.pendingLoad = None
 
         if self.isSquatFrontView.get():
-            path = models["squat_FV"]
+            key = "squat_FV"
         elif self.isSquatSideView.get():
-            path = models["squat_SV"]
+            key = "squat_SV"
         elif self.isBenchFrontView.get():
-            path = models["benchpress_FV"]
+            key = "benchpress_FV"
         elif self.isDeadliftFrontView.get():
-            path = models["deadlift_FV"]
+            key = "deadlift_FV"
+        elif self.isAutoDetect.get():
+            key = "auto"
         else:
             return
 
-        with open(path, "rb") as f:
-            self.model = pickle.load(f)
+        ## The Tk thread never blocks on the backend, the selection is retried once it has finished loading
+        if not self.backendReady.is_set():
+            self.showMessage("Loading models...", "The selection applies as soon as they are ready.")
+            self.pendingLoad = self.mainWindow.after(50, self.loadModel)
+            return
+
+        try:
+            if self.backendError is not None:
+                raise self.backendError
+            if key == "auto":
+                self.model = self.backend.ExerciseRouter.load(self.modelRegistry, isGated = True)
+            else:
+                self.model = self.backend.MotionGate(self.modelRegistry.get(key))
+        except Exception as e:
+            self.showMessage("Could not load the model", str(e)[:70])
+            return
+        self.modelKey = key
+
+        if self.pipeline is not None:
+            self.pipeline.setModel(self.model)
 
         if self.model:
-            self.videoFrame.delete('all')
-            self.videoFrame.create_text(325, 250, text="Model loaded successfully!",
-                                        fill="#19A9A9", font=("Fira Code", 22))
-            self.videoFrame.create_text(325, 275, text="Press Start to begin detection.",
-                                        fill="#19A9A9", font=("Fira Code", 18))
+            self.showMessage("Model loaded successfully!", "Press Start to begin detection.")
+
+    def showMessage(self, title, detail):
+        self.videoFrame.delete('all')
+        self.videoFrame.create_text(325, 250, text=title, fill="#19A9A9", font=("Fira Code", 22))
+        self.videoFrame.create_text(325, 275, text=detail, fill="#19A9A9", font=("Fira Code", 18))
 
     def deselectCheckboxes(self):
         self.isSquatFrontView.set(False)
         self.isSquatSideView.set(False)
         self.isBenchFrontView.set(False)
         self.isDeadliftFrontView.set(False)
+        self.isAutoDetect.set(False)
         self.model = None
+        if self.pipeline is not None:
+            self.pipeline.setModel(None)
         self.videoFrameDefault()
 
     def update(self):
         if not self.isUpdating:
             return
 
-        isReadable, frame = self.videoCapture.read()
-        if isReadable:
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            frame = cv2.resize(frame, (650, 500))
-
-            if self.pose is None:
-                self.pose = self.mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
-
-            results = self.pose.process(frame)
-
-            landmark_spec = self.mp_drawing.DrawingSpec(color=(25, 169, 169), thickness=2, circle_radius=2)
-            connection_spec = self.mp_drawing.DrawingSpec(color=(26, 169, 169), thickness=2, circle_radius=2)
+        result = self.pipeline.poll()
+        if result is not None:
+            with self.metrics.stage('display'):
+                self.videoDisplay.show(result.image)
 
-            if self.isSkeletonView:
-                blankFrame = np.full(frame.shape, (25, 25, 41), dtype=np.uint8)
-                self.mp_drawing.draw_landmarks(blankFrame, results.pose_landmarks, self.mp_pose.POSE_CONNECTIONS,
-                                               landmark_spec, connection_spec)
-                displayedFrame = blankFrame
-            else:
-                self.mp_drawing.draw_landmarks(frame, results.pose_landmarks, self.mp_pose.POSE_CONNECTIONS)
-                displayedFrame = frame
-
-            try:
-                row = np.array([[res.x, res.y, res.z, res.visibility] for res in
-                                results.pose_landmarks.landmark]).flatten().tolist()
-                df = pd.DataFrame([row], columns=self.landmarks[1:])
-
-                if self.model:
-                    movementPhaseClass = self.model.predict(df)[0]
-                    movementPhaseProbability = self.model.predict_proba(df)[0]
-
-                    if movementPhaseClass == 'down' and movementPhaseProbability[
-                        movementPhaseProbability.argmax()] >= .7:
-                        self.movementPhase = 'Down'
-                    elif self.movementPhase == 'Down' and movementPhaseClass == 'up' and movementPhaseProbability[
-                        movementPhaseProbability.argmax()] >= .7:
-                        self.movementPhase = 'Up'
-                        self.repCount += 1
-
-            except Exception as e:
-                print(e)
-
-            if self.isUpdating:
-                self.photo = ImageTk.PhotoImage(image=Image.fromarray(displayedFrame))
-                self.videoFrame.create_image(0, 0, image=self.photo, anchor=tk.NW)
+            if result.movementPhase != self.movementPhase:
+                self.movementPhase = result.movementPhase
                 self.movementPhaseBox.configure(text=self.movementPhase)
+            if result.repCount != self.repCount:
+                self.repCount = result.repCount
                 self.repCounterBox.configure(text=str(self.repCount))
+            if result.exerciseKey != self.exerciseKey:
+                self.exerciseKey = result.exerciseKey
+                self.mainWindow.title(f"PowerBuilder AI - {self.exerciseKey}" if self.exerciseKey else "PowerBuilder AI")
+
+        self.mainWindow.after(self.videoDisplay.nextDelay(result is not None), self.update)
 
-        self.mainWindow.after(self.updateDelay, self.update)
+    def renderFrame(self, result):
+        ## The camera image is not shown in skeleton view, its pooled buffer is overwritten with the cached background
+        overlay = self.skeletonOverlay if self.isSkeletonView else self.overlay
+        with self.metrics.stage('drawLandmarks'):
+            return overlay.render(result.image, result.landmarks, self.isSkeletonView)
 
     def drawGradient(self, canvas, start_color, end_color, width, height, isHorizontal):
+        path = self.gradientImagePath(start_color, end_color, width, height, isHorizontal)
+        self.gradientImage = tk.PhotoImage(file=path)
+        canvas.create_image(0, 0, image=self.gradientImage, anchor=tk.NW)
+
+    def gradientImagePath(self, start_color, end_color, width, height, isHorizontal):
+        path = os.path.join(cacheDir, f"gradient_{start_color[1:]}_{end_color[1:]}_{width}x{height}_{'h' if isHorizontal else 'v'}.png")
+        if os.path.exists(path):
+            return path
+
         r1, g1, b1 = int(start_color[1:3], 16), int(start_color[3:5], 16), int(start_color[5:7], 16)
         r2, g2, b2 = int(end_color[1:3], 16), int(end_color[3:5], 16), int(end_color[5:7], 16)
 
+        steps = width if isHorizontal else height
+        colors = [bytes((int(r1 + (r2 - r1) * (i / steps)), int(g1 + (g2 - g1) * (i / steps)),
+                         int(b1 + (b2 - b1) * (i / steps)))) for i in range(steps)]
+
         if isHorizontal:
-            for i in range(width):
-                r = int(r1 + (r2 - r1) * (i / width))
-                g = int(g1 + (g2 - g1) * (i / width))
-                b = int(b1 + (b2 - b1) * (i / width))
-                color = f'#{r:02x}{g:02x}{b:02x}'
-                canvas.create_line(i, 0, i, height, fill=color)
+            scanlines = (b'\x00' + b''.join(colors)) * height
         else:
-            for i in range(height):
-                r = int(r1 + (r2 - r1) * (i / height))
-                g = int(g1 + (g2 - g1) * (i / height))
-                b = int(b1 + (b2 - b1) * (i / height))
-                color = f'#{r:02x}{g:02x}{b:02x}'
-                canvas.create_line(0, i, width, i, fill=color)
+            scanlines = b''.join(b'\x00' + color * width for color in colors)
+
+        def chunk(kind, data):
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+        os.makedirs(cacheDir, exist_ok=True)
+        with open(f'{path}.tmp', 'wb') as f:
+            f.write(b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+                    chunk(b'IDAT', zlib.compress(scanlines, 9)) + chunk(b'IEND', b''))
+        os.replace(f'{path}.tmp', path)
+
+        return path
 
     def __del__(self):
-        if self.videoCapture.isOpened():
+        self.stopModel()
+        if self.videoCapture is not None and self.videoCapture.isOpened():
             self.videoCapture.release()
 
 
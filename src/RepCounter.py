@@ -0,0 +1,25 @@
+class RepCounter:
+    def __init__(self, threshold = .7):
+        self.threshold = threshold
+        self.reset()
+
+    def reset(self):
+        self.repCount = 0
+        self.movementPhase = ''
+        self.repStart = None
+        self.completedRep = None
+
+    def update(self, movementPhaseClass, movementPhaseProbability, frameIndex = None):
+        confidence = movementPhaseProbability[movementPhaseProbability.argmax()]
+        self.completedRep = None
+
+        if movementPhaseClass == 'down' and confidence >= self.threshold:
+            if self.movementPhase != 'Down':
+                self.repStart = frameIndex
+            self.movementPhase = 'Down'
+        elif self.movementPhase == 'Down' and movementPhaseClass == 'up' and confidence >= self.threshold:
+            self.movementPhase = 'Up'
+            self.repCount += 1
+            self.completedRep = (self.repCount, self.repStart, frameIndex)
+
+        return self.movementPhase, self.repCount
@@ -0,0 +1,193 @@
+import glob
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from RepCounter import RepCounter
+
+## A journal is a 64 byte header followed by fixed size records, a record cut short by a crash is simply not counted
+magic = b'PBJRNL01'
+headerDtype = np.dtype([('magic', 'S8'), ('startTime', '<f8'), ('exercise', 'S40'), ('recordSize', '<u4'),
+                        ('landmarkCount', '<u4')])
+recordDtype = np.dtype([('time', '<f8'), ('frame', '<u4'), ('detected', 'u1'), ('padding', 'u1', 3),
+                        ('landmarks', '<f4', (33, 4))])
+
+class JournalWriter:
+    def __init__(self, path, exerciseKey, flushFrames = 30, flushInterval = 1.0):
+        self.path = path
+        self.exerciseKey = exerciseKey
+        self.flushFrames = flushFrames
+        self.flushInterval = flushInterval
+        self.frameCount = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+
+        header = np.zeros(1, dtype = headerDtype)
+        header[0] = (magic, time.time(), exerciseKey.encode()[:40], recordDtype.itemsize, 33)
+
+        self.file = open(path, 'xb', buffering = 0)
+        self.file.write(header.tobytes())
+        os.fsync(self.file.fileno())
+
+        ## Records are staged in one preallocated block and leave in a single write, so a frame costs one row copy and
+        ## a crash loses at most flushFrames frames or flushInterval seconds
+        self.pending = np.zeros(flushFrames, dtype = recordDtype)
+        self.pendingCount = 0
+        self.startTime = time.perf_counter()
+        self.lastFlush = self.startTime
+
+    def append(self, frameIndex, timestamp, landmarks):
+        i = self.pendingCount
+        self.pending['time'][i] = timestamp - self.startTime
+        self.pending['frame'][i] = frameIndex
+        self.pending['detected'][i] = landmarks is not None
+        self.pending['landmarks'][i] = 0 if landmarks is None else landmarks
+
+        self.pendingCount += 1
+        self.frameCount += 1
+
+        if self.pendingCount == self.flushFrames or timestamp - self.lastFlush >= self.flushInterval:
+            self.flush()
+
+    def flush(self):
+        if self.pendingCount:
+            self.file.write(self.pending[:self.pendingCount].tobytes())
+            self.pendingCount = 0
+
+        self.lastFlush = time.perf_counter()
+
+    def close(self):
+        if self.file.closed:
+            return
+
+        self.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+class SessionJournal:
+    def __init__(self, path):
+        self.path = path
+
+        header = np.fromfile(path, dtype = headerDtype, count = 1)
+        if len(header) != 1 or header[0]['magic'] != magic or header[0]['recordSize'] != recordDtype.itemsize:
+            raise ValueError(f'{path} is not a session journal')
+
+        self.exerciseKey = header[0]['exercise'].decode()
+        self.startTime = float(header[0]['startTime'])
+
+        recordCount = (os.path.getsize(path) - headerDtype.itemsize) // recordDtype.itemsize
+        self.records = np.memmap(path, dtype = recordDtype, mode = 'r', offset = headerDtype.itemsize,
+                                 shape = (recordCount,)) if recordCount else np.zeros(0, dtype = recordDtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def duration(self):
+        return float(self.records['time'][-1]) if len(self.records) else 0.0
+
+    def replay(self, model, repCounter = None, chunkSize = 8192, exerciseKey = None):
+        repCounter = repCounter if repCounter is not None else RepCounter()
+        reps = []
+        modelKey = exerciseKey or self.exerciseKey
+        exerciseKey = None
+        startTime = time.perf_counter()
+
+        for start in range(0, len(self.records), chunkSize):
+            chunk = self.records[start:start + chunkSize]
+            detected = chunk['detected'].astype(bool)
+
+            if not detected.any():
+                continue
+
+            ## Every detected frame of the chunk is classified in one vectorized call, only the rep logic steps. A
+            ## router also says which lift each frame went to, the rep count restarts on a switch as it does live
+            landmarks = chunk['landmarks'][detected].reshape(-1, 33 * 4)
+            if hasattr(model, 'predictRouted'):
+                classes, probabilities, exerciseKeys = model.predictRouted(landmarks)
+            else:
+                classes, probabilities = model.predict_with_proba(landmarks)
+                exerciseKeys = [modelKey] * len(classes)
+            frames, times = chunk['frame'][detected].tolist(), chunk['time'][detected]
+
+            for i, (movementPhaseClass, movementPhaseProbability) in enumerate(zip(classes, probabilities)):
+                if exerciseKeys[i] != exerciseKey:
+                    if exerciseKey is not None:
+                        repCounter.reset()
+                    exerciseKey = exerciseKeys[i]
+
+                repCounter.update(movementPhaseClass, movementPhaseProbability, frames[i])
+
+                if repCounter.completedRep is not None:
+                    rep, repStartFrame, repEndFrame = repCounter.completedRep
+                    reps.append({'rep': rep, 'exercise': exerciseKey, 'startFrame': repStartFrame,
+                                 'endFrame': repEndFrame, 'endTime': float(times[i])})
+
+        elapsed = time.perf_counter() - startTime
+
+        return {
+            'journal': self.path,
+            'exercise': self.exerciseKey,
+            'frames': len(self.records),
+            'detectedFrames': int(self.records['detected'].sum()) if len(self.records) else 0,
+            'sessionSeconds': self.duration(),
+            'elapsedSeconds': elapsed,
+            'speedup': self.duration() / elapsed if elapsed > 0 else 0.0,
+            'repCount': repCounter.repCount,
+            'reps': reps,
+        }
+
+def journalPath(directory, exerciseKey):
+    return os.path.join(directory, f"{exerciseKey}_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}.pbj")
+
+def rescoreArchive(paths, modelRegistry = None, exerciseKey = None):
+    from ExerciseRecognizer import ExerciseRouter
+    from ModelRegistry import ModelRegistry
+
+    modelRegistry = modelRegistry if modelRegistry is not None else ModelRegistry()
+    summaries = []
+
+    for path in paths:
+        journal = SessionJournal(path)
+        key = exerciseKey or journal.exerciseKey
+
+        ## An Auto mode session names no phase model, the router picks the lift again from the same frames, and a
+        ## fresh router per journal keeps one session's lock-on from leaking into the next
+        model = ExerciseRouter.load(modelRegistry) if key == 'auto' else modelRegistry.get(key)
+        summaries.append(journal.replay(model, exerciseKey = key))
+
+    return summaries
+
+def main(argv):
+    def option(name, default):
+        return argv[argv.index(name) + 1] if name in argv else default
+
+    exerciseKey = option('--model', None)
+    positional = [arg for i, arg in enumerate(argv) if not arg.startswith('--') and (i == 0 or argv[i - 1] != '--model')]
+    paths = []
+
+    for target in positional or ['journals']:
+        paths += sorted(glob.glob(os.path.join(target, '*.pbj'))) if os.path.isdir(target) else [target]
+
+    try:
+        summaries = rescoreArchive(paths, exerciseKey = exerciseKey)
+    except (OSError, ValueError) as e:
+        sys.exit(str(e))
+
+    for summary in summaries:
+        ## Auto sessions list the lifts the router picked for their reps
+        routed = sorted({rep['exercise'] for rep in summary['reps']} - {summary['exercise']})
+        exercise = f"{summary['exercise']} ({', '.join(routed)})" if routed else summary['exercise']
+        print(f"{summary['journal']}: {exercise} {summary['frames']} frames, {summary['repCount']} reps, "
+              f"{summary['sessionSeconds']:.1f}s replayed in {summary['elapsedSeconds'] * 1000:.1f}ms "
+              f"({summary['speedup']:.0f}x real time)")
+
+    if '--json' in argv:
+        print(json.dumps(summaries, indent = 1))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
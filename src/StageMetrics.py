@@ -0,0 +1,154 @@
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+class StageMetrics:
+    ## Histogram upper bounds in seconds, shared by every stage so exports line up
+    bucketBounds = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, float('inf'))
+    disabledStage = nullcontext()
+
+    def __init__(self, isEnabled = False, exportPath = 'metrics/powerbuilder', interval = None):
+        self.isEnabled = isEnabled
+        self.exportPath = exportPath
+        self.interval = interval
+        self.startTime = time.perf_counter()
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.stopEvent = threading.Event()
+
+    @classmethod
+    def fromArgs(cls, argv):
+        def option(name, default):
+            return argv[argv.index(name) + 1] if name in argv and argv.index(name) + 1 < len(argv) else default
+
+        interval = option('--metrics-interval', None)
+        return cls('--metrics' in argv, option('--metrics-path', 'metrics/powerbuilder'),
+                   float(interval) if interval is not None else None)
+
+    def stage(self, name):
+        ## Disabled metrics hand back one shared no-op context so instrumented code pays next to nothing
+        if not self.isEnabled:
+            return self.disabledStage
+        return self.timedStage(name)
+
+    @contextmanager
+    def timedStage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name, seconds):
+        if not self.isEnabled:
+            return
+
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = {'buckets': [0] * len(self.bucketBounds), 'count': 0,
+                                                     'sum': 0.0, 'max': 0.0}
+
+            histogram['buckets'][bisect.bisect_left(self.bucketBounds, seconds)] += 1
+            histogram['count'] += 1
+            histogram['sum'] += seconds
+            histogram['max'] = max(histogram['max'], seconds)
+
+    def count(self, name, amount = 1):
+        if not self.isEnabled:
+            return
+
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def quantile(self, buckets, count, q):
+        rank = q * count
+        seen = 0
+
+        for bound, bucketCount in zip(self.bucketBounds, buckets):
+            seen += bucketCount
+            if seen >= rank:
+                return bound
+
+        return self.bucketBounds[-1]
+
+    def snapshot(self):
+        with self.lock:
+            histograms = {name: dict(histogram, buckets = list(histogram['buckets']))
+                          for name, histogram in self.histograms.items()}
+            counters = dict(self.counters)
+
+        stages = {}
+        for name, histogram in sorted(histograms.items()):
+            count = histogram['count']
+            stages[name] = {
+                'count': count,
+                'sumSeconds': histogram['sum'],
+                'meanMs': histogram['sum'] / count * 1000 if count else 0.0,
+                'maxMs': histogram['max'] * 1000,
+                'p50BucketMs': self.quantile(histogram['buckets'], count, 0.5) * 1000,
+                'p95BucketMs': self.quantile(histogram['buckets'], count, 0.95) * 1000,
+                'buckets': {('+Inf' if bound == float('inf') else str(bound)): bucketCount
+                            for bound, bucketCount in zip(self.bucketBounds, histogram['buckets'])},
+            }
+
+        return {'uptimeSeconds': time.perf_counter() - self.startTime, 'stages': stages, 'counters': counters}
+
+    def toPrometheus(self, snapshot):
+        lines = ['# HELP powerbuilder_stage_seconds Time spent in each processing stage.',
+                 '# TYPE powerbuilder_stage_seconds histogram']
+
+        for name, stage in snapshot['stages'].items():
+            cumulative = 0
+            for bound, bucketCount in stage['buckets'].items():
+                cumulative += bucketCount
+                lines.append(f'powerbuilder_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'powerbuilder_stage_seconds_sum{{stage="{name}"}} {stage["sumSeconds"]:.9f}')
+            lines.append(f'powerbuilder_stage_seconds_count{{stage="{name}"}} {stage["count"]}')
+
+        lines += ['# HELP powerbuilder_frames_total Frame events such as dropped or no-pose frames.',
+                  '# TYPE powerbuilder_frames_total counter']
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f'powerbuilder_frames_total{{event="{name}"}} {value}')
+
+        lines += ['# TYPE powerbuilder_uptime_seconds gauge', f'powerbuilder_uptime_seconds {snapshot["uptimeSeconds"]:.3f}']
+        return '\n'.join(lines) + '\n'
+
+    def export(self):
+        if not self.isEnabled:
+            return
+
+        snapshot = self.snapshot()
+        directory = os.path.dirname(self.exportPath)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+
+        for path, text in ((f'{self.exportPath}.json', json.dumps(snapshot, indent = 1)),
+                           (f'{self.exportPath}.prom', self.toPrometheus(snapshot))):
+            with open(f'{path}.tmp', 'w') as f:
+                f.write(text)
+            os.replace(f'{path}.tmp', path)
+
+    def exportLoop(self):
+        while not self.stopEvent.wait(self.interval):
+            self.export()
+
+    def start(self):
+        if not self.isEnabled:
+            return self
+
+        atexit.register(self.stop)
+
+        if self.interval:
+            threading.Thread(target = self.exportLoop, daemon = True).start()
+
+        return self
+
+    def stop(self):
+        self.stopEvent.set()
+        self.export()
@@ -0,0 +1,35 @@
+import threading
+import time
+from contextlib import contextmanager
+
+class StartupTimer:
+    def __init__(self, startTime = None, isReporting = False):
+        self.startTime = startTime if startTime is not None else time.perf_counter()
+        self.isReporting = isReporting
+        self.phases = []
+        self.lock = threading.Lock()
+
+    def record(self, name, start, duration):
+        with self.lock:
+            self.phases.append((name, threading.current_thread().name, start - self.startTime, duration))
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter() - start)
+
+    def mark(self, name):
+        self.record(name, time.perf_counter(), 0.0)
+
+    def report(self):
+        with self.lock:
+            phases = sorted(self.phases, key = lambda phase: phase[2])
+
+        lines = [f"{'phase':<24}{'thread':<14}{'start ms':>10}{'duration ms':>14}"]
+        for name, thread, offset, duration in phases:
+            lines.append(f"{name:<24}{thread:<14}{offset * 1000:>10.1f}{duration * 1000:>14.1f}")
+
+        return '\n'.join(lines)
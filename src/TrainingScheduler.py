@@ -0,0 +1,187 @@
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from ExerciseModelTrainer import ExerciseModelTrainer
+from ModelRegistry import ModelRegistry, exercises, sessionFiles
+
+threadVariables = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS',
+                   'NUMEXPR_NUM_THREADS')
+
+def limitThreads(threads):
+    ## The variables cover libraries loaded after this point, threadpoolctl the ones already loaded
+    for name in threadVariables:
+        os.environ[name] = str(threads)
+
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(threads)
+    except ImportError:
+        pass
+
+def timedCall(function, *args):
+    startTime = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - startTime, result
+
+class ScheduledExecutor:
+    def __init__(self, scheduler, name):
+        self.scheduler = scheduler
+        self.name = name
+
+    def submit(self, function, *args):
+        return self.scheduler.submit(self.name, function, *args)
+
+class TrainingScheduler:
+    def __init__(self, workers = None, threadsPerWorker = 1, exercises = exercises, onProgress = None,
+                 searchCacheDir = None):
+        self.workers = workers or os.cpu_count()
+        self.threadsPerWorker = threadsPerWorker
+        self.exercises = exercises
+        self.searchCacheDir = searchCacheDir
+        self.onProgress = onProgress if onProgress is not None else lambda line: print(line, flush = True)
+
+        self.pool = None
+        self.lock = threading.Lock()
+        self.progress = {}
+        self.startTime = None
+
+    def submit(self, name, function, *args):
+        with self.lock:
+            self.progress[name]['submitted'] += 1
+
+        outer = Future()
+        inner = self.pool.submit(timedCall, function, *args)
+
+        def done(inner):
+            try:
+                elapsed, result = inner.result()
+            except BaseException as e:
+                outer.set_exception(e)
+                return
+
+            with self.lock:
+                progress = self.progress[name]
+                progress['done'] += 1
+                progress['workerSeconds'] += elapsed
+                line = (f"[{time.perf_counter() - self.startTime:7.1f}s] {name}: {progress['done']}/"
+                        f"{progress['submitted']} fits, {progress['workerSeconds']:.1f} worker-s")
+
+            self.onProgress(line)
+            outer.set_result(result)
+
+        inner.add_done_callback(done)
+        return outer
+
+    def trainModel(self, key, featureSet, dataPath = None, isIncremental = False):
+        entry = self.exercises[key]
+        startTime = time.perf_counter()
+
+        trainer = ExerciseModelTrainer(dataPath or entry['data'], entry['model'], featureSet, isIncremental)
+        if self.searchCacheDir is not None:
+            trainer.searchCacheDir = self.searchCacheDir
+        trainer.constructPipeline(executor = ScheduledExecutor(self, key))
+        manifest = trainer.manifest()
+        ModelRegistry(exercises = self.exercises).exportArtifact(key, manifest = manifest)
+
+        with self.lock:
+            progress = dict(self.progress[key])
+
+        result = {'model': key, 'seconds': time.perf_counter() - startTime, 'fits': progress['done'],
+                  'workerSeconds': progress['workerSeconds'], 'precision': manifest['scores']['precision']}
+        self.onProgress(f"[{time.perf_counter() - self.startTime:7.1f}s] {key}: done in {result['seconds']:.1f}s, "
+                        f"precision {result['precision']:.3f}")
+        return result
+
+    def trainAll(self, keys = None, featureSet = 'raw', trainerOptions = None):
+        ## featureSet is one feature set for every model, or a dict giving each model its own; trainerOptions can give a
+        ## model its own dataPath and isIncremental
+        trainerOptions = trainerOptions or {}
+        dataPaths = {key: trainerOptions.get(key, {}).get('dataPath') or self.exercises[key]['data']
+                     for key in (self.exercises if keys is None else keys)}
+
+        ## Bigger datasets go first so their long fits aren't what's left running at the end
+        keys = sorted(dataPaths, key = lambda key: -sum(map(os.path.getsize, sessionFiles(dataPaths[key]))))
+
+        if not keys:
+            return {'workers': self.workers, 'elapsedSeconds': 0.0, 'workerSeconds': 0.0, 'parallelism': 0.0, 'models': []}
+
+        self.progress = {key: {'submitted': 0, 'done': 0, 'workerSeconds': 0.0} for key in keys}
+        self.startTime = time.perf_counter()
+
+        ## Every model's searches share one pool of single threaded workers, so the machine runs exactly workers fits
+        ## at a time however many models are training; spawned workers inherit the capped thread variables
+        savedVariables = {name: os.environ.get(name) for name in threadVariables}
+        os.environ.update({name: str(self.threadsPerWorker) for name in threadVariables})
+
+        try:
+            with ProcessPoolExecutor(self.workers, multiprocessing.get_context('spawn'), limitThreads,
+                                     (self.threadsPerWorker,)) as self.pool, \
+                    ThreadPoolExecutor(len(keys), thread_name_prefix = 'train') as drivers:
+                futures = [drivers.submit(self.trainModel, key, featureSet if isinstance(featureSet, str) else featureSet[key],
+                                          **trainerOptions.get(key, {})) for key in keys]
+                results = [future.result() for future in futures]
+        finally:
+            self.pool = None
+            for name, value in savedVariables.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+        elapsed = time.perf_counter() - self.startTime
+        workerSeconds = sum(result['workerSeconds'] for result in results)
+
+        return {'workers': self.workers, 'elapsedSeconds': elapsed, 'workerSeconds': workerSeconds,
+                'parallelism': workerSeconds / elapsed if elapsed > 0 else 0.0, 'models': results}
+
+def measureSpeedup(keys = None, workers = None, featureSet = 'raw', exercises = exercises, onProgress = None):
+    keys = list(exercises if keys is None else keys)
+
+    ## Both runs train into a scratch copy of the registry with empty search caches, so neither reuses the other's
+    ## fold scores and the shipped models are left alone
+    with tempfile.TemporaryDirectory() as tmpDir:
+        local = {key: dict(exercises[key], model = os.path.join(tmpDir, f'{key}.pkl'),
+                           artifact = os.path.join(tmpDir, f'{key}.npz')) for key in keys}
+
+        ## The baseline is training one model after another, each search spreading its own fits over every core
+        startTime = time.perf_counter()
+        for key in keys:
+            trainer = ExerciseModelTrainer(local[key]['data'], local[key]['model'], featureSet)
+            trainer.searchCacheDir = os.path.join(tmpDir, 'sequential')
+            trainer.constructPipeline()
+        sequentialSeconds = time.perf_counter() - startTime
+
+        scheduler = TrainingScheduler(workers, exercises = local, onProgress = onProgress or (lambda line: None),
+                                      searchCacheDir = os.path.join(tmpDir, 'scheduled'))
+        report = scheduler.trainAll(keys, featureSet)
+
+    return {'models': keys, 'workers': report['workers'], 'sequentialSeconds': sequentialSeconds,
+            'scheduledSeconds': report['elapsedSeconds'],
+            'speedup': sequentialSeconds / report['elapsedSeconds'] if report['elapsedSeconds'] > 0 else 0.0}
+
+def main(argv):
+    def option(name, default):
+        return argv[argv.index(name) + 1] if name in argv else default
+
+    if '--compare' in argv:
+        report = measureSpeedup(workers = int(option('--workers', os.cpu_count())), featureSet = option('--features', 'raw'))
+        print(f"Trained {len(report['models'])} models one after another in {report['sequentialSeconds']:.1f}s and on "
+              f"{report['workers']} shared workers in {report['scheduledSeconds']:.1f}s ({report['speedup']:.2f}x)")
+        return
+
+    scheduler = TrainingScheduler(int(option('--workers', os.cpu_count())), int(option('--threads', 1)))
+    report = scheduler.trainAll(featureSet = option('--features', 'raw'))
+
+    for result in report['models']:
+        print(f"{result['model']:<16}{result['seconds']:>8.1f}s{result['fits']:>6} fits{result['workerSeconds']:>9.1f} "
+              f"worker-s  precision {result['precision']:.3f}")
+    print(f"Trained {len(report['models'])} models in {report['elapsedSeconds']:.1f}s on {report['workers']} workers "
+          f"({report['workerSeconds']:.1f} worker-s, {report['parallelism']:.1f}x parallel)")
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
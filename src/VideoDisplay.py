@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import tkinter as tk
+import tracemalloc
+
+from PIL import Image, ImageTk
+
+class VideoDisplay:
+    def __init__(self, canvas, width, height, fps = 30.0):
+        self.canvas = canvas
+        self.width = width
+        self.height = height
+        self.frameInterval = 1.0 / fps if fps and fps > 0 else 1.0 / 30.0
+
+        ## One Tk photo buffer and one canvas item live for the whole session, frames are pasted into them
+        self.photo = ImageTk.PhotoImage('RGB', (width, height))
+        self.imageItem = None
+        self.lastShown = None
+        self.frameCount = 0
+
+    def show(self, frame):
+        image = Image.fromarray(frame)
+        if image.size != (self.width, self.height):
+            image = image.resize((self.width, self.height))
+
+        self.photo.paste(image)
+
+        if self.imageItem is None or not self.canvas.type(self.imageItem):
+            self.imageItem = self.canvas.create_image(0, 0, image = self.photo, anchor = tk.NW)
+
+        self.lastShown = time.perf_counter()
+        self.frameCount += 1
+
+    def clear(self):
+        if self.imageItem is not None:
+            self.canvas.delete(self.imageItem)
+            self.imageItem = None
+
+    def nextDelay(self, hasShownFrame):
+        ## Sleep until the next camera frame is due, poll a little faster while waiting for a late one
+        if not hasShownFrame or self.lastShown is None:
+            return max(1, int(self.frameInterval * 250))
+
+        remaining = self.frameInterval - (time.perf_counter() - self.lastShown)
+        return max(1, int(remaining * 1000))
+
+def residentMemory():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return tracemalloc.get_traced_memory()[0]
+
+def soak(minutes, fps = 30.0, width = 650, height = 500, maxGrowthMB = 16, sampleSeconds = 10):
+    import numpy as np
+
+    tracemalloc.start()
+
+    root = tk.Tk()
+    canvas = tk.Canvas(root, width = width, height = height)
+    canvas.pack()
+
+    display = VideoDisplay(canvas, width, height, fps)
+    frames = [np.random.default_rng(i).integers(0, 255, (height, width, 3), dtype = np.uint8) for i in range(8)]
+    samples = []
+    endTime = time.perf_counter() + minutes * 60
+
+    def tick():
+        display.show(frames[display.frameCount % len(frames)])
+
+        if display.frameCount == 1 or display.frameCount % max(1, int(fps * sampleSeconds)) == 0:
+            samples.append((display.frameCount, len(canvas.find_all()), residentMemory(),
+                            tracemalloc.get_traced_memory()[0]))
+            print(f"frames={samples[-1][0]} canvasItems={samples[-1][1]} rss={samples[-1][2] / 1e6:.1f}MB "
+                  f"python={samples[-1][3] / 1e6:.1f}MB", flush = True)
+
+        if time.perf_counter() >= endTime:
+            root.quit()
+        else:
+            root.after(display.nextDelay(True), tick)
+
+    root.after(0, tick)
+    root.mainloop()
+    root.destroy()
+
+    ## The first sample is taken after warm-up so one-off allocations don't count as growth
+    baseline, final = samples[min(1, len(samples) - 1)], samples[-1]
+    growth = (final[2] - baseline[2]) / 1e6
+    isFlat = final[1] == 1 and growth <= maxGrowthMB
+
+    print(f"{final[0]} frames, canvas items {final[1]}, RSS growth {growth:.1f}MB: {'PASS' if isFlat else 'FAIL'}")
+    return isFlat
+
+if __name__ == '__main__':
+    minutes = float(sys.argv[sys.argv.index('--soak') + 1]) if '--soak' in sys.argv else 60.0
+    sys.exit(0 if soak(minutes) else 1)
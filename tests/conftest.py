@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, 'src'))
+
+@pytest.fixture(autouse = True)
+def repoRoot(monkeypatch):
+    ## Data, model and cache paths in the registry are relative to the repository root
+    monkeypatch.chdir(root)
+    return root
@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import numpy as np
+
+from AnalysisLoadTest import connect
+from AnalysisServer import AnalysisServer, AnalysisSession
+from ModelRegistry import exercises, readSessions
+
+async def request(reader, writer, method, path, body = b''):
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    length = int(next(line.split(':', 1)[1] for line in head if line.lower().startswith('content-length')))
+    return int(head[0].split(' ')[1]), json.loads(await reader.readexactly(length))
+
+def serve(client):
+    async def run():
+        server = await AnalysisServer('127.0.0.1', 0, idleTimeout = 60).start()
+        try:
+            return await asyncio.wait_for(client(server), 30)
+        finally:
+            await server.stop()
+
+    return asyncio.run(run())
+
+def test_sessions_over_http():
+    async def client(server):
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+        responses = [await request(reader, writer, 'POST', '/sessions', b'{"exercise": '),
+                     await request(reader, writer, 'POST', '/sessions', b'["squat_FV"]'),
+                     await request(reader, writer, 'POST', '/sessions', b'{"exercise": "curl"}'),
+                     await request(reader, writer, 'POST', '/sessions', b'{"exercise": "squat_FV"}')]
+
+        sessionId = responses[-1][1]['session']
+        rows = readSessions(exercises['squat_FV']['data']).drop('label', axis = 1).to_numpy(dtype = np.float32)
+        responses.append(await request(reader, writer, 'POST', f'/sessions/{sessionId}/landmarks', rows.tobytes()))
+        responses.append(await request(reader, writer, 'DELETE', f'/sessions/{sessionId}'))
+        responses.append(await request(reader, writer, 'GET', f'/sessions/{sessionId}'))
+
+        writer.close()
+        return responses, len(rows)
+
+    responses, rowCount = serve(client)
+    statuses = [status for status, _ in responses]
+
+    ## The malformed bodies answer 400 on the same connection, which then carries on serving requests
+    assert statuses == [400, 400, 400, 201, 200, 200, 404]
+    assert 'malformed JSON body' in responses[0][1]['error']
+    assert 'JSON object' in responses[1][1]['error']
+    assert responses[3][1]['exercise'] == 'squat_FV'
+    assert responses[4][1]['frames'] == rowCount
+    assert any(event['type'] == 'phase' for event in responses[4][1]['events'])
+
+def test_websocket_session_streams_events():
+    rows = readSessions(exercises['squat_FV']['data']).drop('label', axis = 1).to_numpy(dtype = np.float32)
+
+    async def client(server):
+        webSocket = await connect('127.0.0.1', server.port, '/ws?exercise=squat_FV')
+        session = json.loads(await webSocket.receive())
+
+        await webSocket.send('{"landmarks": [1, 2')
+        error = json.loads(await webSocket.receive())
+
+        events = []
+        for row in rows:
+            await webSocket.send(bytes([AnalysisSession.landmarkMessage]) + row.tobytes())
+        while not events or events[-1] != {'type': 'ack', 'frame': len(rows)}:
+            event = json.loads(await webSocket.receive())
+            events.append({'type': 'ack', 'frame': event['frame']} if event['type'] == 'ack' else event)
+
+        state = server.sessions[session['session']].state()
+        await webSocket.close()
+        await asyncio.sleep(0.1)
+        return session, error, events, state, dict(server.sessions)
+
+    session, error, events, state, remaining = serve(client)
+
+    assert session['type'] == 'session' and session['exercise'] == 'squat_FV'
+    assert error['type'] == 'error'
+    assert [event['frame'] for event in events if event['type'] == 'ack'] == list(range(1, len(rows) + 1))
+    assert sum(event['type'] == 'rep' for event in events) == state['repCount'] > 0
+    assert state['frames'] == len(rows)
+
+    ## A session the socket opened is closed with it
+    assert session['session'] not in remaining
@@ -0,0 +1,42 @@
+import pytest
+
+from Benchmark import compare, main
+
+def results(**values):
+    return {'results': {name: {'value': value, 'unit': '', 'higherIsBetter': name.endswith('PerSec')}
+                        for name, value in values.items()}}
+
+def regressed(baseline, current, threshold = 0.25):
+    return [name for name, *_ in compare(results(**current), results(**baseline), threshold)]
+
+def test_direction_follows_higher_is_better():
+    baseline = {'rowsPerSec': 1000.0, 'frameMs': 1.0}
+
+    assert regressed(baseline, {'rowsPerSec': 500.0, 'frameMs': 0.5}) == ['rowsPerSec']
+    assert regressed(baseline, {'rowsPerSec': 2000.0, 'frameMs': 2.0}) == ['frameMs']
+
+def test_changes_at_the_threshold_pass():
+    baseline = {'rowsPerSec': 1000.0, 'frameMs': 1.0}
+
+    assert regressed(baseline, {'rowsPerSec': 750.0, 'frameMs': 1.25}) == []
+    assert regressed(baseline, {'rowsPerSec': 749.0, 'frameMs': 1.26}) == ['rowsPerSec', 'frameMs']
+
+def test_zero_baseline():
+    assert regressed({'retainedKB': 0.0, 'rowsPerSec': 0.0}, {'retainedKB': 0.0, 'rowsPerSec': 0.0}) == []
+    assert regressed({'retainedKB': 0.0, 'rowsPerSec': 0.0}, {'retainedKB': 4.0, 'rowsPerSec': 10.0}) == ['retainedKB']
+
+def test_metrics_missing_from_the_baseline_are_skipped():
+    assert regressed({}, {'frameMs': 100.0}) == []
+
+def test_missing_baseline_fails(tmp_path, capsys):
+    argv = ['--suites', 'repCounter', '--quick', '--output', str(tmp_path / 'latest.json')]
+
+    assert main(argv + ['--baseline', str(tmp_path / 'missing.json')]) == 1
+    assert 'No baseline' in capsys.readouterr().out
+
+    assert main(argv + ['--baseline', str(tmp_path / 'baseline.json'), '--save-baseline']) == 0
+    assert main(argv + ['--baseline', str(tmp_path / 'baseline.json'), '--threshold', '10']) == 0
+
+@pytest.mark.parametrize('threshold', [0.0, 0.5])
+def test_unchanged_results_never_regress(threshold):
+    assert regressed({'rowsPerSec': 3.0, 'frameMs': 2.0}, {'rowsPerSec': 3.0, 'frameMs': 2.0}, threshold) == []
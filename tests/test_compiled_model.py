@@ -0,0 +1,28 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from CompiledExerciseModel import CompiledExerciseModel
+from ModelRegistry import exercises, readSessions
+
+@pytest.mark.parametrize('key', list(exercises))
+def test_compiled_model_matches_the_pipeline(key, tmp_path):
+    with open(exercises[key]['model'], 'rb') as f:
+        pipeline = pickle.load(f)
+
+    frame = readSessions(exercises[key]['data']).drop('label', axis = 1)
+    rows = frame.to_numpy(dtype = np.float32)
+
+    model = CompiledExerciseModel.fromPipeline(pipeline)
+    model.save(str(tmp_path / 'model.npz'))
+    loaded = CompiledExerciseModel.loadArtifact(str(tmp_path / 'model.npz'))
+
+    expected = pipeline.predict_proba(frame)
+    for compiled in (model, loaded):
+        classes, proba = compiled.predict_with_proba(rows)
+        assert np.array_equal(classes, pipeline.classes_[expected.argmax(axis = 1)])
+        assert np.allclose(proba, expected, atol = 1e-9)
+
+        singleClass, singleProba = compiled.predict_with_proba(rows[0])
+        assert singleClass == classes[0] and np.array_equal(singleProba, proba[0])
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from ExerciseModelTrainer import ExerciseModelTrainer, splitSessions
+from ModelRegistry import exercises
+
+def writeSession(path, rows):
+    path.parent.mkdir(parents = True, exist_ok = True)
+    pd.DataFrame(rows, columns = ['label', 'x1', 'y1']).to_csv(path, index = False)
+
+def movingSession(rowCount, seed):
+    rng = np.random.default_rng(seed)
+    return [('up' if (i // 5) % 2 == 0 else 'down', *rng.random(2)) for i in range(rowCount)]
+
+def test_chunked_loading_matches_one_chunk(tmp_path):
+    for i in range(4):
+        writeSession(tmp_path / f'session{i}.csv', movingSession(53, i))
+
+    whole = ExerciseModelTrainer(str(tmp_path), str(tmp_path / 'model.pkl'), chunkSize = 100000)
+    chunked = ExerciseModelTrainer(str(tmp_path), str(tmp_path / 'model.pkl'), chunkSize = 7)
+
+    assert len(whole.xTrain) + len(whole.xTest) == 4 * 53
+    pd.testing.assert_frame_equal(chunked.xTrain, whole.xTrain)
+    pd.testing.assert_frame_equal(chunked.xTest, whole.xTest)
+    assert chunked.yTrain.tolist() == whole.yTrain.tolist()
+    assert chunked.yTest.tolist() == whole.yTest.tolist()
+
+def test_held_frames_are_dropped_across_chunks(tmp_path):
+    rows = [('up', 0.1, 0.1), ('up', 0.1, 0.1), ('up', 0.10005, 0.1),
+            ('down', 0.10005, 0.1), ('down', 0.5, 0.5), ('down', 0.5, 0.5), ('down', 0.6, 0.5)]
+    writeSession(tmp_path / 'a.csv', rows)
+    writeSession(tmp_path / 'b.csv', rows)
+
+    for chunkSize in (2, 3, 100):
+        trainer = ExerciseModelTrainer(str(tmp_path), str(tmp_path / 'model.pkl'), chunkSize = chunkSize)
+
+        ## Each session keeps its first frame, the label change and the two real moves
+        assert len(trainer.xTrain) == len(trainer.xTest) == 4
+        assert trainer.yTrain.tolist() == ['up', 'down', 'down', 'down']
+        assert trainer.xTrain['x1'].tolist() == np.float32([0.1, 0.10005, 0.5, 0.6]).tolist()
+
+def test_sessions_split_by_path_under_the_data_root(tmp_path):
+    lifters = [f'lifter{i}' for i in range(20)]
+    sessions = [f'{root}/{lifter}/day1.csv' for root in ('old', 'new') for lifter in lifters]
+
+    old = splitSessions(sessions[:20], 0.5, 'old')
+    new = splitSessions(sessions[20:], 0.5, 'new')
+
+    ## Moving the data root keeps every assignment, and same-named files of different lifters are not tied together
+    assert [path.replace('old/', '', 1) for path in old] == [path.replace('new/', '', 1) for path in new]
+    assert 2 < len(old) < 18
+
+def test_nested_sessions_are_split_whole(tmp_path):
+    for i in range(6):
+        writeSession(tmp_path / f'lifter{i}' / 'day1.csv', movingSession(20, i))
+
+    trainer = ExerciseModelTrainer(str(tmp_path / '*' / '*.csv'), str(tmp_path / 'model.pkl'))
+
+    assert 0 < len(trainer.testSessions) < 6
+    assert len(trainer.xTest) == 20 * len(trainer.testSessions)
+    assert len(trainer.xTrain) == 20 * (6 - len(trainer.testSessions))
+
+def test_students_are_scored_on_every_row(tmp_path):
+    entry = exercises['deadlift_FV']
+    trainer = ExerciseModelTrainer(entry['data'], entry['model'])
+
+    report = trainer.distilStudents(directory = str(tmp_path))
+    students = {student['student']: student for student in report['students']}
+
+    assert report['cvRows'] == len(trainer.xTrain) + len(trainer.xTest) > 3 * len(trainer.xTest)
+    assert students['teacher']['cvPrecisionDrop'] == 0.0
+    assert all(0.0 <= student['cvPrecision'] <= 1.0 for student in students.values())
+    assert set(os.listdir(tmp_path)) == {os.path.basename(student['artifact']) for student in students.values()} | \
+        {'deadlift_FV_updown.json'}
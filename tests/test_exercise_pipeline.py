@@ -0,0 +1,94 @@
+import threading
+import time
+
+import numpy as np
+
+from Benchmark import ReplayPoseEstimator, SyntheticCapture
+from ExercisePipeline import ExercisePipeline, FrameQueue
+from ModelRegistry import exercises
+from StageMetrics import StageMetrics
+
+def test_live_queue_drops_the_oldest_frame():
+    drops = []
+    frameQueue = FrameQueue(2, dropOldest = True, onDrop = drops.append)
+
+    assert all(frameQueue.put(i) for i in range(5))
+    assert frameQueue.droppedCount == 3 and drops == [0, 1, 2]
+    assert [frameQueue.get(), frameQueue.get()] == [3, 4]
+
+def test_recorded_queue_waits_instead_of_dropping():
+    frameQueue = FrameQueue(2, dropOldest = False)
+    frameQueue.put(0)
+    frameQueue.put(1)
+
+    producer = threading.Thread(target = frameQueue.put, args = (2,))
+    producer.start()
+    time.sleep(0.05)
+    assert producer.is_alive() and len(frameQueue) == 2
+
+    assert frameQueue.get() == 0
+    producer.join(1.0)
+    assert [frameQueue.get(), frameQueue.get()] == [1, 2] and frameQueue.droppedCount == 0
+
+def test_closed_queue_drains_then_ends():
+    frameQueue = FrameQueue(2, dropOldest = False)
+    frameQueue.put(0)
+    frameQueue.close()
+
+    assert not frameQueue.put(1)
+    assert frameQueue.get() == 0 and frameQueue.get() is None and frameQueue.isFinished()
+
+def runPipeline(dropOldest, consumeSeconds):
+    pipeline = ExercisePipeline(SyntheticCapture(60, 64, 48), None, ReplayPoseEstimator(exercises['squat_FV']['data']),
+                                dropOldest = dropOldest, metrics = StageMetrics(isEnabled = True))
+    pipeline.start()
+    indices = []
+
+    try:
+        for result in pipeline.results():
+            indices.append(result.index)
+            time.sleep(consumeSeconds)
+    finally:
+        pipeline.stop()
+
+    return indices, pipeline
+
+def test_recorded_pipeline_keeps_every_frame():
+    indices, pipeline = runPipeline(False, 0.002)
+
+    assert indices == list(range(60)) and pipeline.droppedCount() == 0
+
+def test_live_pipeline_drops_frames_for_a_slow_consumer():
+    indices, pipeline = runPipeline(True, 0.01)
+
+    assert indices == sorted(indices) and len(indices) < 60
+    assert pipeline.droppedCount() == pipeline.metrics.counters['dropped'] > 0
+
+class SlowPoseEstimator(ReplayPoseEstimator):
+    def process(self, image):
+        time.sleep(0.005)
+        return super().process(image)
+
+class PacedCapture(SyntheticCapture):
+    def read(self, image = None):
+        time.sleep(0.001)
+        return super().read(image)
+
+def test_live_frames_keep_their_pixels_while_capture_runs_ahead():
+    capture = PacedCapture(300, 64, 48)
+    pipeline = ExercisePipeline(capture, None, SlowPoseEstimator(exercises['squat_FV']['data']), dropOldest = True)
+    pipeline.start()
+    checked = 0
+
+    try:
+        for result in pipeline.results():
+            ## Holding a result while capture decodes dozens of newer frames must not let them land in its image
+            time.sleep(0.03)
+            assert np.array_equal(result.image, capture.frames[result.index % len(capture.frames)])
+            checked += 1
+    finally:
+        pipeline.stop()
+
+    ## Buffers come back to the pool, so it only ever holds about as many frames as are in flight
+    stats = pipeline.bufferPool.stats()
+    assert checked > 5 and stats['inUse'] == 0 and stats['allocations'] < 20
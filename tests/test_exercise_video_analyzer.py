@@ -0,0 +1,92 @@
+import csv
+import io
+import os
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from ExerciseVideoAnalyzer import ExerciseVideoAnalyzer
+from LandmarkCache import LandmarkCache
+from RepCounter import RepCounter
+
+rootDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class FrameIndexPoseEstimator:
+    ## Reads the frame index back out of the pixels, so every worker maps a frame to the same pose wherever it seeks
+    def __init__(self, detectionConfidence = 0.5, trackingConfidence = 0.5, modelComplexity = 1):
+        self.detectionConfidence = detectionConfidence
+        self.trackingConfidence = trackingConfidence
+        self.modelComplexity = modelComplexity
+
+        sessions = pd.read_csv(os.path.join(rootDir, 'data', 'squat_FV.csv'))
+        self.poses = {label: rows.drop('label', axis = 1).to_numpy(dtype = np.float32).reshape(-1, 33, 4)
+                      for label, rows in sessions.groupby('label')}
+
+    def open(self):
+        return self
+
+    def process(self, image):
+        frameIndex = int(image[0, 0, 0])
+
+        if frameIndex % 11 == 5:
+            return None
+
+        poses = self.poses['up' if (frameIndex // 15) % 2 == 0 else 'down']
+        return poses[frameIndex % len(poses)].copy()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *args):
+        self.close()
+
+def writeVideo(path, frameCount):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), 30, (64, 48))
+    for i in range(frameCount):
+        writer.write(np.full((48, 64, 3), i, dtype = np.uint8))
+    writer.release()
+
+def analyzer(tmp_path, video, workers):
+    analyzer = ExerciseVideoAnalyzer('squat_FV', os.path.join(rootDir, 'models', 'squat_FV.npz'), str(video),
+                                     workers = workers, warmupFrames = 5, minSegmentFrames = 60,
+                                     poseEstimatorFactory = FrameIndexPoseEstimator)
+    analyzer.landmarkCache = LandmarkCache(str(tmp_path / f'cache{workers}'))
+    return analyzer
+
+def test_parallel_segments_match_a_sequential_run(tmp_path):
+    video = tmp_path / 'clip.avi'
+    writeVideo(video, 240)
+
+    sequential = analyzer(tmp_path, video, 1).analyze(str(tmp_path / 'sequential'))
+    parallel = analyzer(tmp_path, video, 3).analyze(str(tmp_path / 'parallel'))
+
+    assert parallel['workers'] == 3 and sequential['workers'] == 1
+    assert parallel['frames'] == sequential['frames'] == 240
+    assert sequential['repCount'] > 0
+    assert parallel['repCount'] == sequential['repCount']
+    assert parallel['reps'] == sequential['reps']
+    assert (tmp_path / 'parallel_frames.csv').read_text() == (tmp_path / 'sequential_frames.csv').read_text()
+
+def test_overestimated_frame_count_is_clamped_to_the_frames_read(tmp_path):
+    video = tmp_path / 'clip.avi'
+    writeVideo(video, 240)
+    reps = []
+
+    frameCount = analyzer(tmp_path, video, 3).analyzeSegments(480, 3, RepCounter(), 30.0, csv.writer(io.StringIO()),
+                                                              reps, None)
+
+    assert frameCount == 240
+    assert len(reps) > 0
+
+def test_short_clips_stay_sequential(tmp_path):
+    video = tmp_path / 'clip.avi'
+    writeVideo(video, 100)
+
+    summary = analyzer(tmp_path, video, 4).analyze(str(tmp_path / 'short'))
+
+    assert summary['workers'] == 1
+    assert summary['frames'] == 100
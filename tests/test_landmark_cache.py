@@ -0,0 +1,49 @@
+import cv2
+import numpy as np
+
+from ExercisePipeline import ExercisePipeline
+from LandmarkCache import LandmarkCache
+
+class StubPoseEstimator:
+    detectionConfidence = 0.5
+    trackingConfidence = 0.5
+    modelComplexity = 1
+
+    def process(self, image):
+        return np.full((33, 4), image[0, 0, 0], dtype = np.float32)
+
+    def close(self):
+        pass
+
+def writeVideo(path, frameCount):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), 30, (64, 48))
+    for i in range(frameCount):
+        writer.write(np.full((48, 64, 3), i * 8, dtype = np.uint8))
+    writer.release()
+
+def test_cache_is_kept_after_reading_to_the_end(tmp_path):
+    video = tmp_path / 'clip.avi'
+    writeVideo(video, 12)
+    cache = LandmarkCache(str(tmp_path / 'cache'))
+
+    pipeline = ExercisePipeline(str(video), None, cache.estimator(str(video), StubPoseEstimator()))
+    pipeline.start()
+    frameCount = sum(1 for _ in pipeline.results())
+    pipeline.stop()
+
+    landmarks, detected = cache.load(str(video), StubPoseEstimator())
+    assert frameCount == 12
+    assert len(detected) == 12 and detected.all()
+    assert cache.estimator(str(video), StubPoseEstimator()).isCached()
+
+def test_cache_is_discarded_after_an_early_stop(tmp_path):
+    video = tmp_path / 'clip.avi'
+    writeVideo(video, 60)
+    cache = LandmarkCache(str(tmp_path / 'cache'))
+
+    pipeline = ExercisePipeline(str(video), None, cache.estimator(str(video), StubPoseEstimator()))
+    pipeline.start()
+    next(pipeline.results())
+    pipeline.stop()
+
+    assert cache.load(str(video), StubPoseEstimator()) is None
@@ -0,0 +1,33 @@
+import os
+import shutil
+
+from ModelManifest import build, createManifest, libraries, libraryVersions, staleReasons
+from ModelRegistry import ModelRegistry, exercises
+
+def test_shipped_artifacts_are_up_to_date():
+    report = build(isDryRun = True)
+
+    assert report['stale'] == {}
+    assert report['checkSeconds'] < 1.0
+
+def test_library_versions_ignore_patch_releases():
+    assert list(libraryVersions()) == list(libraries)
+    assert all(version is None or version.count('.') == 1 for version in libraryVersions().values())
+
+def test_changed_data_marks_the_model_stale(tmp_path):
+    entry = exercises['squat_FV']
+    local = {'squat_FV': dict(entry, **{name: str(tmp_path / os.path.basename(entry[name]))
+                                        for name in ('data', 'model', 'artifact')})}
+    for name in ('data', 'model'):
+        shutil.copy(entry[name], local['squat_FV'][name])
+
+    manifest = createManifest(local['squat_FV']['data'], 'raw', {}, {})
+    ModelRegistry(exercises = local).exportArtifact('squat_FV', manifest = manifest)
+
+    assert staleReasons('squat_FV', exercises = local) == []
+    assert staleReasons('squat_FV', 'pose', exercises = local) == ['feature set raw -> pose']
+
+    with open(local['squat_FV']['data'], 'a') as f:
+        f.write(open(entry['data']).read().splitlines()[1] + '\n')
+
+    assert staleReasons('squat_FV', exercises = local) == ['training data changed']
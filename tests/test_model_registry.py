@@ -0,0 +1,53 @@
+import json
+import os
+import shutil
+
+from ModelRegistry import ModelRegistry, exercises, studentPath
+
+def studentRegistry(tmp_path, students, cvRows = 500, **options):
+    entry = exercises['squat_FV']
+    local = {'squat_FV': dict(entry, model = str(tmp_path / 'squat_FV.pkl'), artifact = str(tmp_path / 'squat_FV.npz'))}
+    shutil.copy(entry['model'], local['squat_FV']['model'])
+
+    modelRegistry = ModelRegistry(exercises = local, studentDirectory = str(tmp_path / 'students'), **options)
+    os.makedirs(tmp_path / 'students')
+
+    for student in students:
+        student['artifact'] = studentPath(local['squat_FV']['model'], student['student'], str(tmp_path / 'students'))
+        open(student['artifact'], 'wb').close()
+
+    report = {'teacher': local['squat_FV']['model'], 'source': modelRegistry.sourceHash(local['squat_FV']['model']),
+              'teacherPrecision': 1.0, 'teacherCVPrecision': 0.98, 'cvRows': cvRows, 'students': students}
+    with open(studentPath(local['squat_FV']['model'], directory = str(tmp_path / 'students')), 'w') as f:
+        json.dump(report, f)
+
+    return modelRegistry
+
+def student(name, cvPrecision, frameMs):
+    return {'student': name, 'precision': 1.0, 'cvPrecision': cvPrecision, 'frameMs': frameMs}
+
+def test_fastest_student_within_tolerance_is_chosen(tmp_path):
+    modelRegistry = studentRegistry(tmp_path, [student('teacher', 0.98, 0.15), student('boosted1x50', 0.97, 0.07),
+                                               student('logistic-raw', 0.90, 0.03)])
+
+    ## The holdout precision ties at 1.0 for all of them, only the cross-validated one rules logistic-raw out
+    assert modelRegistry.selectStudent('squat_FV', 0.02)['student'] == 'boosted1x50'
+    assert modelRegistry.selectStudent('squat_FV', 0.1)['student'] == 'logistic-raw'
+    assert modelRegistry.selectStudent('squat_FV', 0.0)['student'] == 'teacher'
+
+def test_teacher_is_used_when_no_student_qualifies(tmp_path):
+    modelRegistry = studentRegistry(tmp_path, [student('boosted1x50', 0.95, 0.07), student('logistic-raw', 0.90, 0.03)],
+                                    precisionTolerance = 0.02)
+
+    assert modelRegistry.selectStudent('squat_FV') is None
+    assert modelRegistry.resolve('squat_FV') == str(tmp_path / 'squat_FV.npz')
+    assert os.path.exists(tmp_path / 'squat_FV.npz')
+
+def test_students_scored_on_too_few_rows_are_not_trusted(tmp_path):
+    modelRegistry = studentRegistry(tmp_path, [student('logistic-raw', 0.98, 0.03)], cvRows = 54,
+                                    precisionTolerance = 0.02)
+
+    assert modelRegistry.selectStudent('squat_FV') is None
+
+    modelRegistry.minStudentRows = 50
+    assert modelRegistry.selectStudent('squat_FV')['student'] == 'logistic-raw'
@@ -0,0 +1,61 @@
+import numpy as np
+
+from ModelSearch import ModelSearch
+
+grid = {'gradientboostingclassifier__n_estimators': [5, 20],
+        'gradientboostingclassifier__learning_rate': [0.001, 0.5],
+        'gradientboostingclassifier__max_depth': [1, 3]}
+
+def dataset(rowCount = 120, seed = 0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size = (rowCount, 4))
+    y = np.where(x[:, 0] + 0.5 * x[:, 1] + rng.normal(0, 0.5, rowCount) > 0, 'up', 'down')
+    return x, y
+
+def search(cacheDir, **options):
+    return ModelSearch(grid, cv = 4, minFolds = 1, halvingFactor = 2, nJobs = 1, cacheDir = str(cacheDir), **options)
+
+def test_cached_search_runs_no_refits(tmp_path):
+    x, y = dataset()
+
+    first = search(tmp_path).fit(x, y)
+    second = search(tmp_path).fit(x, y)
+
+    assert first.fitCount > 0
+    assert second.fitCount == 0
+    assert second.bestParams == first.bestParams
+    assert second.bestScore == first.bestScore
+
+def test_extended_grid_fits_only_the_new_candidates(tmp_path):
+    x, y = dataset()
+    ModelSearch(grid, cv = 4, minFolds = 4, nJobs = 1, cacheDir = str(tmp_path)).fit(x, y)
+
+    extended = ModelSearch(dict(grid, gradientboostingclassifier__max_depth = [1, 3, 2]), cv = 4, minFolds = 4,
+                           nJobs = 1, cacheDir = str(tmp_path)).fit(x, y)
+
+    ## Both n_estimators share one staged fit, so the new depth costs one fit per learning rate and fold
+    assert extended.fitCount == 2 * 4
+
+def test_halving_drops_the_worst_candidates_at_each_rung(tmp_path):
+    x, y = dataset()
+    modelSearch = search(tmp_path)
+    rungs = []
+
+    scoreCandidates = modelSearch.scoreCandidates
+    def recordRung(candidates, nFolds):
+        rungs.append((list(candidates), nFolds))
+        return scoreCandidates(candidates, nFolds)
+    modelSearch.scoreCandidates = recordRung
+
+    modelSearch.fit(x, y)
+
+    ## 8 candidates on 1 fold, the best 4 on 2 folds, the best 2 on all 4
+    assert [(len(candidates), nFolds) for candidates, nFolds in rungs] == [(8, 1), (4, 2), (2, 4)]
+
+    for (candidates, nFolds), (survivors, _) in zip(rungs, rungs[1:]):
+        dropped = [candidate for candidate in candidates if candidate not in survivors]
+        assert min(modelSearch.rank(candidate, nFolds) for candidate in survivors) >= \
+            max(modelSearch.rank(candidate, nFolds) for candidate in dropped)
+
+    assert modelSearch.bestParams in rungs[-1][0]
+    assert modelSearch.bestParams['gradientboostingclassifier__learning_rate'] == 0.5
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from CompiledExerciseModel import CompiledExerciseModel
+from ExerciseRecognizer import ExerciseRouter, recognizerArtifact
+from ModelRegistry import ModelRegistry, exercises, readSessions
+from MotionGate import MotionGate, compareGating
+
+def sessionLandmarks(key):
+    return readSessions(exercises[key]['data']).drop('label', axis = 1).to_numpy(dtype = np.float32)
+
+def heldFrames(key):
+    ## Each frame held for three frames with sensor-sized jitter, the way a still lifter looks to the pose estimator
+    rows = np.repeat(sessionLandmarks(key), 3, axis = 0)
+    return rows + np.random.default_rng(0).normal(0, 1e-4, rows.shape).astype(np.float32)
+
+@pytest.mark.parametrize('key', list(exercises))
+def test_gate_keeps_rep_counts(key):
+    report = compareGating(ModelRegistry().get(key), sessionLandmarks(key))
+
+    assert report['gatedRepCount'] == report['repCount']
+    assert report['phaseMismatches'] == 0
+
+@pytest.mark.parametrize('key', list(exercises))
+def test_gate_reuses_only_identical_results(key):
+    model = ModelRegistry().get(key)
+    gate = MotionGate(model)
+
+    for row in heldFrames(key):
+        gatedClass, gatedProba = gate.predict_with_proba(row)
+        modelClass, modelProba = model.predict_with_proba(row)
+        assert gatedClass == modelClass
+        np.testing.assert_array_equal(gatedProba, modelProba)
+
+    assert gate.savedFraction() > 0
+
+def test_router_gates_each_exercise_model():
+    modelRegistry = ModelRegistry()
+    router = ExerciseRouter.load(modelRegistry)
+    gated = ExerciseRouter.load(modelRegistry, isGated = True)
+    rows = np.concatenate([heldFrames(key) for key in exercises])
+
+    for row in rows:
+        gatedClass, gatedProba = gated.predict_with_proba(row)
+        routerClass, routerProba = router.predict_with_proba(row)
+        assert gated.exerciseKey == router.exerciseKey
+        assert gatedClass == routerClass
+        np.testing.assert_array_equal(gatedProba, routerProba)
+
+    assert len({key for key, gate in gated.gates.items() if gate.reusedCount > 0}) > 1
+    assert gated.savedFraction() > 0 and router.savedFraction() == 0
+
+def test_linear_models_bypass_the_gate():
+    ## A linear model has no thresholds to stay between, so every frame goes to the model and nothing is reused
+    model = CompiledExerciseModel.loadArtifact(recognizerArtifact)
+    gate = MotionGate(model)
+
+    for row in heldFrames('squat_FV')[:30]:
+        gatedClass, gatedProba = gate.predict_with_proba(row)
+        modelClass, modelProba = model.predict_with_proba(row)
+        assert gatedClass == modelClass
+        np.testing.assert_array_equal(gatedProba, modelProba)
+
+    assert gate.splits is None
+    assert gate.savedFraction() == 0
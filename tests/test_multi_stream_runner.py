@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+
+from Benchmark import ReplayPoseEstimator, SyntheticCapture
+from ModelRegistry import exercises
+from MultiStreamRunner import MultiStreamRunner
+
+class FailingCapture(SyntheticCapture):
+    def read(self, image = None):
+        if self.frameIndex == 20:
+            raise OSError('camera unplugged')
+        return super().read(image)
+
+def streamRunner(streams, **options):
+    ## Every stream replays its own exercise's recorded landmarks in place of MediaPipe
+    return MultiStreamRunner(streams, poseEstimatorFactory = lambda stream: ReplayPoseEstimator(
+        exercises[stream.exerciseKey]['data'], noPoseEvery = 11), **options)
+
+def runWithin(runner, seconds = 10.0):
+    outcome = {}
+
+    def target():
+        try:
+            outcome['report'] = runner.run()
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target = target, daemon = True)
+    thread.start()
+    thread.join(seconds)
+    assert not thread.is_alive(), 'run() did not shut down'
+    return outcome
+
+def test_streams_count_reps_as_if_run_alone():
+    streams = [('squat', SyntheticCapture(240, 64, 48), 'squat_FV'),
+               ('bench', SyntheticCapture(180, 64, 48, seed = 1), 'benchpress_FV')]
+    together = runWithin(streamRunner(streams, maxBatch = 8))['report']['streams']
+
+    for name, frameCount, key in (('squat', 240, 'squat_FV'), ('bench', 180, 'benchpress_FV')):
+        alone = runWithin(streamRunner([(name, SyntheticCapture(frameCount, 64, 48), key)]))['report']['streams'][name]
+
+        assert together[name]['frames'] == alone['frames'] == frameCount
+        assert together[name]['noPoseFrames'] == alone['noPoseFrames']
+        assert together[name]['repCount'] == alone['repCount'] > 0
+
+def test_a_failing_stream_stops_the_run_and_is_raised():
+    streams = [('good', SyntheticCapture(100000, 64, 48), 'squat_FV'),
+               ('broken', FailingCapture(1000, 64, 48), 'benchpress_FV')]
+    outcome = runWithin(streamRunner(streams))
+
+    with pytest.raises(RuntimeError, match = 'broken'):
+        raise outcome['error']
+    assert isinstance(outcome['error'].__cause__, OSError)
@@ -0,0 +1,26 @@
+import numpy as np
+
+from ModelRegistry import exercises, readSessions
+from PoseFeatures import PoseFeatures
+
+def test_single_frames_match_the_batch():
+    rows = readSessions(exercises['squat_FV']['data']).drop('label', axis = 1).to_numpy(dtype = np.float32)[:200]
+    batch = PoseFeatures.transform(rows)
+
+    assert batch.shape == (len(rows), len(PoseFeatures.featureNames))
+    assert np.array_equal(np.concatenate([PoseFeatures.transform(row) for row in rows]), batch)
+
+def test_known_pose():
+    frame = np.zeros((33, 4), dtype = np.float32)
+    frame[[11, 12], :2] = [[0.4, 0.2], [0.6, 0.2]]
+    frame[[23, 24], :2] = [[0.4, 0.5], [0.6, 0.5]]
+    frame[[25, 26], :2] = [[0.4, 0.7], [0.6, 0.7]]
+    frame[[27, 28], :2] = [[0.2, 0.7], [0.8, 0.7]]
+
+    features = dict(zip(PoseFeatures.featureNames, PoseFeatures.transform(frame)[0]))
+
+    assert np.isclose(features['leftKneeAngle'], 90.0, atol = 1e-3)
+    assert np.isclose(features['leftHipAngle'], 180.0, atol = 0.5)
+    assert np.isclose(features['torsoLean'], 0.0, atol = 1e-3)
+    assert np.isclose(features['hipHeight'], (0.7 - 0.5) / 0.3, atol = 1e-4)
+    assert np.isclose(features['stanceRatio'], 0.6 / 0.2, atol = 1e-3)
@@ -0,0 +1,76 @@
+import numpy as np
+
+from ExerciseRecognizer import ExerciseRouter
+from ModelRegistry import ModelRegistry, exercises, readSessions
+from RepCounter import RepCounter
+from SessionJournal import JournalWriter, SessionJournal, rescoreArchive
+
+def sessionLandmarks(key, count = 600):
+    rows = readSessions(exercises[key]['data']).drop('label', axis = 1).to_numpy(dtype = np.float32)
+    return rows[:count].reshape(-1, 33, 4)
+
+def writeJournal(path, exerciseKey, landmarks, missEvery = 7):
+    writer = JournalWriter(str(path), exerciseKey)
+    for i, frame in enumerate(landmarks):
+        writer.append(i, writer.startTime + i / 30.0, None if i % missEvery == 0 else frame)
+    writer.close()
+
+def test_journal_round_trip(tmp_path):
+    landmarks = sessionLandmarks('squat_FV')
+    writeJournal(tmp_path / 'session.pbj', 'squat_FV', landmarks)
+
+    ## A record cut short by a crash is not counted
+    with open(tmp_path / 'session.pbj', 'ab') as f:
+        f.write(b'\x00' * 100)
+
+    journal = SessionJournal(str(tmp_path / 'session.pbj'))
+    detected = np.arange(len(landmarks)) % 7 != 0
+
+    assert journal.exerciseKey == 'squat_FV' and len(journal) == len(landmarks)
+    assert np.array_equal(journal.records['frame'], np.arange(len(landmarks)))
+    assert np.array_equal(journal.records['detected'].astype(bool), detected)
+    assert np.array_equal(journal.records['landmarks'][detected], landmarks[detected])
+    assert np.isclose(journal.duration(), (len(landmarks) - 1) / 30.0)
+
+def test_replay_matches_live_scoring(tmp_path):
+    landmarks = sessionLandmarks('squat_FV')
+    writeJournal(tmp_path / 'session.pbj', 'squat_FV', landmarks)
+    model = ModelRegistry().get('squat_FV')
+
+    repCounter = RepCounter()
+    for i, frame in enumerate(landmarks):
+        if i % 7:
+            repCounter.update(*model.predict_with_proba(frame), i)
+
+    summary = SessionJournal(str(tmp_path / 'session.pbj')).replay(model)
+
+    assert summary['detectedFrames'] == int((np.arange(len(landmarks)) % 7 != 0).sum())
+    assert summary['repCount'] == repCounter.repCount
+
+def test_auto_journal_replays_through_the_router(tmp_path):
+    landmarks = np.concatenate((sessionLandmarks('squat_FV'), sessionLandmarks('benchpress_FV')))
+    writeJournal(tmp_path / 'session.pbj', 'auto', landmarks)
+
+    ## Live, the pipeline feeds the router one frame at a time and restarts the rep count when the lift changes
+    router = ExerciseRouter.load()
+    repCounter, exerciseKey, reps = RepCounter(), None, []
+    for i, frame in enumerate(landmarks):
+        if i % 7:
+            movementPhaseClass, movementPhaseProbability = router.predict_with_proba(frame)
+            if router.exerciseKey != exerciseKey:
+                if exerciseKey is not None:
+                    repCounter.reset()
+                exerciseKey = router.exerciseKey
+            repCounter.update(movementPhaseClass, movementPhaseProbability, i)
+            if repCounter.completedRep is not None:
+                reps.append((exerciseKey, repCounter.completedRep[1], repCounter.completedRep[2]))
+
+    summary = rescoreArchive([str(tmp_path / 'session.pbj')])[0]
+
+    assert summary['exercise'] == 'auto' and summary['repCount'] == repCounter.repCount
+    assert [(rep['exercise'], rep['startFrame'], rep['endFrame']) for rep in summary['reps']] == reps
+    assert {rep['exercise'] for rep in summary['reps']} == {'squat_FV', 'benchpress_FV'}
+
+    ## An explicit model still overrides the router
+    assert {rep['exercise'] for rep in rescoreArchive([str(tmp_path / 'session.pbj')], exerciseKey = 'squat_FV')[0]
+            ['reps']} == {'squat_FV'}
@@ -0,0 +1,35 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from ModelRegistry import exercises
+from TrainingScheduler import TrainingScheduler, measureSpeedup
+
+def test_no_models_returns_an_empty_report():
+    report = TrainingScheduler(2).trainAll([])
+
+    assert report['models'] == []
+    assert report['elapsedSeconds'] == 0.0
+
+def test_speedup_is_measured_against_sequential_training(tmp_path, monkeypatch):
+    monkeypatch.setattr('ExerciseModelTrainer.parameterGrid', {'gradientboostingclassifier__n_estimators': [5, 10],
+                                                               'gradientboostingclassifier__max_depth': [2]})
+    rng = np.random.default_rng(0)
+    local = {}
+
+    for key in ('a', 'b'):
+        x = rng.random((60, 4))
+        pd.DataFrame(x, columns = ['x1', 'y1', 'z1', 'v1']).assign(label = np.where(x[:, 0] > 0.5, 'up', 'down')) \
+            .to_csv(tmp_path / f'{key}.csv', index = False)
+        local[key] = {'data': str(tmp_path / f'{key}.csv'), 'model': str(tmp_path / f'{key}.pkl'),
+                      'artifact': str(tmp_path / f'{key}.npz')}
+
+    shipped = {key: os.path.getmtime(entry['model']) for key, entry in exercises.items()}
+    report = measureSpeedup(workers = 2, exercises = local)
+
+    assert report['models'] == ['a', 'b']
+    assert report['sequentialSeconds'] > 0 and report['scheduledSeconds'] > 0
+    assert report['speedup'] == report['sequentialSeconds'] / report['scheduledSeconds']
+    assert not any(os.path.exists(entry['model']) for entry in local.values())
+    assert {key: os.path.getmtime(entry['model']) for key, entry in exercises.items()} == shipped
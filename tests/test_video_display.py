@@ -0,0 +1,18 @@
+import pytest
+
+tk = pytest.importorskip('tkinter')
+pytest.importorskip('PIL.ImageTk')
+
+from VideoDisplay import soak
+
+@pytest.fixture
+def display():
+    ## Headless machines have no display for Tk, the soak only means something on a real window
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        pytest.skip(f'no display available: {e}')
+    root.destroy()
+
+def test_soak_keeps_one_canvas_item_and_flat_memory(display):
+    assert soak(0.1, fps = 60.0, sampleSeconds = 1)